@@ -1,20 +1,40 @@
+import gc
 import sys
+from typing import Iterable
 
 from .lox import Lox
-from .scanner import Scanner
-from .parser import Parser
+from .frontend import compile_source
+from .source import read_source
 from .interpreter import Interpreter
-from .resolver import Resolver
+from .closure_compiler import ClosureCompiler
+from .transpiler import Transpiler
+from .vm import VM
+from . import batch
+
+ENGINES = {
+    "tree": Interpreter,
+    "closure": ClosureCompiler,
+    "py": Transpiler,
+    "vm": VM,
+}
 
 def run_file(path: str):
-    raw = open(path, "r").read()
-    run(raw)
+    raw = read_source(path)
+    if emit_py != None:
+        emit_file(raw, emit_py)
+    else:
+        run(raw, path)
     if Lox.had_error:
         sys.exit(65)
     if Lox.had_runtime_error:
         sys.exit(70)
 
 def run_prompt():
+    # purity is decided for a whole program; a later line could redeclare
+    #   anything a memoized function relies on
+    Lox.memoize = False
+    Lox.interpreter.output.line_buffered = True
+
     def get_line():
         try:
             line = input("> ")
@@ -33,34 +53,88 @@ def run_prompt():
         run(line)
         Lox.had_error = False
 
-def run(source: str):
-    scanner = Scanner(source)
-    tokens = scanner._scan_tokens()
-
-    try:
-        parser = Parser(tokens)
-        statements = parser.parse()
-    except Parser.ParseError as pe:
-        Lox.error(pe.token, pe.message)
-
-    if Lox.had_error:
+def emit_file(source: str|Iterable[str], out_path: str):
+    Lox.interpreter = Transpiler()
+    statements = compile_source(source)
+    if statements == None:
         return
+    py_source = Lox.interpreter.emit(statements)
+    if out_path == "":
+        sys.stdout.write(py_source)
+    else:
+        with open(out_path, "w") as out_file:
+            out_file.write(py_source)
 
-    resolver = Resolver(Lox.interpreter)
-    resolver.resolve(statements)
-
-    if Lox.had_error:
+def run(source: str|Iterable[str], path: str|None = None):
+    statements = compile_source(source, path)
+    if statements == None:
         return
-
+    if path != None:
+        # a script's program lives as long as the process does, so it's
+        #   moved out of the way of the collector's full collections
+        gc.freeze()
     Lox.interpreter.interpret(statements)
 
 
-args = sys.argv[1:]
-Lox.interpreter = Interpreter()
-if len(args) > 1:
-    print("Usage: plox [script]")
+def usage():
+    print(f"Usage: plox [--engine={'|'.join(ENGINES)}] [--emit-py[=out.py]] [--disassemble] [--max-depth=N] [--memoize] [--cache[=dir]] [script | --batch [--jobs=N] scripts...]")
+    print("  --cache=dir is only used if dir is private (owned by you, mode 0700); it's created that way if missing")
     sys.exit(64)
-elif len(args) == 1:
-    run_file(args[0])
+
+args = []
+engine = "tree"
+emit_py = None
+disassemble = False
+batch_mode = False
+jobs = None
+for arg in sys.argv[1:]:
+    if arg.startswith("--engine="):
+        engine = arg.split("=", 1)[1]
+        if engine not in ENGINES:
+            usage()
+    elif arg == "--emit-py" or arg.startswith("--emit-py="):
+        emit_py = arg[len("--emit-py="):]
+    elif arg == "--disassemble":
+        disassemble = True
+    elif arg.startswith("--max-depth="):
+        depth = arg.split("=", 1)[1]
+        if not depth.isdigit() or int(depth) == 0:
+            usage()
+        Lox.max_depth = int(depth)
+    elif arg == "--memoize":
+        Lox.memoize = True
+    elif arg == "--cache" or arg.startswith("--cache="):
+        Lox.cache = arg[len("--cache="):]
+    elif arg == "--batch":
+        batch_mode = True
+    elif arg.startswith("--jobs="):
+        count = arg.split("=", 1)[1]
+        if not count.isdigit() or int(count) == 0:
+            usage()
+        jobs = int(count)
+    elif arg.startswith("--"):
+        usage()
+    else:
+        args.append(arg)
+
+if batch_mode:
+    if emit_py != None or disassemble or len(args) == 0:
+        usage()
+    # worker processes that import this module afresh (the "spawn" start
+    #   method) have to leave the running to the parent
+    if __name__ == "__main__":
+        sys.exit(batch.main(args, ENGINES[engine], jobs))
 else:
-    run_prompt()
+    if jobs != None:
+        usage()
+    Lox.interpreter = ENGINES[engine]()
+    if disassemble:
+        if engine != "vm":
+            usage()
+        Lox.interpreter.disassemble = True
+    if len(args) > 1 or (emit_py != None and len(args) == 0):
+        usage()
+    elif len(args) == 1:
+        run_file(args[0])
+    else:
+        run_prompt()
@@ -6,6 +6,9 @@ import abc
 from ..token import Token
 
 class Expr:
+    __slots__ = ()
+    kind: int
+
     @abc.abstractmethod
     def accept(self, visitor: Expr):
         pass
@@ -55,29 +58,44 @@ class ExprVisitor(abc.ABC):
     def visit_unary_expr(self, expr: Unary):
         pass
 
+    @abc.abstractmethod
+    def visit_update_expr(self, expr: Update):
+        pass
+
     @abc.abstractmethod
     def visit_variable_expr(self, expr: Variable):
         pass
 
 
 class Assign(Expr):
+    __slots__ = ('name', 'value', 'location')
+    kind = 0
+
     def __init__(self, name: Token, value: Expr):
         self.name: Token = name
         self.value: Expr = value
+        self.location: object = None
 
     def accept(self, visitor: Expr.Visitor):
         return visitor.visit_assign_expr(self)
 
 class Binary(Expr):
+    __slots__ = ('left', 'operator', 'right', 'feedback')
+    kind = 1
+
     def __init__(self, left: Expr, operator: Token, right: Expr):
         self.left: Expr = left
         self.operator: Token = operator
         self.right: Expr = right
+        self.feedback: object = None
 
     def accept(self, visitor: Expr.Visitor):
         return visitor.visit_binary_expr(self)
 
 class Call(Expr):
+    __slots__ = ('callee', 'paren', 'arguments')
+    kind = 2
+
     def __init__(self, callee: Expr, paren: Token, arguments: list[Expr]):
         self.callee: Expr = callee
         self.paren: Token = paren
@@ -87,14 +105,21 @@ class Call(Expr):
         return visitor.visit_call_expr(self)
 
 class Get(Expr):
+    __slots__ = ('obj', 'name', 'cache')
+    kind = 3
+
     def __init__(self, obj: Expr, name: Token):
         self.obj: Expr = obj
         self.name: Token = name
+        self.cache: object = None
 
     def accept(self, visitor: Expr.Visitor):
         return visitor.visit_get_expr(self)
 
 class Grouping(Expr):
+    __slots__ = ('expression',)
+    kind = 4
+
     def __init__(self, expression: Expr):
         self.expression: Expr = expression
 
@@ -102,6 +127,9 @@ class Grouping(Expr):
         return visitor.visit_grouping_expr(self)
 
 class Literal(Expr):
+    __slots__ = ('value',)
+    kind = 5
+
     def __init__(self, value):
         self.value = value
 
@@ -109,6 +137,9 @@ class Literal(Expr):
         return visitor.visit_literal_expr(self)
 
 class Logical(Expr):
+    __slots__ = ('left', 'operator', 'right')
+    kind = 6
+
     def __init__(self, left: Expr, operator: Token, right: Expr):
         self.left: Expr = left
         self.operator: Token = operator
@@ -118,30 +149,46 @@ class Logical(Expr):
         return visitor.visit_logical_expr(self)
 
 class Set(Expr):
+    __slots__ = ('obj', 'name', 'value', 'cache')
+    kind = 7
+
     def __init__(self, obj: Expr, name: Token, value: Expr):
         self.obj: Expr = obj
         self.name: Token = name
         self.value: Expr = value
+        self.cache: object = None
 
     def accept(self, visitor: Expr.Visitor):
         return visitor.visit_set_expr(self)
 
 class Super(Expr):
+    __slots__ = ('keyword', 'method', 'location', 'this')
+    kind = 8
+
     def __init__(self, keyword: Token, method: Token):
         self.keyword: Token = keyword
         self.method: Token = method
+        self.location: object = None
+        self.this: This = None
 
     def accept(self, visitor: Expr.Visitor):
         return visitor.visit_super_expr(self)
 
 class This(Expr):
+    __slots__ = ('keyword', 'location')
+    kind = 9
+
     def __init__(self, keyword: Token):
         self.keyword: Token = keyword
+        self.location: object = None
 
     def accept(self, visitor: Expr.Visitor):
         return visitor.visit_this_expr(self)
 
 class Unary(Expr):
+    __slots__ = ('operator', 'right')
+    kind = 10
+
     def __init__(self, operator: Token, right: Expr):
         self.operator: Token = operator
         self.right: Expr = right
@@ -149,9 +196,27 @@ class Unary(Expr):
     def accept(self, visitor: Expr.Visitor):
         return visitor.visit_unary_expr(self)
 
+class Update(Expr):
+    __slots__ = ('target', 'variable', 'operator', 'value')
+    kind = 11
+
+    def __init__(self, target: Assign, variable: Variable, operator: Token, value: Expr):
+        self.target: Assign = target
+        self.variable: Variable = variable
+        self.operator: Token = operator
+        self.value: Expr = value
+
+    def accept(self, visitor: Expr.Visitor):
+        return visitor.visit_update_expr(self)
+
 class Variable(Expr):
+    __slots__ = ('name', 'location', 'declaration')
+    kind = 12
+
     def __init__(self, name: Token):
         self.name: Token = name
+        self.location: object = None
+        self.declaration: object = None
 
     def accept(self, visitor: Expr.Visitor):
         return visitor.visit_variable_expr(self)
@@ -4,9 +4,12 @@ from __future__ import annotations
 import abc
 
 from ..token import Token
-from .expr import Expr, Variable
+from .expr import Expr, Variable, Literal
 
 class Stmt:
+    __slots__ = ()
+    kind: int
+
     @abc.abstractmethod
     def accept(self, visitor: Stmt):
         pass
@@ -32,6 +35,10 @@ class StmtVisitor(abc.ABC):
     def visit_if_stmt(self, stmt: If):
         pass
 
+    @abc.abstractmethod
+    def visit_loop_stmt(self, stmt: Loop):
+        pass
+
     @abc.abstractmethod
     def visit_return_stmt(self, stmt: Return):
         pass
@@ -50,6 +57,9 @@ class StmtVisitor(abc.ABC):
 
 
 class Block(Stmt):
+    __slots__ = ('statements',)
+    kind = 0
+
     def __init__(self, statements: list[Expr]):
         self.statements: list[Expr] = statements
 
@@ -57,15 +67,22 @@ class Block(Stmt):
         return visitor.visit_block_stmt(self)
 
 class Class(Stmt):
+    __slots__ = ('name', 'superclass', 'methods', 'declaration')
+    kind = 1
+
     def __init__(self, name: Token, superclass: Variable, methods: list[Function]):
         self.name: Token = name
         self.superclass: Variable = superclass
         self.methods: list[Function] = methods
+        self.declaration: object = None
 
     def accept(self, visitor: Stmt.Visitor):
         return visitor.visit_class_stmt(self)
 
 class Expression(Stmt):
+    __slots__ = ('expression',)
+    kind = 2
+
     def __init__(self, expression: Expr):
         self.expression: Expr = expression
 
@@ -73,15 +90,24 @@ class Expression(Stmt):
         return visitor.visit_expression_stmt(self)
 
 class Function(Stmt):
+    __slots__ = ('name', 'params', 'body', 'pure', 'declaration', 'layout')
+    kind = 3
+
     def __init__(self, name: Token, params: list[Token], body: list[Stmt]):
         self.name: Token = name
         self.params: list[Token] = params
         self.body: list[Stmt] = body
+        self.pure: bool = None
+        self.declaration: object = None
+        self.layout: object = None
 
     def accept(self, visitor: Stmt.Visitor):
         return visitor.visit_function_stmt(self)
 
 class If(Stmt):
+    __slots__ = ('condition', 'then_branch', 'else_branch')
+    kind = 4
+
     def __init__(self, condition: Expr, then_branch: Stmt, else_branch: Stmt):
         self.condition: Expr = condition
         self.then_branch: Stmt = then_branch
@@ -90,7 +116,24 @@ class If(Stmt):
     def accept(self, visitor: Stmt.Visitor):
         return visitor.visit_if_stmt(self)
 
+class Loop(Stmt):
+    __slots__ = ('variable', 'operator', 'limit', 'body', 'original', '__weakref__')
+    kind = 5
+
+    def __init__(self, variable: Variable, operator: Token, limit: Literal, body: Stmt, original: While):
+        self.variable: Variable = variable
+        self.operator: Token = operator
+        self.limit: Literal = limit
+        self.body: Stmt = body
+        self.original: While = original
+
+    def accept(self, visitor: Stmt.Visitor):
+        return visitor.visit_loop_stmt(self)
+
 class Return(Stmt):
+    __slots__ = ('keyword', 'value')
+    kind = 6
+
     def __init__(self, keyword: Token, value: Expr):
         self.keyword: Token = keyword
         self.value: Expr = value
@@ -99,6 +142,9 @@ class Return(Stmt):
         return visitor.visit_return_stmt(self)
 
 class Print(Stmt):
+    __slots__ = ('expression',)
+    kind = 7
+
     def __init__(self, expression: Expr):
         self.expression: Expr = expression
 
@@ -106,14 +152,21 @@ class Print(Stmt):
         return visitor.visit_print_stmt(self)
 
 class Var(Stmt):
+    __slots__ = ('name', 'initializer', 'declaration')
+    kind = 8
+
     def __init__(self, name: Token, initializer: Expr):
         self.name: Token = name
         self.initializer: Expr = initializer
+        self.declaration: object = None
 
     def accept(self, visitor: Stmt.Visitor):
         return visitor.visit_var_stmt(self)
 
 class While(Stmt):
+    __slots__ = ('condition', 'body', '__weakref__')
+    kind = 9
+
     def __init__(self, condition: Expr, body: Stmt):
         self.condition: Expr = condition
         self.body: Stmt = body
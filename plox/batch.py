@@ -0,0 +1,107 @@
+from __future__ import annotations
+import sys
+import io
+import glob
+import json
+import traceback
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+
+from .lox import Lox
+from .frontend import compile_source
+from .source import read_source
+from .runtime import Output
+
+# Runs many scripts in one go (--batch) on a pool of worker processes, so
+#   each script costs one run through the pipeline instead of a whole
+#   `python -m plox` startup. Every script gets a fresh engine, fresh Lox
+#   error state and the worker's original recursion limit, and what it
+#   would have printed and exited with on its own is collected into a
+#   ScriptResult. A script that crashes plox itself gets exit code 70 and
+#   the traceback on its stderr, and the batch carries on.
+
+# scripts handed to a worker at a time
+CHUNK_SIZE = 8
+
+# the limit as the worker started, before any script's reserve_stack
+RECURSION_LIMIT = sys.getrecursionlimit()
+
+class ScriptResult:
+    __slots__ = ("path", "exit_code", "stdout", "stderr")
+
+    def __init__(self, path: str, exit_code: int, stdout: str, stderr: str) -> None:
+        self.path = path
+        self.exit_code = exit_code
+        self.stdout = stdout
+        self.stderr = stderr
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "path": self.path,
+            "exit_code": self.exit_code,
+            "stdout": self.stdout,
+            "stderr": self.stderr,
+        })
+
+def expand_paths(patterns: list[str]) -> list[str]:
+    # globs are expanded here rather than relying on the shell, so a job
+    #   can pass `'tests/**/*.lox'` without hitting argument limits; plain
+    #   paths are kept even if they don't exist, to be reported as such
+    paths = []
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            paths.extend(sorted(glob.glob(pattern, recursive=True)))
+        else:
+            paths.append(pattern)
+    return paths
+
+def run_script(path: str, engine: type, max_depth: int, memoize: bool, cache: str|None) -> ScriptResult:
+    chunks: list[str] = []
+    errors = io.StringIO()
+    Lox.had_error = False
+    Lox.had_runtime_error = False
+    Lox.max_depth = max_depth
+    Lox.memoize = memoize
+    Lox.cache = cache
+    sys.setrecursionlimit(RECURSION_LIMIT)
+    output = Output(chunks.append)
+
+    with contextlib.redirect_stderr(errors):
+        try:
+            source = read_source(path)
+        except OSError as e:
+            return ScriptResult(path, 66, "", f"Could not read '{path}': {e.strerror}.\n")
+        try:
+            Lox.interpreter = engine(output)
+            statements = compile_source(source, path)
+            if statements != None:
+                Lox.interpreter.interpret(statements)
+        except Exception:
+            output.flush()
+            return ScriptResult(path, 70, "".join(chunks), errors.getvalue() + traceback.format_exc())
+
+    exit_code = 0
+    if Lox.had_error:
+        exit_code = 65
+    elif Lox.had_runtime_error:
+        exit_code = 70
+    return ScriptResult(path, exit_code, "".join(chunks), errors.getvalue())
+
+def run_batch(paths: list[str], engine: type, jobs: int|None = None):
+    # yields a ScriptResult per path, in order, as they finish
+    count = len(paths)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        yield from executor.map(
+            run_script, paths, [engine] * count,
+            [Lox.max_depth] * count, [Lox.memoize] * count, [Lox.cache] * count,
+            chunksize=CHUNK_SIZE,
+        )
+
+def main(patterns: list[str], engine: type, jobs: int|None = None) -> int:
+    # one JSON object per line for each script; the exit code is the worst
+    #   of theirs
+    worst = 0
+    for result in run_batch(expand_paths(patterns), engine, jobs):
+        sys.stdout.write(result.to_json() + "\n")
+        worst = max(worst, result.exit_code)
+    return worst
@@ -0,0 +1,161 @@
+from __future__ import annotations
+import io
+import os
+import sys
+import glob
+import pickle
+import hashlib
+import tempfile
+
+from . import ast
+from .token import Token, TokenType
+from .environment import VariableKind
+
+# The compiled-program cache (--cache). A `.loxc` file holds a script's
+#   optimized AST along with every call the Resolver made to the engine's
+#   resolution hooks, pickled together so that node identities survive;
+#   loading one replays those calls into whatever engine is running, which
+#   leaves it exactly where scanning, parsing and resolving would have.
+#   `mark_pure` still runs after that, since --memoize isn't part of the
+#   key.
+#
+# A file starts with MAGIC and the key it was written for: a hash of the
+#   source together with the plox build (the contents of the package's
+#   own modules, so that any change to the front end or the AST classes
+#   invalidates old files) and the Python version. Anything that doesn't
+#   match is recompiled and overwritten.
+#
+# Unpickling can name any class or function to call, so the cache only
+#   lets a file name the classes a program is made of (LOADABLE); anything
+#   else is a miss, and the worst a planted file can do is describe an odd
+#   program. On top of that a directory given with --cache=dir has to be
+#   private, owned by the user with no access for anyone else (it's made
+#   that way if it doesn't exist), and a file has to be the user's and
+#   writable by no one else, or the cache isn't used.
+
+MAGIC = b"LOXC"
+
+LOADABLE: dict[tuple[str,str],type] = {
+    (loadable.__module__, loadable.__qualname__): loadable
+    for loadable in [
+        Token, TokenType, VariableKind,
+        *(node for node in vars(ast.expr).values() if isinstance(node, type) and issubclass(node, ast.expr.Expr)),
+        *(node for node in vars(ast.stmt).values() if isinstance(node, type) and issubclass(node, ast.stmt.Stmt)),
+    ]
+}
+
+_plox_digest: bytes|None = None
+
+def _build_digest() -> bytes:
+    global _plox_digest
+    if _plox_digest == None:
+        digest = hashlib.sha256(sys.version.encode())
+        package = os.path.dirname(os.path.abspath(__file__))
+        for path in sorted(glob.glob(os.path.join(package, "**", "*.py"), recursive=True)):
+            with open(path, "rb") as module:
+                digest.update(module.read())
+        _plox_digest = digest.digest()
+    return _plox_digest
+
+def cache_key(source: str) -> bytes:
+    return hashlib.sha256(_build_digest() + source.encode()).digest()
+
+def _owned(status: os.stat_result, others: int) -> bool:
+    # whether it's the user's and has none of the `others` mode bits
+    if not hasattr(os, "getuid"):
+        return True
+    return status.st_uid == os.getuid() and status.st_mode & others == 0
+
+def private_directory(directory: str) -> bool:
+    # "" is next to each script, which is as trusted as the script
+    if directory == "":
+        return True
+    try:
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        return _owned(os.stat(directory), 0o077)
+    except OSError:
+        return False
+
+def cache_path(script: str, key: bytes, directory: str) -> str:
+    # next to the script when no directory is given, otherwise named by
+    #   key so scripts from anywhere can share one directory
+    if directory == "":
+        return os.path.splitext(script)[0] + ".loxc"
+    return os.path.join(directory, key.hex() + ".loxc")
+
+class Recorder:
+    # Stands in for the engine while resolving a program that's going to
+    #   be cached, and keeps the calls for `replay`.
+    def __init__(self) -> None:
+        self.calls: list[tuple] = []
+
+    def resolve(self, expr: object, kind: VariableKind, index: int):
+        self.calls.append(("resolve", expr, kind, index))
+
+    def resolve_global(self, expr: object, name: str):
+        self.calls.append(("resolve_global", expr, name))
+
+    def declare(self, key: object, slot: int, captured: bool):
+        self.calls.append(("declare", key, slot, captured))
+
+    def resolve_function(self, declaration: ast.stmt.Function|None, frame_size: int, upvalues: list[tuple[bool,int]], boxed: list[int], nesting: int):
+        self.calls.append(("resolve_function", declaration, frame_size, upvalues, boxed, nesting))
+
+HOOKS = {"resolve", "resolve_global", "declare", "resolve_function"}
+
+def replay(calls: list[tuple], engine):
+    for hook, *arguments in calls:
+        getattr(engine, hook)(*arguments)
+
+class _Unpickler(pickle.Unpickler):
+    def find_class(self, module: str, name: str) -> type:
+        loadable = LOADABLE.get((module, name))
+        if loadable == None:
+            raise pickle.UnpicklingError(f"{module}.{name} isn't part of a program")
+        return loadable
+
+def load(path: str, key: bytes) -> tuple[list[ast.stmt.Stmt],list[tuple],set[str]]|None:
+    try:
+        with open(path, "rb") as cache_file:
+            if not _owned(os.fstat(cache_file.fileno()), 0o022):
+                return None
+            data = cache_file.read()
+    except OSError:
+        return None
+    header = MAGIC + key
+    if not data.startswith(header):
+        return None
+    try:
+        loaded = _Unpickler(io.BytesIO(memoryview(data)[len(header):])).load()
+    except Exception:
+        # a truncated or otherwise unreadable file is just a miss
+        return None
+    # and so is one that isn't what `store` writes, down to the hooks
+    #   `replay` will call
+    if type(loaded) != tuple or len(loaded) != 3 or type(loaded[1]) != list:
+        return None
+    for call in loaded[1]:
+        if type(call) != tuple or len(call) == 0 or call[0] not in HOOKS:
+            return None
+    return loaded
+
+def store(path: str, key: bytes, statements: list[ast.stmt.Stmt], calls: list[tuple], assigned_globals: set[str]):
+    try:
+        payload = pickle.dumps((statements, calls, assigned_globals), pickle.HIGHEST_PROTOCOL)
+    except RecursionError:
+        # too deeply nested to pickle; it just won't be cached
+        return
+    directory = os.path.dirname(path) or "."
+    try:
+        # written whole and then moved into place, so a concurrent run
+        #   (--batch) never sees half a file
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    except OSError:
+        return
+    try:
+        with os.fdopen(fd, "wb") as cache_file:
+            cache_file.write(MAGIC + key)
+            cache_file.write(payload)
+        os.replace(temp_path, path)
+    except OSError:
+        os.unlink(temp_path)
@@ -0,0 +1,734 @@
+from __future__ import annotations
+from typing import assert_never
+import operator
+
+from .lox import LoxRuntimeError, Lox, reserve_stack
+from . import ast
+from .token import Token, TokenType
+from .environment import VariableKind, UNDEFINED
+from .callable import Callable
+from .function import Function
+from .ret import LoxReturn, TailCall
+from .klass import LoxClass, LoxInstance, find_property_cached, store_cached
+from .runtime import Cell, Memoized, store_results
+from .interpreter import Interpreter
+
+# Alternate execution backend: instead of dispatching through `accept` on
+#   every evaluation, each resolved node is visited exactly once and turned
+#   into a Python closure with its operator, frame slot, and literal values
+#   already bound in. Running the program is then just calling closures,
+#   each taking the current call's frame and returning the node's value.
+#   A frame is a plain list of the function's local slots, with the
+#   function's upvalues (captured Cells) in the last position.
+#   The tree-walking Interpreter remains the reference implementation.
+
+def _may_return(stmt: ast.stmt.Stmt) -> bool:
+    if isinstance(stmt, ast.stmt.Return):
+        return True
+    if isinstance(stmt, ast.stmt.Block):
+        return any(_may_return(s) for s in stmt.statements)
+    if isinstance(stmt, ast.stmt.If):
+        return _may_return(stmt.then_branch) or (stmt.else_branch != None and _may_return(stmt.else_branch))
+    if isinstance(stmt, ast.stmt.While) or isinstance(stmt, ast.stmt.Loop):
+        return _may_return(stmt.body)
+    return False
+
+_COMPARISONS = {
+    TokenType.GREATER: operator.gt,
+    TokenType.GREATER_EQUAL: operator.ge,
+    TokenType.LESS: operator.lt,
+    TokenType.LESS_EQUAL: operator.le,
+}
+_ARITHMETIC = {
+    TokenType.PLUS: operator.add,
+    TokenType.MINUS: operator.sub,
+    TokenType.STAR: operator.mul,
+    TokenType.SLASH: operator.truediv,
+}
+
+class CompiledFunction(Function):
+    def __init__(self, declaration: ast.stmt.Function, body, upvalues: list[Cell], is_initializer: bool, layout: tuple, is_method: bool, this: LoxInstance|None = None) -> None:
+        super().__init__(declaration, upvalues, is_initializer, layout, this)
+        self._body = body
+        self._is_method = is_method
+        unfilled = layout[0] - len(declaration.params) - (1 if is_method else 0)
+        self._tail = [None] * unfilled + [upvalues]
+        self._boxed = layout[2]
+
+    def bind(self, instance: LoxInstance):
+        return CompiledFunction(self._declaration, self._body, self._upvalues, self._is_initializer, self._layout, self._is_method, instance)
+
+    def call(self, interpreter, arguments: list[object]) -> object:
+        return self.invoke(interpreter, self._this, arguments)
+
+    def invoke(self, interpreter, this: LoxInstance|None, arguments: list[object]) -> object:
+        function = self
+        memos = None
+        interpreter._depth += 1
+        try:
+            while True:
+                if function._is_method:
+                    frame = [this, *arguments, *function._tail]
+                else:
+                    frame = [*arguments, *function._tail]
+                for slot in function._boxed:
+                    frame[slot] = Cell(frame[slot])
+
+                result = function._body(frame)
+                if type(result) != TailCall:
+                    break
+                function, this, arguments = result.function, result.this, result.arguments
+                if result.memo != None:
+                    if memos == None:
+                        memos = []
+                    memos.append(result.memo)
+        finally:
+            interpreter._depth -= 1
+
+        if function._is_initializer:
+            return this
+        value = None if result == None else result.value
+        if memos != None:
+            store_results(memos, value)
+        return value
+
+# as in the tree-walker: Python frames per Lox call, and per level of
+#   nesting around the next one (most nodes are a single closure call)
+CALL_FRAMES = 20
+LEVEL_FRAMES = 2
+
+class ClosureCompiler(Interpreter):
+    def interpret(self, statements: list[ast.stmt.Stmt]):
+        frame_size = self._script_size
+        self._depth = 0
+        self._max_depth = Lox.max_depth
+        reserve_stack(CALL_FRAMES + LEVEL_FRAMES * self._nesting)
+        try:
+            program = self._compile_statements(statements)
+            program([None] * frame_size + [[]])
+        except LoxRuntimeError as lre:
+            self.output.flush()
+            Lox.runtime_error(lre)
+        except RecursionError:
+            self.output.flush()
+            Lox.runtime_error(LoxRuntimeError(Token(TokenType.IDENTIFIER, "", None, 0), "Stack overflow."))
+        finally:
+            self.output.flush()
+
+    def _compile(self, node: ast.stmt.Stmt|ast.expr.Expr):
+        return node.accept(self)
+
+    def _compile_statements(self, statements: list[ast.stmt.Stmt]):
+        # Compiled statements that may execute a `return` give back a
+        #   LoxReturn (or None); any others give back whatever their
+        #   expression happened to evaluate to, so only the former are
+        #   checked and the latter's results are never passed along.
+        compiled = [(self._compile(s), _may_return(s)) for s in statements]
+        if len(compiled) == 1 and compiled[0][1]:
+            return compiled[0][0]
+
+        if not any(may_return for _, may_return in compiled):
+            steps = [stmt for stmt, _ in compiled]
+            def run_statements(frame: list):
+                for stmt in steps:
+                    stmt(frame)
+            return run_statements
+
+        if isinstance(statements[-1], ast.stmt.Return):
+            # the common function body shape: whatever runs before the
+            #   final `return` only needs checking, the last result is final
+            head = compiled[:-1]
+            last = compiled[-1][0]
+            def run_then_return(frame: list):
+                for stmt, may_return in head:
+                    result = stmt(frame)
+                    if may_return and result != None:
+                        return result
+                return last(frame)
+            return run_then_return
+
+        def run_returning_statements(frame: list):
+            for stmt, may_return in compiled:
+                result = stmt(frame)
+                if may_return and result != None:
+                    return result
+        return run_returning_statements
+
+    def _compile_branch(self, stmt: ast.stmt.Stmt):
+        # for a branch whose result is passed on even though it can't return
+        if _may_return(stmt):
+            return self._compile(stmt)
+        return self._compile_statements([stmt])
+
+    def _compile_function(self, declaration: ast.stmt.Function, is_initializer: bool, is_method: bool):
+        body = self._compile_statements(declaration.body)
+        layout = declaration.layout
+        sources = layout[1]
+        def make_function(frame: list):
+            upvalues = [frame[index] if is_local else frame[-1][index] for is_local, index in sources]
+            return CompiledFunction(declaration, body, upvalues, is_initializer, layout, is_method)
+        return make_function
+
+    def _compile_lookup(self, kind: VariableKind, index: int):
+        if kind == VariableKind.LOCAL:
+            return lambda frame: frame[index]
+        if kind == VariableKind.CELL:
+            return lambda frame: frame[index].value
+        return lambda frame: frame[-1][index].value
+
+    def _compile_definition(self, stmt: ast.stmt.Var|ast.stmt.Function|ast.stmt.Class, value):
+        declaration = stmt.declaration
+        if declaration == None:
+            values = self._globals._values
+            index = self._globals.slot(stmt.name.lexeme)
+            def define_global(frame: list):
+                values[index] = value(frame)
+            return define_global
+
+        slot, captured = declaration
+        if captured:
+            # the cell goes in first so a function or class can capture itself
+            def define_cell(frame: list):
+                cell = Cell(None)
+                frame[slot] = cell
+                cell.value = value(frame)
+            return define_cell
+
+        def define_local(frame: list):
+            frame[slot] = value(frame)
+        return define_local
+
+    ### statements
+
+    def visit_block_stmt(self, stmt: ast.stmt.Block):
+        return self._compile_statements(stmt.statements)
+
+    def visit_class_stmt(self, stmt: ast.stmt.Class):
+        name = stmt.name.lexeme
+        superclass_expr = None
+        if stmt.superclass:
+            superclass_expr = self._compile(stmt.superclass)
+            super_slot, super_captured = stmt.superclass.declaration
+        methods = [
+            (method.name.lexeme, self._compile_function(method, method.name.lexeme == "init", True))
+            for method in stmt.methods
+        ]
+
+        def klass(frame: list):
+            superclass = None
+            if superclass_expr:
+                superclass = superclass_expr(frame)
+                if not isinstance(superclass, LoxClass):
+                    raise LoxRuntimeError(stmt.superclass.name, "Superclass must be a class.")
+                frame[super_slot] = Cell(superclass) if super_captured else superclass
+
+            method_table = {}
+            for method_name, make_method in methods:
+                method_table[method_name] = make_method(frame)
+
+            return LoxClass(name, superclass, method_table)
+        return self._compile_definition(stmt, klass)
+
+    def visit_expression_stmt(self, stmt: ast.stmt.Expression):
+        return self._compile(stmt.expression)
+
+    def visit_function_stmt(self, stmt: ast.stmt.Function):
+        make_function = self._compile_function(stmt, False, False)
+        if stmt.pure:
+            make_compiled = make_function
+            def make_function(frame: list):
+                return Memoized(make_compiled(frame))
+        return self._compile_definition(stmt, make_function)
+
+    def visit_if_stmt(self, stmt: ast.stmt.If):
+        is_truthy = self._is_truthy
+        condition = self._compile(stmt.condition)
+        if not _may_return(stmt):
+            then_branch = self._compile(stmt.then_branch)
+            if stmt.else_branch:
+                else_branch = self._compile(stmt.else_branch)
+                def if_else(frame: list):
+                    if is_truthy(condition(frame)):
+                        then_branch(frame)
+                    else:
+                        else_branch(frame)
+                return if_else
+
+            def if_then(frame: list):
+                if is_truthy(condition(frame)):
+                    then_branch(frame)
+            return if_then
+
+        then_branch = self._compile_branch(stmt.then_branch)
+        if stmt.else_branch:
+            else_branch = self._compile_branch(stmt.else_branch)
+            def if_else_returning(frame: list):
+                if is_truthy(condition(frame)):
+                    return then_branch(frame)
+                return else_branch(frame)
+            return if_else_returning
+
+        def if_then_returning(frame: list):
+            if is_truthy(condition(frame)):
+                return then_branch(frame)
+        return if_then_returning
+
+    def visit_print_stmt(self, stmt: ast.stmt.Print):
+        stringify = self._stringify
+        write = self.output.print
+        expression = self._compile(stmt.expression)
+        def print_stmt(frame: list):
+            write(stringify(expression(frame)))
+        return print_stmt
+
+    def visit_return_stmt(self, stmt: ast.stmt.Return):
+        if not stmt.value:
+            return_nil = LoxReturn(None)
+            return lambda frame: return_nil
+
+        if isinstance(stmt.value, ast.expr.Call):
+            return self._compile_tail_call(stmt.value)
+
+        value = self._compile(stmt.value)
+        def return_value(frame: list):
+            return LoxReturn(value(frame))
+        return return_value
+
+    def visit_var_stmt(self, stmt: ast.stmt.Var):
+        if not stmt.initializer:
+            return self._compile_definition(stmt, lambda frame: None)
+        return self._compile_definition(stmt, self._compile(stmt.initializer))
+
+    def visit_while_stmt(self, stmt: ast.stmt.While):
+        is_truthy = self._is_truthy
+        condition = self._compile(stmt.condition)
+        body = self._compile(stmt.body)
+        if not _may_return(stmt.body):
+            def while_stmt(frame: list):
+                while is_truthy(condition(frame)):
+                    body(frame)
+            return while_stmt
+
+        def while_returning(frame: list):
+            while is_truthy(condition(frame)):
+                result = body(frame)
+                if result != None:
+                    return result
+        return while_returning
+
+    def visit_loop_stmt(self, stmt: ast.stmt.Loop):
+        kind, index = stmt.variable.location
+        if kind != VariableKind.LOCAL:
+            return self.visit_while_stmt(stmt.original)
+
+        op = stmt.operator
+        compare = _COMPARISONS[op.type]
+        limit = stmt.limit.value
+        body = self._compile(stmt.body)
+        if not _may_return(stmt.body):
+            def loop(frame: list):
+                while True:
+                    current = frame[index]
+                    if type(current) != float:
+                        raise LoxRuntimeError(op, "Operands must be numbers.")
+                    if not compare(current, limit):
+                        return
+                    body(frame)
+            return loop
+
+        def loop_returning(frame: list):
+            while True:
+                current = frame[index]
+                if type(current) != float:
+                    raise LoxRuntimeError(op, "Operands must be numbers.")
+                if not compare(current, limit):
+                    return None
+                result = body(frame)
+                if result != None:
+                    return result
+        return loop_returning
+
+    ### expressions
+
+    def _compile_assignment(self, name_token, expr):
+        kind, index = expr.location
+        if kind == VariableKind.GLOBAL:
+            values = self._globals._values
+            def assign_global(frame: list, value: object):
+                if values[index] is UNDEFINED:
+                    raise LoxRuntimeError(name_token, f"Undefined variable '{name_token.lexeme}'.")
+                values[index] = value
+            return assign_global
+        if kind == VariableKind.LOCAL:
+            def assign_local(frame: list, value: object):
+                frame[index] = value
+            return assign_local
+        if kind == VariableKind.CELL:
+            def assign_cell(frame: list, value: object):
+                frame[index].value = value
+            return assign_cell
+        def assign_upvalue(frame: list, value: object):
+            frame[-1][index].value = value
+        return assign_upvalue
+
+    def visit_assign_expr(self, expr: ast.expr.Assign):
+        value = self._compile(expr.value)
+        assign = self._compile_assignment(expr.name, expr)
+        def assign_expr(frame: list):
+            v = value(frame)
+            assign(frame, v)
+            return v
+        return assign_expr
+
+    def visit_binary_expr(self, expr: ast.expr.Binary):
+        left = self._compile(expr.left)
+        right = self._compile(expr.right)
+        op = expr.operator
+
+        match op.type:
+            case TokenType.GREATER:
+                def greater(frame: list):
+                    l = left(frame); r = right(frame)
+                    if type(l) == float and type(r) == float:
+                        return l > r
+                    raise LoxRuntimeError(op, "Operands must be numbers.")
+                return greater
+            case TokenType.GREATER_EQUAL:
+                def greater_equal(frame: list):
+                    l = left(frame); r = right(frame)
+                    if type(l) == float and type(r) == float:
+                        return l >= r
+                    raise LoxRuntimeError(op, "Operands must be numbers.")
+                return greater_equal
+            case TokenType.LESS:
+                def less(frame: list):
+                    l = left(frame); r = right(frame)
+                    if type(l) == float and type(r) == float:
+                        return l < r
+                    raise LoxRuntimeError(op, "Operands must be numbers.")
+                return less
+            case TokenType.LESS_EQUAL:
+                def less_equal(frame: list):
+                    l = left(frame); r = right(frame)
+                    if type(l) == float and type(r) == float:
+                        return l <= r
+                    raise LoxRuntimeError(op, "Operands must be numbers.")
+                return less_equal
+            case TokenType.BANG_EQUAL:
+                is_equal = self._is_equal
+                return lambda frame: not is_equal(left(frame), right(frame))
+            case TokenType.EQUAL_EQUAL:
+                is_equal = self._is_equal
+                return lambda frame: is_equal(left(frame), right(frame))
+            case TokenType.MINUS:
+                def minus(frame: list):
+                    l = left(frame); r = right(frame)
+                    if type(l) == float and type(r) == float:
+                        return l - r
+                    raise LoxRuntimeError(op, "Operands must be numbers.")
+                return minus
+            case TokenType.PLUS:
+                def plus(frame: list):
+                    l = left(frame); r = right(frame)
+                    if type(l) == float and type(r) == float:
+                        return l + r
+                    if type(l) == str and type(r) == str:
+                        return l + r
+                    raise LoxRuntimeError(op, "Operands must be two numbers or two strings.")
+                return plus
+            case TokenType.SLASH:
+                def slash(frame: list):
+                    l = left(frame); r = right(frame)
+                    if type(l) == float and type(r) == float:
+                        if r == 0.0:
+                            raise LoxRuntimeError(op, "Cannot divide by zero.")
+                        return l / r
+                    raise LoxRuntimeError(op, "Operands must be numbers.")
+                return slash
+            case TokenType.STAR:
+                def star(frame: list):
+                    l = left(frame); r = right(frame)
+                    if type(l) == float and type(r) == float:
+                        return l * r
+                    raise LoxRuntimeError(op, "Operands must be numbers.")
+                return star
+            case _:
+                assert_never(op.type)
+
+    def visit_call_expr(self, expr: ast.expr.Call):
+        if isinstance(expr.callee, ast.expr.Get):
+            return self._compile_invoke(expr, expr.callee)
+
+        callee_expr = self._compile(expr.callee)
+        argument_exprs = [self._compile(argument) for argument in expr.arguments]
+        paren = expr.paren
+        interpreter = self
+
+        def call(frame: list):
+            callee = callee_expr(frame)
+            arguments = [argument(frame) for argument in argument_exprs]
+
+            if not isinstance(callee, Callable):
+                raise LoxRuntimeError(paren, "Can only call functions and classes.")
+            if len(arguments) != callee.arity():
+                raise LoxRuntimeError(paren, f"Expected {callee.arity()} arguments but got {len(arguments)}.")
+            if interpreter._depth >= interpreter._max_depth:
+                raise LoxRuntimeError(paren, "Stack overflow.")
+
+            try:
+                return callee.call(interpreter, arguments)
+            except RecursionError:
+                # out of Python stack: as in the tree-walker's _call
+                raise LoxRuntimeError(paren, "Stack overflow.") from None
+        return call
+
+    def _compile_invoke(self, expr: ast.expr.Call, get: ast.expr.Get):
+        obj_expr = self._compile(get.obj)
+        argument_exprs = [self._compile(argument) for argument in expr.arguments]
+        paren = expr.paren
+        name = get.name
+        lexeme = name.lexeme
+        interpreter = self
+
+        def invoke(frame: list):
+            obj = obj_expr(frame)
+            if not isinstance(obj, LoxInstance):
+                raise LoxRuntimeError(name, "Only instances have properties.")
+
+            cache = get.cache
+            if type(cache) == tuple and cache[0] is obj._shape:
+                method = cache[1]
+            else:
+                method = find_property_cached(get, obj._shape, lexeme)
+            if type(method) == int:
+                callee = obj._values[method]
+                arguments = [argument(frame) for argument in argument_exprs]
+                if not isinstance(callee, Callable):
+                    raise LoxRuntimeError(paren, "Can only call functions and classes.")
+                if len(arguments) != callee.arity():
+                    raise LoxRuntimeError(paren, f"Expected {callee.arity()} arguments but got {len(arguments)}.")
+                if interpreter._depth >= interpreter._max_depth:
+                    raise LoxRuntimeError(paren, "Stack overflow.")
+                try:
+                    return callee.call(interpreter, arguments)
+                except RecursionError:
+                    raise LoxRuntimeError(paren, "Stack overflow.") from None
+            if method == None:
+                raise LoxRuntimeError(name, f"Undefined property '{lexeme}'.")
+
+            arguments = [argument(frame) for argument in argument_exprs]
+            if len(arguments) != method.arity():
+                raise LoxRuntimeError(paren, f"Expected {method.arity()} arguments but got {len(arguments)}.")
+            if interpreter._depth >= interpreter._max_depth:
+                raise LoxRuntimeError(paren, "Stack overflow.")
+            try:
+                return method.invoke(interpreter, obj, arguments)
+            except RecursionError:
+                raise LoxRuntimeError(paren, "Stack overflow.") from None
+        return invoke
+
+    def _compile_tail_call(self, expr: ast.expr.Call):
+        # `return f(...)`: the checks of a call or invoke, in the same order,
+        #   but a function or method comes back as a TailCall for the
+        #   CompiledFunction running this body to make; anything else (a
+        #   class, a native) is called here and its result returned
+        argument_exprs = [self._compile(argument) for argument in expr.arguments]
+        paren = expr.paren
+        interpreter = self
+
+        def finish(callee: object, frame: list):
+            arguments = [argument(frame) for argument in argument_exprs]
+            if not isinstance(callee, Callable):
+                raise LoxRuntimeError(paren, "Can only call functions and classes.")
+            if len(arguments) != callee.arity():
+                raise LoxRuntimeError(paren, f"Expected {callee.arity()} arguments but got {len(arguments)}.")
+            if type(callee) == CompiledFunction:
+                return TailCall(callee, callee._this, arguments)
+            if type(callee) == Memoized:
+                return callee.tail_call(arguments)
+            if interpreter._depth >= interpreter._max_depth:
+                raise LoxRuntimeError(paren, "Stack overflow.")
+            try:
+                return LoxReturn(callee.call(interpreter, arguments))
+            except RecursionError:
+                raise LoxRuntimeError(paren, "Stack overflow.") from None
+
+        if not isinstance(expr.callee, ast.expr.Get):
+            callee_expr = self._compile(expr.callee)
+            return lambda frame: finish(callee_expr(frame), frame)
+
+        get = expr.callee
+        obj_expr = self._compile(get.obj)
+        name = get.name
+        lexeme = name.lexeme
+        def tail_invoke(frame: list):
+            obj = obj_expr(frame)
+            if not isinstance(obj, LoxInstance):
+                raise LoxRuntimeError(name, "Only instances have properties.")
+            method = find_property_cached(get, obj._shape, lexeme)
+            if type(method) == int:
+                return finish(obj._values[method], frame)
+            if method == None:
+                raise LoxRuntimeError(name, f"Undefined property '{lexeme}'.")
+
+            arguments = [argument(frame) for argument in argument_exprs]
+            if len(arguments) != method.arity():
+                raise LoxRuntimeError(paren, f"Expected {method.arity()} arguments but got {len(arguments)}.")
+            return TailCall(method, obj, arguments)
+        return tail_invoke
+
+    def visit_get_expr(self, expr: ast.expr.Get):
+        obj_expr = self._compile(expr.obj)
+        name = expr.name
+        lexeme = name.lexeme
+        def get(frame: list):
+            obj = obj_expr(frame)
+            if not isinstance(obj, LoxInstance):
+                raise LoxRuntimeError(name, "Only instances have properties.")
+            # monomorphic hit inline, anything else through the shared cache
+            cache = expr.cache
+            if type(cache) == tuple and cache[0] is obj._shape:
+                found = cache[1]
+            else:
+                found = find_property_cached(expr, obj._shape, lexeme)
+            if type(found) == int:
+                return obj._values[found]
+            if found == None:
+                raise LoxRuntimeError(name, f"Undefined property '{lexeme}'.")
+            return found.bind(obj)
+        return get
+
+    def visit_grouping_expr(self, expr: ast.expr.Grouping):
+        return self._compile(expr.expression)
+
+    def visit_literal_expr(self, expr: ast.expr.Literal):
+        value = expr.value
+        return lambda frame: value
+
+    def visit_logical_expr(self, expr: ast.expr.Logical):
+        is_truthy = self._is_truthy
+        left = self._compile(expr.left)
+        right = self._compile(expr.right)
+
+        if expr.operator.type == TokenType.OR:
+            def logical_or(frame: list):
+                l = left(frame)
+                if is_truthy(l):
+                    return l
+                return right(frame)
+            return logical_or
+
+        def logical_and(frame: list):
+            l = left(frame)
+            if not is_truthy(l):
+                return l
+            return right(frame)
+        return logical_and
+
+    def visit_set_expr(self, expr: ast.expr.Set):
+        obj_expr = self._compile(expr.obj)
+        value_expr = self._compile(expr.value)
+        name = expr.name
+        lexeme = name.lexeme
+        def set_expr(frame: list):
+            obj = obj_expr(frame)
+            if not isinstance(obj, LoxInstance):
+                raise LoxRuntimeError(name, "Only instances have fields.")
+            value = value_expr(frame)
+            # a hit on the site's cache inline, anything else through
+            #   store_cached
+            cache = expr.cache
+            if cache != None and cache[0] is obj._shape:
+                if cache[2] is cache[0]:
+                    obj._values[cache[1]] = value
+                else:
+                    obj._values.append(value)
+                    obj._shape = cache[2]
+            else:
+                store_cached(expr, obj, lexeme, value)
+            return value
+        return set_expr
+
+    def visit_super_expr(self, expr: ast.expr.Super):
+        method_name = expr.method
+        get_superclass = self._compile_lookup(*expr.location)
+        get_this = self._compile_lookup(*expr.this.location)
+        def super_expr(frame: list):
+            superclass: LoxClass = get_superclass(frame)
+            obj = get_this(frame)
+            method = superclass.find_method(method_name.lexeme)
+            if not method:
+                raise LoxRuntimeError(method_name, f"Undefined property '{method_name.lexeme}'.")
+            return method.bind(obj)
+        return super_expr
+
+    def visit_this_expr(self, expr: ast.expr.This):
+        return self._compile_variable(expr.keyword, expr)
+
+    def visit_unary_expr(self, expr: ast.expr.Unary):
+        right = self._compile(expr.right)
+        op = expr.operator
+
+        match op.type:
+            case TokenType.MINUS:
+                def negate(frame: list):
+                    r = right(frame)
+                    if type(r) == float:
+                        return -r
+                    raise LoxRuntimeError(op, "Operand must be a number.")
+                return negate
+            case TokenType.BANG:
+                is_truthy = self._is_truthy
+                return lambda frame: not is_truthy(right(frame))
+            case _:
+                assert_never(op.type)
+
+    def visit_update_expr(self, expr: ast.expr.Update):
+        kind, index = expr.target.location
+        if kind != VariableKind.LOCAL:
+            return self._compile(expr.target)
+
+        op = expr.operator
+        binary = self._binary
+        if (op.type in [TokenType.PLUS, TokenType.MINUS] and isinstance(expr.value, ast.expr.Literal)
+                and type(expr.value.value) == float):
+            # `i = i + 1` and friends
+            delta = expr.value.value if op.type == TokenType.PLUS else -expr.value.value
+            constant = expr.value.value
+            def increment(frame: list):
+                current = frame[index]
+                if type(current) == float:
+                    result = current + delta
+                else:
+                    result = binary(op, current, constant)
+                frame[index] = result
+                return result
+            return increment
+
+        value = self._compile(expr.value)
+        function = _ARITHMETIC[op.type]
+        def update(frame: list):
+            current = frame[index]
+            v = value(frame)
+            if type(current) == float and type(v) == float and v != 0.0:
+                result = function(current, v)
+            else:
+                result = binary(op, current, v)
+            frame[index] = result
+            return result
+        return update
+
+    def visit_variable_expr(self, expr: ast.expr.Variable):
+        return self._compile_variable(expr.name, expr)
+
+    def _compile_variable(self, name, expr: ast.expr.Expr):
+        kind, index = expr.location
+        if kind == VariableKind.GLOBAL:
+            values = self._globals._values
+            def global_variable(frame: list):
+                value = values[index]
+                if value is UNDEFINED:
+                    raise LoxRuntimeError(name, f"Undefined variable '{name.lexeme}'.")
+                return value
+            return global_variable
+        return self._compile_lookup(kind, index)
@@ -1,46 +1,51 @@
 from __future__ import annotations
+from enum import Enum
 
 from .token import Token
 from .lox import LoxRuntimeError
 
-class Environment:
-    def __init__(self, enclosing: Environment|None = None) -> None:
-        self._values: dict[str,object] = {}
-        self._enclosing = enclosing
+# Where the Resolver placed a variable: directly in the current call's
+#   frame, boxed in a Cell in that frame because a closure captures it, in
+#   a Cell the current function captured from an enclosing one, or in a
+#   slot of the global table.
+VariableKind = Enum("VariableKind", ["LOCAL", "CELL", "UPVALUE", "GLOBAL"])
+
+# what a global's slot holds until its declaration runs
+UNDEFINED = object()
+
+class GlobalEnvironment:
+    # Every global name gets a slot the first time the Resolver sees it, so
+    #   uses can go straight to the slot. Globals can still be used before
+    #   they're declared (or never be), so a slot starts out UNDEFINED and
+    #   reading or assigning it then is the usual runtime error.
+    def __init__(self) -> None:
+        self._slots: dict[str,int] = {}
+        self._values: list[object] = []
+
+    def slot(self, name: str) -> int:
+        index = self._slots.get(name)
+        if index == None:
+            index = len(self._values)
+            self._slots[name] = index
+            self._values.append(UNDEFINED)
+        return index
 
     def define(self, name: str, value: object):
-        self._values[name] = value
-
-    def ancestor(self, distance: int) -> Environment:
-        env = self
-        for _ in range(distance):
-            env = env._enclosing
-        return env
-
-    def get_at(self, distance: int, name: str) -> object:
-        return self.ancestor(distance)._values.get(name)
-
-    def assign_at(self, distance: int, name: Token, value: object):
-        self.ancestor(distance)._values[name.lexeme] = value
+        self._values[self.slot(name)] = value
 
     def get(self, name: Token) -> object:
-        if name.lexeme in self._values:
-            return self._values[name.lexeme]
-
-        if self._enclosing:
-            return self._enclosing.get(name)
+        return self.get_at(self.slot(name.lexeme), name)
 
-        raise LoxRuntimeError(name, f"Undefined variable '{name.lexeme}'.")
+    def get_at(self, index: int, name: Token) -> object:
+        value = self._values[index]
+        if value is UNDEFINED:
+            raise LoxRuntimeError(name, f"Undefined variable '{name.lexeme}'.")
+        return value
 
     def assign(self, name: Token, value: object):
-        if name.lexeme in self._values:
-            self._values[name.lexeme] = value
-            return
-
-        if self._enclosing:
-            self._enclosing.assign(name, value)
-            return
-
-        raise LoxRuntimeError(name, f"Undefined variable '{name.lexeme}'.")
-
+        self.assign_at(self.slot(name.lexeme), name, value)
 
+    def assign_at(self, index: int, name: Token, value: object):
+        if self._values[index] is UNDEFINED:
+            raise LoxRuntimeError(name, f"Undefined variable '{name.lexeme}'.")
+        self._values[index] = value
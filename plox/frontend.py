@@ -0,0 +1,77 @@
+from __future__ import annotations
+import gc
+from typing import Iterable
+
+from .lox import Lox
+from .scanner import Scanner
+from .parser import Parser
+from .resolver import Resolver
+from .optimizer import Optimizer
+from .purity import mark_pure
+from . import cache
+
+def compile_source(source: str|Iterable[str], path: str|None = None) -> list|None:
+    # with a script's path and --cache, goes through its `.loxc` file
+    #   (unless it's big enough to be read in pieces, or the cache
+    #   directory isn't private)
+    if path != None and Lox.cache != None and type(source) == str and cache.private_directory(Lox.cache):
+        return _compile_cached(source, path)
+
+    statements, assigned_globals = _compile(source, Lox.interpreter)
+    if statements == None:
+        return None
+    if Lox.memoize:
+        mark_pure(statements, assigned_globals)
+    return statements
+
+def _compile(source: str|Iterable[str], engine) -> tuple[list|None,set[str]]:
+    scanner = Scanner(source)
+    tokens = scanner.tokens()
+
+    try:
+        parser = Parser(tokens)
+        statements = parser.parse()
+    except Parser.ParseError as pe:
+        Lox.error(pe.token, pe.message)
+
+    if Lox.had_error:
+        return None, set()
+
+    resolver = Resolver(engine)
+    resolver.resolve(statements)
+
+    if Lox.had_error:
+        return None, set()
+
+    optimizer = Optimizer(resolver.assigned)
+    statements = optimizer.optimize(statements)
+    return statements, resolver.assigned_globals
+
+def _compile_cached(source: str, path: str) -> list|None:
+    key = cache.cache_key(source)
+    cache_path = cache.cache_path(path, key, Lox.cache)
+    # a loaded program is nothing but new objects that will all live as
+    #   long as it runs; letting the collector trace them over and over
+    #   while they're unpickled costs more than the load itself, so it
+    #   waits until they're in place (a script's run moves them out of its
+    #   way after that, see __main__)
+    gc.disable()
+    try:
+        cached = cache.load(cache_path, key)
+        if cached != None:
+            statements, calls, assigned_globals = cached
+            cache.replay(calls, Lox.interpreter)
+    finally:
+        gc.enable()
+    if cached == None:
+        recorder = cache.Recorder()
+        statements, assigned_globals = _compile(source, recorder)
+        if statements == None:
+            return None
+        calls = recorder.calls
+        cache.store(cache_path, key, statements, calls, assigned_globals)
+        cache.replay(calls, Lox.interpreter)
+
+    if Lox.memoize:
+        mark_pure(statements, assigned_globals)
+    return statements
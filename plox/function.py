@@ -1,40 +1,61 @@
+from __future__ import annotations
+
 from . import ast
-from .environment import Environment
 from .callable import Callable
-from .ret import LoxReturn
 from .klass import LoxInstance
+from .runtime import Cell, store_results
+from .ret import TailCall
 
 class Function(Callable):
-    def __init__(self, declaration: ast.stmt.Function, closure: Environment, is_initializer: bool) -> None:
+    def __init__(self, declaration: ast.stmt.Function, upvalues: list[Cell], is_initializer: bool, layout: tuple, this: LoxInstance|None = None) -> None:
         self._declaration = declaration
-        self._closure = closure
+        self._upvalues = upvalues
         self._is_initializer = is_initializer
+        # (frame size, upvalue sources, boxed parameter slots), from the Resolver
+        self._layout = layout
+        self._this = this
 
     def bind(self, instance: LoxInstance):
-        env = Environment(self._closure)
-        env.define("this", instance)
-        return Function(self._declaration, env, self._is_initializer)
+        return Function(self._declaration, self._upvalues, self._is_initializer, self._layout, instance)
 
     def arity(self) -> int:
         return len(self._declaration.params)
 
-    def call(self, interpreter, arguments: list[object]) -> object:
-        environment = Environment(self._closure)
-        for i in range(len(self._declaration.params)):
-            environment.define(self._declaration.params[i].lexeme, arguments[i])
-
-        try:
-            interpreter.execute_block(self._declaration.body, environment)
-        except LoxReturn as lr:
-            if self._is_initializer:
-                return self._closure.get_at(0, "this")
-            return lr.value
+    def _frame(self, this: LoxInstance|None, arguments: list[object]) -> list[object]:
+        frame_size, _, boxed = self._layout
+        if this != None:
+            frame = [this, *arguments]
+        else:
+            frame = list(arguments)
+        frame.extend([None] * (frame_size - len(frame)))
+        for slot in boxed:
+            frame[slot] = Cell(frame[slot])
+        return frame
 
-        if self._is_initializer:
-            return self._closure.get_at(0, "this")
-
-        return None
+    def call(self, interpreter, arguments: list[object]) -> object:
+        return self.invoke(interpreter, self._this, arguments)
+
+    def invoke(self, interpreter, this: LoxInstance|None, arguments: list[object]) -> object:
+        # calls a method with `this` supplied directly, rather than
+        #   allocating a bound copy of the function just to call it once
+        function = self
+        memos = None
+        while True:
+            result = interpreter.execute_call(function._declaration.body, function._frame(this, arguments), function._upvalues)
+            if type(result) != TailCall:
+                break
+            function, this, arguments = result.function, result.this, result.arguments
+            if result.memo != None:
+                if memos == None:
+                    memos = []
+                memos.append(result.memo)
+
+        if function._is_initializer:
+            return this
+        value = None if result == None else result.value
+        if memos != None:
+            store_results(memos, value)
+        return value
 
     def __str__(self) -> str:
         return f"<fn {self._declaration.name.lexeme}>"
-
@@ -1,76 +1,182 @@
 from __future__ import annotations
 from typing import assert_never
-import math
-import time
+import operator
+import weakref
 
-from .lox import LoxRuntimeError, Lox
+from .lox import LoxRuntimeError, Lox, reserve_stack
 from . import ast
 from .scanner import Token, TokenType
-from .environment import Environment
+from .environment import GlobalEnvironment, VariableKind, UNDEFINED
 from .callable import Callable
 from .function import Function
-from .ret import LoxReturn
-from .klass import LoxClass, LoxInstance
+from .ret import LoxReturn, TailCall
+from .klass import LoxClass, LoxInstance, find_property_cached, store_cached
+from .runtime import Cell, ClockFunction, Memoized, Output, stringify, is_truthy, is_equal
+from .jit import HOT_LOOP, SIDE_EXIT, compile_loop
+
+# Type feedback for Binary nodes, kept on the node like the property caches.
+#   A site counts its evaluations while both operands share a type the
+#   operator has a fast path for; after QUICKEN_AFTER of them it stores
+#   (type, function) and from then on only checks the operand types before
+#   applying it. A site whose guard fails drops back to the generic path
+#   for good (False).
+QUICKEN_AFTER = 8
+
+_QUICK_OPERATORS = {
+    (TokenType.PLUS, float): operator.add,
+    (TokenType.PLUS, str): operator.add,
+    (TokenType.MINUS, float): operator.sub,
+    (TokenType.STAR, float): operator.mul,
+    (TokenType.SLASH, float): operator.truediv,
+    (TokenType.GREATER, float): operator.gt,
+    (TokenType.GREATER_EQUAL, float): operator.ge,
+    (TokenType.LESS, float): operator.lt,
+    (TokenType.LESS_EQUAL, float): operator.le,
+    (TokenType.EQUAL_EQUAL, float): operator.eq,
+    (TokenType.EQUAL_EQUAL, str): operator.eq,
+    (TokenType.BANG_EQUAL, float): operator.ne,
+    (TokenType.BANG_EQUAL, str): operator.ne,
+}
+
+def _record_feedback(expr: ast.expr.Binary, left: object, right: object):
+    kind = type(left)
+    function = _QUICK_OPERATORS.get((expr.operator.type, kind))
+    if function == None or type(right) != kind:
+        expr.feedback = False
+        return
+    count = 1 if expr.feedback == None else expr.feedback + 1
+    expr.feedback = (kind, function) if count >= QUICKEN_AFTER else count
+
+# the kinds as module globals: looking a member up on the Enum class costs
+#   more than the comparison it's for
+_LOCAL = VariableKind.LOCAL
+_CELL = VariableKind.CELL
+_GLOBAL = VariableKind.GLOBAL
+
+# Python frames a Lox call can take up in the tree-walker: the call itself
+#   is a handful, plus a few for every level the statements and expressions
+#   around the next call are nested, which the Resolver reports for each
+#   function; the deepest one sets how much stack to reserve
+CALL_FRAMES = 16
+LEVEL_FRAMES = 4
 
 class Interpreter(ast.expr.ExprVisitor, ast.stmt.StmtVisitor):
-    class ClockFunction(Callable):
-        def arity(self) -> int:
-            return 0
-
-        def call(self, interpreter: Interpreter, arguments: list[object]) -> object:
-            return time.time()
-
-        def __str__(self):
-            return "<native fn>"
-
-    def __init__(self) -> None:
-        self._globals = Environment()
-        self._locals: dict[ast.expr.Expr,int] = {}
-        self._environment = self._globals
-
-        self._globals.define("clock", Interpreter.ClockFunction())
+    _stringify = staticmethod(stringify)
+    _is_truthy = staticmethod(is_truthy)
+    _is_equal = staticmethod(is_equal)
+
+    def __init__(self, output: Output|None = None) -> None:
+        # where `print` writes (embedders can hand in their own)
+        self.output = Output() if output == None else output
+        self._globals = GlobalEnvironment()
+        # the slot list itself, for the hottest lookups
+        self._global_values = self._globals._values
+        # where the Resolver put things is kept on the AST nodes, so it goes
+        #   away with them; only the top-level script's frame size is here
+        self._script_size = 0
+        # the deepest nesting of any function body seen so far
+        self._nesting = 0
+        # each hot loop's compiled version (or False if it didn't work
+        #   out), kept here rather than on the node: it runs against this
+        #   interpreter's frames and globals, and the AST may be shared.
+        #   Weakly, so one goes when its program does.
+        self._traces: weakref.WeakKeyDictionary[ast.stmt.While|ast.stmt.Loop,object] = weakref.WeakKeyDictionary()
+        self._frame: list[object] = []
+        self._upvalues: list[Cell] = []
+
+        self._globals.define("clock", ClockFunction())
 
     def interpret(self, statements: list[ast.stmt.Stmt]):
+        self._frame = [None] * self._script_size
+        self._upvalues = []
+        self._depth = 0
+        self._max_depth = Lox.max_depth
+        reserve_stack(CALL_FRAMES + LEVEL_FRAMES * self._nesting)
+        self._print = self.output.print
         try:
             for statement in statements:
                 self._execute(statement)
         except LoxRuntimeError as lre:
+            self.output.flush()
             Lox.runtime_error(lre)
+        except RecursionError:
+            # nested too deeply outside of any call to say where
+            self.output.flush()
+            Lox.runtime_error(LoxRuntimeError(Token(TokenType.IDENTIFIER, "", None, 0), "Stack overflow."))
+        finally:
+            self.output.flush()
+
+    def _execute(self, stmt: ast.stmt.Stmt) -> LoxReturn|None:
+        return stmt.accept(self)
+
+    def resolve(self, expr: object, kind: VariableKind, index: int):
+        expr.location = (kind, index)
+
+    def resolve_global(self, expr: object, name: str):
+        expr.location = (VariableKind.GLOBAL, self._globals.slot(name))
+
+    def declare(self, key: object, slot: int, captured: bool):
+        key.declaration = (slot, captured)
+
+    def resolve_function(self, declaration: ast.stmt.Function|None, frame_size: int, upvalues: list[tuple[bool,int]], boxed: list[int], nesting: int):
+        if nesting > self._nesting:
+            self._nesting = nesting
+        if declaration == None:
+            self._script_size = frame_size
+        else:
+            declaration.layout = (frame_size, upvalues, boxed)
 
-    def _stringify(self, obj: object) -> str:
-        if obj == None:
-            return "nil"
-        if type(obj) == float:
-            if obj.is_integer():
-                if obj == 0.0:
-                    # special case to pass jlox test suite
-                    #   (mimicking Java behavior with negative zero)
-                    if math.copysign(1.0, obj) == -1.0:
-                        return "-0"
-                    else:
-                        return "0"
-                return str(int(obj))
-        if type(obj) == bool:
-            return str(obj).lower()
-        return str(obj)
-
-    def _execute(self, stmt: ast.stmt.Stmt):
-        stmt.accept(self)
-
-    def resolve(self, expr: ast.expr.Expr, depth: int):
-        self._locals[expr] = depth
-
-    def execute_block(self, statements: list[ast.stmt.Stmt], environment: Environment):
-        previous = self._environment
+    def execute_call(self, statements: list[ast.stmt.Stmt], frame: list[object], upvalues: list[Cell]) -> LoxReturn|None:
+        previous_frame = self._frame
+        previous_upvalues = self._upvalues
+        self._depth += 1
         try:
-            self._environment = environment
+            self._frame = frame
+            self._upvalues = upvalues
             for statement in statements:
-                self._execute(statement)
+                result = self._execute(statement)
+                if result != None:
+                    return result
         finally:
-            self._environment = previous
+            self._frame = previous_frame
+            self._upvalues = previous_upvalues
+            self._depth -= 1
+
+    def _make_function(self, declaration: ast.stmt.Function, is_initializer: bool) -> Function:
+        layout = declaration.layout
+        upvalues = [
+            self._frame[index] if is_local else self._upvalues[index]
+            for is_local, index in layout[1]
+        ]
+        return Function(declaration, upvalues, is_initializer, layout)
+
+    def _define(self, stmt: ast.stmt.Var|ast.stmt.Function|ast.stmt.Class, value: object):
+        declaration = stmt.declaration
+        if declaration == None:
+            self._globals.define(stmt.name.lexeme, value)
+            return
+        slot, captured = declaration
+        if captured:
+            self._frame[slot] = Cell(value)
+        else:
+            self._frame[slot] = value
+
+    def _initialize(self, stmt: ast.stmt.Function|ast.stmt.Class, value: object):
+        # for declarations whose own body may capture them (functions,
+        #   classes): `_define` the variable first, then fill it in
+        declaration = stmt.declaration
+        if declaration == None:
+            self._globals.define(stmt.name.lexeme, value)
+        elif declaration[1]:
+            self._frame[declaration[0]].value = value
+        else:
+            self._frame[declaration[0]] = value
 
     def visit_block_stmt(self, stmt: ast.stmt.Block):
-        self.execute_block(stmt.statements, Environment(self._environment))
+        for statement in stmt.statements:
+            result = self._execute(statement)
+            if result != None:
+                return result
 
     def visit_class_stmt(self, stmt: ast.stmt.Class):
         superclass = None
@@ -79,23 +185,19 @@ class Interpreter(ast.expr.ExprVisitor, ast.stmt.StmtVisitor):
             if not isinstance(superclass, LoxClass):
                 raise LoxRuntimeError(stmt.superclass.name, "Superclass must be a class.")
 
-        self._environment.define(stmt.name.lexeme, None)
+        self._define(stmt, None)
 
         if stmt.superclass != None:
-            self._environment = Environment(self._environment)
-            self._environment.define("super", superclass)
+            slot, captured = stmt.superclass.declaration
+            self._frame[slot] = Cell(superclass) if captured else superclass
 
         methods: dict[str,Function] = {}
         for method in stmt.methods:
-            function = Function(method, self._environment, method.name.lexeme == "init")
+            function = self._make_function(method, method.name.lexeme == "init")
             methods[method.name.lexeme] = function
 
         klass = LoxClass(stmt.name.lexeme, superclass, methods)
-
-        if superclass != None:
-            self._environment = self._environment._enclosing
-
-        self._environment.assign(stmt.name, klass)
+        self._initialize(stmt, klass)
 
     def visit_literal_expr(self, expr: ast.expr.Literal):
         return expr.value
@@ -117,13 +219,12 @@ class Interpreter(ast.expr.ExprVisitor, ast.stmt.StmtVisitor):
         if not isinstance(obj, LoxInstance):
             raise LoxRuntimeError(expr.name, "Only instances have fields.")
         value = self._evaluate(expr.value)
-        obj.set(expr.name, value)
+        store_cached(expr, obj, expr.name.lexeme, value)
         return value
 
     def visit_super_expr(self, expr: ast.expr.Super) -> object:
-        distance = self._locals.get(expr)
-        superclass: LoxClass = self._environment.get_at(distance, "super")
-        obj = self._environment.get_at(distance - 1, "this")
+        superclass: LoxClass = self._look_up_variable(expr.keyword, expr)
+        obj = self._look_up_variable(expr.keyword, expr.this)
         method = superclass.find_method(expr.method.lexeme)
         if not method:
             raise LoxRuntimeError(expr.method, f"Undefined property '{expr.method.lexeme}'.")
@@ -151,43 +252,87 @@ class Interpreter(ast.expr.ExprVisitor, ast.stmt.StmtVisitor):
         left = self._evaluate(expr.left)
         right = self._evaluate(expr.right)
 
-        match expr.operator.type:
+        feedback = expr.feedback
+        if type(feedback) == tuple:
+            kind, function = feedback
+            if type(left) == kind and type(right) == kind:
+                try:
+                    return function(left, right)
+                except ZeroDivisionError:
+                    raise LoxRuntimeError(expr.operator, "Cannot divide by zero.")
+            expr.feedback = False
+        elif feedback != False:
+            _record_feedback(expr, left, right)
+
+        return self._binary(expr.operator, left, right)
+
+    def _binary(self, operator: Token, left: object, right: object):
+        match operator.type:
             case TokenType.GREATER:
-                self._check_number_operands(expr.operator, left, right)
+                self._check_number_operands(operator, left, right)
                 return float(left) > float(right)
             case TokenType.GREATER_EQUAL:
-                self._check_number_operands(expr.operator, left, right)
+                self._check_number_operands(operator, left, right)
                 return float(left) >= float(right)
             case TokenType.LESS:
-                self._check_number_operands(expr.operator, left, right)
+                self._check_number_operands(operator, left, right)
                 return float(left) < float(right)
             case TokenType.LESS_EQUAL:
-                self._check_number_operands(expr.operator, left, right)
+                self._check_number_operands(operator, left, right)
                 return float(left) <= float(right)
             case TokenType.BANG_EQUAL:
                 return not self._is_equal(left, right)
             case TokenType.EQUAL_EQUAL:
                 return self._is_equal(left, right)
             case TokenType.MINUS:
-                self._check_number_operands(expr.operator, left, right)
+                self._check_number_operands(operator, left, right)
                 return float(left) - float(right)
             case TokenType.PLUS:
-                self._check_number_or_string_operands(expr.operator, left, right)
+                self._check_number_or_string_operands(operator, left, right)
                 return (left) + (right)
             case TokenType.SLASH:
-                self._check_number_operands(expr.operator, left, right)
+                self._check_number_operands(operator, left, right)
                 if right == 0.0:
-                    raise LoxRuntimeError(expr.operator, "Cannot divide by zero.")
+                    raise LoxRuntimeError(operator, "Cannot divide by zero.")
                 return float(left) / float(right)
             case TokenType.STAR:
-                self._check_number_operands(expr.operator, left, right)
+                self._check_number_operands(operator, left, right)
                 return float(left) * float(right)
             case _:
-                assert_never(expr.operator.type)
+                assert_never(operator.type)
 
     def visit_call_expr(self, expr: ast.stmt.Call):
-        callee = self._evaluate(expr.callee)
+        if isinstance(expr.callee, ast.expr.Get):
+            return self._invoke(expr, expr.callee)
+        return self._call(expr, self._evaluate(expr.callee))
+
+    def _invoke(self, expr: ast.expr.Call, get: ast.expr.Get):
+        # `obj.name(...)`, like clox's OP_INVOKE: a method found on the
+        #   class is called with `obj` as `this` without binding it first;
+        #   a field is called like any other value
+        obj = self._evaluate(get.obj)
+        if not isinstance(obj, LoxInstance):
+            raise LoxRuntimeError(get.name, "Only instances have properties.")
+        method = find_property_cached(get, obj._shape, get.name.lexeme)
+        if type(method) == int:
+            return self._call(expr, obj._values[method])
+        if method == None:
+            raise LoxRuntimeError(get.name, f"Undefined property '{get.name.lexeme}'.")
 
+        arguments = []
+        for argument in expr.arguments:
+            arguments.append(self._evaluate(argument))
+        if len(arguments) != method.arity():
+            raise LoxRuntimeError(expr.paren, f"Expected {method.arity()} arguments but got {len(arguments)}.")
+        if self._depth >= self._max_depth:
+            raise LoxRuntimeError(expr.paren, "Stack overflow.")
+
+        try:
+            return method.invoke(self, obj, arguments)
+        except RecursionError:
+            raise LoxRuntimeError(expr.paren, "Stack overflow.") from None
+
+    def _call(self, expr: ast.expr.Call, callee: object):
         arguments = []
         for argument in expr.arguments:
             arguments.append(self._evaluate(argument))
@@ -196,37 +341,56 @@ class Interpreter(ast.expr.ExprVisitor, ast.stmt.StmtVisitor):
             raise LoxRuntimeError(expr.paren, "Can only call functions and classes.")
         if len(arguments) != callee.arity():
             raise LoxRuntimeError(expr.paren, f"Expected {callee.arity()} arguments but got {len(arguments)}.")
+        if self._depth >= self._max_depth:
+            raise LoxRuntimeError(expr.paren, "Stack overflow.")
+
+        try:
+            return callee.call(self, arguments)
+        except RecursionError:
+            # out of Python stack before max_depth after all: the innermost
+            #   call that can still raise anything reports it, at its paren
+            raise LoxRuntimeError(expr.paren, "Stack overflow.") from None
+
+    def _tail_call(self, expr: ast.expr.Call) -> LoxReturn|TailCall:
+        # `return f(...)`: the same checks as _invoke/_call, in the same
+        #   order, but a Lox function comes back as a TailCall for the
+        #   Function running this body to make
+        if isinstance(expr.callee, ast.expr.Get):
+            get = expr.callee
+            obj = self._evaluate(get.obj)
+            if not isinstance(obj, LoxInstance):
+                raise LoxRuntimeError(get.name, "Only instances have properties.")
+            method = find_property_cached(get, obj._shape, get.name.lexeme)
+            if type(method) != int:
+                if method == None:
+                    raise LoxRuntimeError(get.name, f"Undefined property '{get.name.lexeme}'.")
+                arguments = [self._evaluate(argument) for argument in expr.arguments]
+                if len(arguments) != method.arity():
+                    raise LoxRuntimeError(expr.paren, f"Expected {method.arity()} arguments but got {len(arguments)}.")
+                return TailCall(method, obj, arguments)
+            callee = obj._values[method]
+        else:
+            callee = self._evaluate(expr.callee)
 
-        return callee.call(self, arguments)
+        if type(callee) != Function and type(callee) != Memoized:
+            return LoxReturn(self._call(expr, callee))
+        arguments = [self._evaluate(argument) for argument in expr.arguments]
+        if len(arguments) != callee.arity():
+            raise LoxRuntimeError(expr.paren, f"Expected {callee.arity()} arguments but got {len(arguments)}.")
+        if type(callee) == Memoized:
+            return callee.tail_call(arguments)
+        return TailCall(callee, callee._this, arguments)
 
     def visit_get_expr(self, expr: ast.expr.Get):
         obj = self._evaluate(expr.obj)
         if isinstance(obj, LoxInstance):
-            return obj.get(expr.name)
+            return obj.get(expr.name, expr)
 
         raise LoxRuntimeError(expr.name, "Only instances have properties.")
 
     def _evaluate(self, expr: ast.expr.Expr) -> object:
         return expr.accept(self)
 
-    def _is_truthy(self, obj: object) -> bool:
-        if obj == None:
-            return False
-        if type(obj) == bool:
-            return obj
-        return True
-
-    def _is_equal(self, a, b) -> bool:
-        if a == None and b == None:
-            return True
-        if a == None:
-            return False
-        if type(a) == bool and type(b) != bool:
-            return False
-        if type(b) == bool and type(a) != bool:
-            return False
-        return a == b
-
     def _check_number_operand(self, operator: Token, operand: object):
         if type(operand) == float:
             return
@@ -248,52 +412,149 @@ class Interpreter(ast.expr.ExprVisitor, ast.stmt.StmtVisitor):
         self._evaluate(stmt.expression)
 
     def visit_function_stmt(self, stmt: ast.stmt.Function):
-        function = Function(stmt, self._environment, False)
-        self._environment.define(stmt.name.lexeme, function)
+        self._define(stmt, None)
+        function = self._make_function(stmt, False)
+        if stmt.pure:
+            function = Memoized(function)
+        self._initialize(stmt, function)
 
     def visit_if_stmt(self, stmt: ast.stmt.If):
         if self._is_truthy(self._evaluate(stmt.condition)):
-            self._execute(stmt.then_branch)
+            return self._execute(stmt.then_branch)
         elif stmt.else_branch:
-            self._execute(stmt.else_branch)
+            return self._execute(stmt.else_branch)
 
     def visit_print_stmt(self, stmt: ast.stmt.Print):
         value = self._evaluate(stmt.expression)
-        print(self._stringify(value))
+        self._print(self._stringify(value))
 
     def visit_return_stmt(self, stmt: ast.stmt.Return):
+        if isinstance(stmt.value, ast.expr.Call):
+            return self._tail_call(stmt.value)
         value = None
         if stmt.value:
             value = self._evaluate(stmt.value)
-        raise LoxReturn(value)
+        return LoxReturn(value)
 
     def visit_var_stmt(self, stmt: ast.stmt.Var):
         value = None
         if stmt.initializer:
             value = self._evaluate(stmt.initializer)
-        self._environment.define(stmt.name.lexeme, value)
+        self._define(stmt, value)
 
     def visit_while_stmt(self, stmt: ast.stmt.While):
+        trace = self._traces.get(stmt)
+        if trace:
+            result = trace(self._frame, self._upvalues)
+            if result is not SIDE_EXIT:
+                return result
+            self._traces[stmt] = False
+        iterations = 0
         while self._is_truthy(self._evaluate(stmt.condition)):
-            self._execute(stmt.body)
+            result = self._execute(stmt.body)
+            if result != None:
+                return result
+            iterations += 1
+            if iterations == HOT_LOOP and stmt not in self._traces:
+                return self._run_trace(stmt)
+
+    def _run_trace(self, stmt: ast.stmt.While|ast.stmt.Loop) -> LoxReturn|TailCall|None:
+        # a loop just got hot: compile it and carry on in the compiled
+        #   version, or with the same node again if that doesn't work out
+        trace = self._traces[stmt] = compile_loop(self, stmt)
+        if trace:
+            result = trace(self._frame, self._upvalues)
+            if result is not SIDE_EXIT:
+                return result
+            self._traces[stmt] = False
+        return self._execute(stmt)
+
+    def visit_loop_stmt(self, stmt: ast.stmt.Loop):
+        # `while (x < limit)` with the comparison against the constant done
+        #   here instead of through a Binary
+        trace = self._traces.get(stmt)
+        if trace:
+            result = trace(self._frame, self._upvalues)
+            if result is not SIDE_EXIT:
+                return result
+            self._traces[stmt] = False
+        iterations = 0
+        compare = _QUICK_OPERATORS[(stmt.operator.type, float)]
+        limit = stmt.limit.value
+        kind, index = stmt.variable.location
+        slot = index if kind == _LOCAL else None
+        while True:
+            if slot != None:
+                current = self._frame[slot]
+            else:
+                current = self._look_up_variable(stmt.variable.name, stmt.variable)
+            if type(current) != float:
+                raise LoxRuntimeError(stmt.operator, "Operands must be numbers.")
+            if not compare(current, limit):
+                return None
+            result = self._execute(stmt.body)
+            if result != None:
+                return result
+            iterations += 1
+            if iterations == HOT_LOOP and stmt not in self._traces:
+                return self._run_trace(stmt)
 
     def visit_assign_expr(self, expr: ast.expr.Assign):
         value = self._evaluate(expr.value)
 
-        distance = self._locals.get(expr)
-        if distance != None:
-            self._environment.assign_at(distance, expr.name, value)
+        kind, index = expr.location
+        if kind == _LOCAL:
+            self._frame[index] = value
+        elif kind == _CELL:
+            self._frame[index].value = value
+        elif kind == _GLOBAL:
+            self._globals.assign_at(index, expr.name, value)
         else:
-            self._globals.assign(expr.name, value)
+            self._upvalues[index].value = value
 
         return value
 
+    def visit_update_expr(self, expr: ast.expr.Update):
+        # `x = x <op> value` in one step: the variable is found once for
+        #   both the read and the write
+        kind, index = expr.target.location
+        if kind == _LOCAL:
+            current = self._frame[index]
+        elif kind == _CELL:
+            current = self._frame[index].value
+        elif kind == _GLOBAL:
+            current = self._globals.get_at(index, expr.variable.name)
+        else:
+            current = self._upvalues[index].value
+
+        value = self._evaluate(expr.value)
+        if type(current) == float and type(value) == float and value != 0.0:
+            value = _QUICK_OPERATORS[(expr.operator.type, float)](current, value)
+        else:
+            value = self._binary(expr.operator, current, value)
+
+        if kind == _LOCAL:
+            self._frame[index] = value
+        elif kind == _CELL:
+            self._frame[index].value = value
+        elif kind == _GLOBAL:
+            self._globals.assign_at(index, expr.target.name, value)
+        else:
+            self._upvalues[index].value = value
+        return value
+
     def visit_variable_expr(self, expr: ast.expr.Variable):
         return self._look_up_variable(expr.name, expr)
 
-    def _look_up_variable(self, name: Token, expr: ast.expr.Expr):
-        distance = self._locals.get(expr)
-        if distance != None:
-            return self._environment.get_at(distance, name.lexeme)
-        else:
-            return self._globals.get(name)
+    def _look_up_variable(self, name: Token, expr: object):
+        kind, index = expr.location
+        if kind == _LOCAL:
+            return self._frame[index]
+        if kind == _GLOBAL:
+            value = self._global_values[index]
+            if value is UNDEFINED:
+                raise LoxRuntimeError(name, f"Undefined variable '{name.lexeme}'.")
+            return value
+        if kind == _CELL:
+            return self._frame[index].value
+        return self._upvalues[index].value
@@ -0,0 +1,265 @@
+from __future__ import annotations
+import math
+
+from . import ast
+from .scanner import Token, TokenType
+from .environment import VariableKind, UNDEFINED
+from .runtime import stringify, is_truthy, is_equal
+
+# The tree-walker's loop JIT. Once a `while` has run HOT_LOOP iterations in
+#   one go, `compile_loop` looks at that loop as it now stands: the types
+#   the locals it carries from one iteration to the next hold, and the
+#   operand types its Binary nodes have recorded (the same feedback that
+#   quickening uses). It writes a Python function running the rest of the
+#   loop against the interpreter's own frame, so the two can hand over at
+#   the top of any iteration:
+#   - numeric and string operators run inline behind a type check, with
+#     the interpreter's own `_binary` as the slow path, so a value of an
+#     unexpected type still gets Lox semantics and Lox errors
+#   - locals, cells and upvalues are frame and list accesses, globals go
+#     through the global slot table directly
+#   - nested loops, `if`, blocks, `var` and `print` become Python code
+#   - anything else (calls, property access, `return`, declarations, ...)
+#     calls back into the interpreter's visit method for that one node
+#   Each iteration first checks that the loop-carried locals the compiled
+#   code was specialized for still hold numbers; if one doesn't, the
+#   function returns SIDE_EXIT before doing anything, and the interpreter
+#   carries on with the loop itself (and never compiles it again).
+
+HOT_LOOP = 64
+
+# what a compiled loop returns when its guards fail
+SIDE_EXIT = object()
+
+_NUMERIC = {
+    TokenType.GREATER: ">", TokenType.GREATER_EQUAL: ">=",
+    TokenType.LESS: "<", TokenType.LESS_EQUAL: "<=",
+    TokenType.MINUS: "-", TokenType.PLUS: "+",
+    TokenType.SLASH: "/", TokenType.STAR: "*",
+}
+_COMPARISONS = [TokenType.GREATER, TokenType.GREATER_EQUAL, TokenType.LESS, TokenType.LESS_EQUAL]
+
+class _LoopCompiler:
+    def __init__(self, interpreter, frame: list[object]) -> None:
+        self._interpreter = interpreter
+        self._frame = frame
+        self._constants: list[object] = []
+        self._constant_names: dict[int,str] = {}
+        self._lines: list[str] = []
+        self._temps = 0
+        # slots of the loop's own locals, which don't carry over
+        self._declared: set[int] = set()
+        # slots read as operands of number-specialized operators
+        self._numeric: set[int] = set()
+
+    def compile(self, stmt: ast.stmt.While):
+        self._declared_in(stmt.body)
+        self._line(1, "while True:")
+        guard_at = len(self._lines)
+        self._line(2, f"if not ({self._condition(stmt.condition)}): return None")
+        self._statement(stmt.body, 2)
+
+        guards = [
+            f"type(f[{slot}]) is float" for slot in sorted(self._numeric - self._declared)
+            if type(self._frame[slot]) == float
+        ]
+        if len(guards) > 0:
+            self._line(2, "if not (" + " and ".join(guards) + "): return SIDE_EXIT")
+            self._lines.insert(guard_at, self._lines.pop())
+
+        constants = ", ".join(self._constant_names[id(value)] for value in self._constants)
+        source = "\n".join([
+            f"def make(K, ev, ex, B, N, T, EQ, P, S, G, GA, GS, UNDEFINED, SIDE_EXIT):",
+            f"    {constants}{',' if len(self._constants) == 1 else ''} = K" if self._constants else "    pass",
+            f"    def loop(f, up):",
+            *self._lines,
+            f"    return loop",
+        ])
+        namespace = {}
+        exec(compile(source, "<loop>", "exec"), namespace)
+
+        interpreter = self._interpreter
+        globals = interpreter._globals
+        return namespace["make"](
+            self._constants, self._visitor, interpreter._execute, interpreter._binary, interpreter._check_number_operand,
+            is_truthy, is_equal, interpreter.output.print, stringify,
+            globals._values, globals.get_at, globals.assign_at, UNDEFINED, SIDE_EXIT,
+        )
+
+    def _visitor(self, expr: ast.expr.Expr):
+        # evaluates an expression the compiled code doesn't handle itself
+        return expr.accept(self._interpreter)
+
+    def _line(self, indent: int, text: str):
+        self._lines.append("    " * (indent + 1) + text)
+
+    def _temp(self) -> str:
+        self._temps += 1
+        return f"t{self._temps}"
+
+    def _constant(self, value: object) -> str:
+        name = self._constant_names.get(id(value))
+        if name == None:
+            name = f"k{len(self._constants)}"
+            self._constant_names[id(value)] = name
+            self._constants.append(value)
+        return name
+
+    def _declared_in(self, stmt: ast.stmt.Stmt):
+        if isinstance(stmt, ast.stmt.Block):
+            for statement in stmt.statements:
+                self._declared_in(statement)
+        elif isinstance(stmt, (ast.stmt.Var, ast.stmt.Function, ast.stmt.Class)):
+            if stmt.declaration != None:
+                self._declared.add(stmt.declaration[0])
+        elif isinstance(stmt, ast.stmt.If):
+            self._declared_in(stmt.then_branch)
+            if stmt.else_branch:
+                self._declared_in(stmt.else_branch)
+        elif isinstance(stmt, ast.stmt.While):
+            self._declared_in(stmt.body)
+        elif isinstance(stmt, ast.stmt.Loop):
+            self._declared_in(stmt.body)
+
+    ### statements
+
+    def _statement(self, stmt: ast.stmt.Stmt, indent: int):
+        match stmt:
+            case ast.stmt.Block():
+                if len(stmt.statements) == 0:
+                    self._line(indent, "pass")
+                for statement in stmt.statements:
+                    self._statement(statement, indent)
+            case ast.stmt.Expression():
+                self._expression_statement(stmt.expression, indent)
+            case ast.stmt.If():
+                self._line(indent, f"if {self._condition(stmt.condition)}:")
+                self._statement(stmt.then_branch, indent + 1)
+                if stmt.else_branch:
+                    self._line(indent, "else:")
+                    self._statement(stmt.else_branch, indent + 1)
+            case ast.stmt.Print():
+                self._line(indent, f"P(S({self._expr(stmt.expression)}))")
+            case ast.stmt.Var() if stmt.declaration != None and not stmt.declaration[1]:
+                value = "None" if stmt.initializer == None else self._expr(stmt.initializer)
+                self._line(indent, f"f[{stmt.declaration[0]}] = {value}")
+            case ast.stmt.While():
+                self._line(indent, f"while {self._condition(stmt.condition)}:")
+                self._statement(stmt.body, indent + 1)
+            case ast.stmt.Loop():
+                self._statement(stmt.original, indent)
+            case ast.stmt.Return():
+                self._line(indent, f"return ex({self._constant(stmt)})")
+            case _:
+                result = self._temp()
+                self._line(indent, f"{result} = ex({self._constant(stmt)})")
+                self._line(indent, f"if {result} is not None: return {result}")
+
+    def _expression_statement(self, expr: ast.expr.Expr, indent: int):
+        if isinstance(expr, ast.expr.Assign):
+            self._store(expr, self._expr(expr.value), indent)
+        elif isinstance(expr, ast.expr.Update):
+            current = self._load(expr.target.location, expr.variable.name)
+            value = self._binary(expr.operator, current, self._expr(expr.value), self._slot(expr.target))
+            self._store(expr.target, value, indent)
+        else:
+            self._line(indent, self._expr(expr))
+
+    def _store(self, expr: ast.expr.Assign, value: str, indent: int):
+        kind, index = expr.location
+        if kind == VariableKind.LOCAL:
+            self._line(indent, f"f[{index}] = {value}")
+        elif kind == VariableKind.CELL:
+            self._line(indent, f"f[{index}].value = {value}")
+        elif kind == VariableKind.UPVALUE:
+            self._line(indent, f"up[{index}].value = {value}")
+        else:
+            self._line(indent, f"GS({index}, {self._constant(expr.name)}, {value})")
+
+    ### expressions
+
+    def _condition(self, expr: ast.expr.Expr) -> str:
+        # comparisons already give a bool either way
+        if isinstance(expr, ast.expr.Binary) and expr.operator.type in _COMPARISONS:
+            return self._expr(expr)
+        return f"T({self._expr(expr)})"
+
+    def _slot(self, expr: ast.expr.Expr) -> int|None:
+        if isinstance(expr, (ast.expr.Variable, ast.expr.Assign)) and expr.location[0] == VariableKind.LOCAL:
+            return expr.location[1]
+        return None
+
+    def _load(self, location: tuple[VariableKind,int], name: Token) -> str:
+        kind, index = location
+        if kind == VariableKind.LOCAL:
+            return f"f[{index}]"
+        if kind == VariableKind.CELL:
+            return f"f[{index}].value"
+        if kind == VariableKind.UPVALUE:
+            return f"up[{index}].value"
+        t = self._temp()
+        return f"({t} if ({t} := G[{index}]) is not UNDEFINED else GA({index}, {self._constant(name)}))"
+
+    def _expr(self, expr: ast.expr.Expr) -> str:
+        match expr:
+            case ast.expr.Literal():
+                value = expr.value
+                if value == None or type(value) == bool or (type(value) == float and math.isfinite(value)):
+                    return repr(value)
+                return self._constant(value)
+            case ast.expr.Variable():
+                return self._load(expr.location, expr.name)
+            case ast.expr.This():
+                return self._load(expr.location, expr.keyword)
+            case ast.expr.Grouping():
+                return self._expr(expr.expression)
+            case ast.expr.Binary():
+                left = self._expr(expr.left)
+                right = self._expr(expr.right)
+                slots = (self._slot(expr.left), self._slot(expr.right))
+                return self._binary(expr.operator, left, right, *slots, feedback=expr.feedback)
+            case ast.expr.Logical():
+                t = self._temp()
+                left = self._expr(expr.left)
+                right = self._expr(expr.right)
+                if expr.operator.type == TokenType.OR:
+                    return f"({t} if T({t} := {left}) else {right})"
+                return f"({right} if T({t} := {left}) else {t})"
+            case ast.expr.Unary() if expr.operator.type == TokenType.BANG:
+                return f"(not T({self._expr(expr.right)}))"
+            case ast.expr.Unary():
+                t = self._temp()
+                return f"(-{t} if type({t} := {self._expr(expr.right)}) is float else N({self._constant(expr.operator)}, {t}))"
+        return f"ev({self._constant(expr)})"
+
+    def _binary(self, operator, left: str, right: str, left_slot: int|None = None, right_slot: int|None = None, feedback: object = None) -> str:
+        op = operator.type
+        if op == TokenType.EQUAL_EQUAL:
+            return f"EQ({left}, {right})"
+        if op == TokenType.BANG_EQUAL:
+            return f"(not EQ({left}, {right}))"
+
+        token = self._constant(operator)
+        a = self._temp()
+        b = self._temp()
+        if op == TokenType.PLUS and type(feedback) == tuple and feedback[0] == str:
+            return f"(({a} + {b}) if (type({a} := {left}) is str) & (type({b} := {right}) is str) else B({token}, {a}, {b}))"
+
+        for slot in (left_slot, right_slot):
+            if slot != None:
+                self._numeric.add(slot)
+        check = f"(type({a} := {left}) is float) & (type({b} := {right}) is float)"
+        if op == TokenType.SLASH:
+            check += f" & ({b} != 0.0)"
+        return f"(({a} {_NUMERIC[op]} {b}) if {check} else B({token}, {a}, {b}))"
+
+def compile_loop(interpreter, stmt: ast.stmt.While|ast.stmt.Loop):
+    # the compiled function for a loop that's gotten hot, or False if it
+    #   can't be compiled
+    if isinstance(stmt, ast.stmt.Loop):
+        stmt = stmt.original
+    try:
+        return _LoopCompiler(interpreter, interpreter._frame).compile(stmt)
+    except (RecursionError, SyntaxError, MemoryError):
+        # nested too deeply for Python to compile
+        return False
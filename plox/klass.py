@@ -4,54 +4,149 @@ from .callable import Callable
 from .token import Token
 from .lox import LoxRuntimeError
 
+# Instances don't carry a dict of their own; fields live in a flat list
+#   and a Shape, shared by every instance of a class that had the same
+#   fields added in the same order, maps names to indices in it. Adding a
+#   field moves the instance along a transition to the next shape, and
+#   those transitions are cached so instances built the same way end up
+#   sharing one. Each class has its own root shape, so a shape also pins
+#   down which class an instance belongs to.
+class Shape:
+    __slots__ = ("klass", "slots", "_transitions")
+
+    def __init__(self, klass: LoxClass, slots: dict[str,int]) -> None:
+        self.klass = klass
+        self.slots = slots
+        self._transitions: dict[str,Shape] = {}
+
+    def with_field(self, name: str) -> Shape:
+        shape = self._transitions.get(name)
+        if shape == None:
+            slots = dict(self.slots)
+            slots[name] = len(slots)
+            shape = Shape(self.klass, slots)
+            self._transitions[name] = shape
+        return shape
+
+# Inline caches for property lookups, kept on the Get node itself and keyed
+#   by shape. A shape's fields and its class's method table can't change
+#   once they exist, so an entry mapping a shape to the field index (an int)
+#   or the method (or None) that `name` finds there never goes stale; the
+#   only "invalidation" is a site seeing too many shapes and giving up
+#   caching. Sites go from empty, to one (shape, found) pair, to a small
+#   dict, to megamorphic (False).
+POLYMORPHIC_LIMIT = 4
+
+def find_property_cached(site, shape: Shape, name: str):
+    cache = site.cache
+    if type(cache) == tuple:
+        if cache[0] is shape:
+            return cache[1]
+    elif type(cache) == dict:
+        if shape in cache:
+            return cache[shape]
+
+    found = shape.slots.get(name)
+    if found == None:
+        found = shape.klass.find_method(name)
+    if cache == None:
+        site.cache = (shape, found)
+    elif type(cache) == tuple:
+        site.cache = {cache[0]: cache[1], shape: found}
+    elif type(cache) == dict:
+        if len(cache) < POLYMORPHIC_LIMIT:
+            cache[shape] = found
+        else:
+            site.cache = False
+    return found
+
+# Set nodes cache (shape before, index, shape after) for the last store
+#   they made; for a new field the two shapes differ and the value is
+#   appended. Constructors assign fields in the same order every time, so
+#   each `this.x = x` site keeps seeing the same shape.
+def store_cached(site, instance: LoxInstance, name: str, value: object):
+    shape = instance._shape
+    cache = site.cache
+    if cache != None and cache[0] is shape:
+        index, next_shape = cache[1], cache[2]
+    else:
+        index = shape.slots.get(name)
+        if index == None:
+            index = len(shape.slots)
+            next_shape = shape.with_field(name)
+        else:
+            next_shape = shape
+        site.cache = (shape, index, next_shape)
+
+    if next_shape is shape:
+        instance._values[index] = value
+    else:
+        instance._values.append(value)
+        instance._shape = next_shape
+
 class LoxClass(Callable):
     def __init__(self, name: str, superclass: LoxClass, methods: dict) -> None:
         self.name = name
-        self._methods = methods
         self.superclass = superclass
+        self.shape = Shape(self, {})
 
-    def find_method(self, name: str):
-        if name in self._methods:
-            return self._methods[name]
-
-        if self.superclass:
-            return self.superclass.find_method(name)
+        # the method table is flattened when the class is created, with
+        #   inherited methods copied in under the class's own, so lookups
+        #   never walk the superclass chain; the initializer and the arity
+        #   it implies are looked up once here too
+        if superclass:
+            self._methods = dict(superclass._methods)
+            self._methods.update(methods)
+        else:
+            self._methods = methods
+        self._initializer = self._methods.get("init")
+        self._arity = 0 if self._initializer == None else self._initializer.arity()
 
-        return None
+    def find_method(self, name: str):
+        return self._methods.get(name)
 
     def call(self, interpreter, arguments: list[object]) -> object:
         instance = LoxInstance(self)
-        initializer = self.find_method("init")
-        if initializer:
-            initializer.bind(instance).call(interpreter, arguments)
+        if self._initializer:
+            self._initializer.invoke(interpreter, instance, arguments)
         return instance
 
     def arity(self) -> int:
-        initializer = self.find_method("init")
-        if not initializer:
-            return 0
-        return initializer.arity()
+        return self._arity
 
     def __str__(self) -> str:
         return self.name
 
 class LoxInstance:
+    __slots__ = ("_klass", "_shape", "_values")
+
     def __init__(self, klass: LoxClass) -> None:
         self._klass = klass
-        self._fields: dict[str,object] = {}
-
-    def get(self, name: Token):
-        if name.lexeme in self._fields:
-            return self._fields.get(name.lexeme)
+        self._shape = klass.shape
+        self._values: list[object] = []
 
-        method = self._klass.find_method(name.lexeme)
-        if method:
-            return method.bind(self)
+    def get(self, name: Token, site = None):
+        if site == None:
+            index = self._shape.slots.get(name.lexeme)
+            if index != None:
+                return self._values[index]
+            found = self._klass.find_method(name.lexeme)
+        else:
+            found = find_property_cached(site, self._shape, name.lexeme)
+            if type(found) == int:
+                return self._values[found]
+        if found:
+            return found.bind(self)
 
         raise LoxRuntimeError(name, f"Undefined property '{name.lexeme}'.")
 
     def set(self, name: Token, value: object):
-        self._fields[name.lexeme] = value
+        index = self._shape.slots.get(name.lexeme)
+        if index == None:
+            self._shape = self._shape.with_field(name.lexeme)
+            self._values.append(value)
+        else:
+            self._values[index] = value
 
     def __str__(self) -> str:
         return f"{self._klass.name} instance"
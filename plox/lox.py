@@ -9,6 +9,15 @@ if TYPE_CHECKING:
 class Lox:
     had_error = False
     had_runtime_error = False
+    # how many Lox calls can be in progress at once before the program
+    #   fails with "Stack overflow." (--max-depth); tail calls don't count
+    max_depth = 10000
+    # whether functions the purity pass proves pure get their results
+    #   cached (--memoize)
+    memoize = False
+    # where compiled scripts are cached (--cache): None for nowhere, "" for
+    #   a `.loxc` next to each script, or a directory
+    cache = None
     if TYPE_CHECKING:
         interpreter: Interpreter = None
     else:
@@ -31,6 +40,15 @@ class Lox:
         sys.stderr.write(f"[line {line}] Error{where}: {message}\n")
         Lox.had_error = True
 
+def reserve_stack(frames_per_call: int):
+    # The Python-hosted engines run Lox calls on the Python stack, so its
+    #   recursion limit has to leave room for Lox.max_depth calls of
+    #   `frames_per_call` Python frames each; the engines count Lox calls
+    #   themselves and report "Stack overflow." before that runs out.
+    limit = Lox.max_depth * frames_per_call + 1000
+    if sys.getrecursionlimit() < limit:
+        sys.setrecursionlimit(limit)
+
 class LoxRuntimeError(RuntimeError):
     def __init__(self, token: Token, message: str) -> None:
         super().__init__()
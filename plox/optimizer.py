@@ -0,0 +1,250 @@
+from __future__ import annotations
+
+from . import ast
+from .token import TokenType
+from .runtime import is_truthy, is_equal
+
+# Runs between the Resolver and the engine and rewrites the AST in place:
+#   operators whose operands are all literals are evaluated now, `if` and
+#   `while` statements with a literal condition lose the branch that can't
+#   run, expression statements that can't do anything are dropped, and
+#   reads of a local `var` that is initialized with a literal and never
+#   assigned become that literal. Anything that would raise at runtime
+#   (`1/0`, `-"a"`, `1 + nil`, ...) is left alone so the error still comes
+#   from the same token.
+#
+# It also fuses a few shapes that loops are made of into single nodes the
+#   engines can run in one step (superinstructions):
+#   - `x = x <op> value` for + - * / becomes an Update, which finds `x`
+#     once for both the read and the write; the increment of a desugared
+#     `for` loop is the common case.
+#   - `while (x < limit)` (or <=, >, >=) with a number literal limit
+#     becomes a Loop, which compares the variable against the constant
+#     itself instead of evaluating a Binary.
+#   Both keep the nodes they replace (`target`, `original`), so an engine
+#   that has no use for the fused form can run those instead.
+#
+# Resolution is stored on the nodes themselves, so nodes the engines still
+#   see keep it; nodes that were folded away simply never get looked at.
+
+_UPDATE_OPERATORS = [TokenType.PLUS, TokenType.MINUS, TokenType.STAR, TokenType.SLASH]
+_LOOP_COMPARISONS = [TokenType.GREATER, TokenType.GREATER_EQUAL, TokenType.LESS, TokenType.LESS_EQUAL]
+
+class Optimizer(ast.expr.ExprVisitor, ast.stmt.StmtVisitor):
+    def __init__(self, assigned: set[object]) -> None:
+        # declaring nodes of the locals the Resolver saw being assigned
+        self._assigned = assigned
+        # one dict per local scope, mapping a name to the Literal it is
+        #   known to hold, or None when it isn't a constant
+        self._scopes: list[dict[str,ast.expr.Literal|None]] = []
+
+    def optimize(self, statements: list[ast.stmt.Stmt]) -> list[ast.stmt.Stmt]:
+        optimized = []
+        for statement in statements:
+            statement = statement.accept(self)
+            if statement != None:
+                optimized.append(statement)
+                if isinstance(statement, ast.stmt.Return):
+                    break
+        return optimized
+
+    def _optimize_branch(self, stmt: ast.stmt.Stmt) -> ast.stmt.Stmt:
+        # a branch or loop body has to stay a statement
+        stmt = stmt.accept(self)
+        if stmt == None:
+            return ast.stmt.Block([])
+        return stmt
+
+    def _expr(self, expr: ast.expr.Expr) -> ast.expr.Expr:
+        return expr.accept(self)
+
+    def _declare(self, name: str, value: ast.expr.Literal|None = None):
+        if len(self._scopes) > 0:
+            self._scopes[-1][name] = value
+
+    def _optimize_function(self, function: ast.stmt.Function):
+        self._scopes.append({})
+        for param in function.params:
+            self._declare(param.lexeme)
+        function.body = self.optimize(function.body)
+        self._scopes.pop()
+
+    def visit_block_stmt(self, stmt: ast.stmt.Block):
+        self._scopes.append({})
+        stmt.statements = self.optimize(stmt.statements)
+        self._scopes.pop()
+        return stmt
+
+    def visit_class_stmt(self, stmt: ast.stmt.Class):
+        self._declare(stmt.name.lexeme)
+        for method in stmt.methods:
+            self._optimize_function(method)
+        return stmt
+
+    def visit_expression_stmt(self, stmt: ast.stmt.Expression):
+        stmt.expression = self._expr(stmt.expression)
+        if isinstance(stmt.expression, ast.expr.Literal):
+            return None
+        return stmt
+
+    def visit_function_stmt(self, stmt: ast.stmt.Function):
+        self._declare(stmt.name.lexeme)
+        self._optimize_function(stmt)
+        return stmt
+
+    def visit_if_stmt(self, stmt: ast.stmt.If):
+        stmt.condition = self._expr(stmt.condition)
+        if isinstance(stmt.condition, ast.expr.Literal):
+            if is_truthy(stmt.condition.value):
+                return stmt.then_branch.accept(self)
+            if stmt.else_branch:
+                return stmt.else_branch.accept(self)
+            return None
+
+        stmt.then_branch = self._optimize_branch(stmt.then_branch)
+        if stmt.else_branch:
+            stmt.else_branch = self._optimize_branch(stmt.else_branch)
+        return stmt
+
+    def visit_print_stmt(self, stmt: ast.stmt.Print):
+        stmt.expression = self._expr(stmt.expression)
+        return stmt
+
+    def visit_return_stmt(self, stmt: ast.stmt.Return):
+        if stmt.value:
+            stmt.value = self._expr(stmt.value)
+        return stmt
+
+    def visit_var_stmt(self, stmt: ast.stmt.Var):
+        if stmt.initializer:
+            stmt.initializer = self._expr(stmt.initializer)
+        constant = None
+        if stmt not in self._assigned:
+            if stmt.initializer == None:
+                constant = ast.expr.Literal(None)
+            elif isinstance(stmt.initializer, ast.expr.Literal):
+                constant = stmt.initializer
+        self._declare(stmt.name.lexeme, constant)
+        return stmt
+
+    def visit_while_stmt(self, stmt: ast.stmt.While):
+        stmt.condition = self._expr(stmt.condition)
+        if isinstance(stmt.condition, ast.expr.Literal) and not is_truthy(stmt.condition.value):
+            return None
+        stmt.body = self._optimize_branch(stmt.body)
+
+        condition = stmt.condition
+        if (isinstance(condition, ast.expr.Binary) and condition.operator.type in _LOOP_COMPARISONS
+                and isinstance(condition.left, ast.expr.Variable)
+                and isinstance(condition.right, ast.expr.Literal) and type(condition.right.value) == float):
+            return ast.stmt.Loop(condition.left, condition.operator, condition.right, stmt.body, stmt)
+        return stmt
+
+    def visit_loop_stmt(self, stmt: ast.stmt.Loop):
+        return stmt
+
+    def visit_assign_expr(self, expr: ast.expr.Assign):
+        expr.value = self._expr(expr.value)
+
+        value = expr.value
+        if (isinstance(value, ast.expr.Binary) and value.operator.type in _UPDATE_OPERATORS
+                and isinstance(value.left, ast.expr.Variable) and value.left.name.lexeme == expr.name.lexeme):
+            return ast.expr.Update(expr, value.left, value.operator, value.right)
+        return expr
+
+    def visit_binary_expr(self, expr: ast.expr.Binary):
+        expr.left = self._expr(expr.left)
+        expr.right = self._expr(expr.right)
+        if not isinstance(expr.left, ast.expr.Literal) or not isinstance(expr.right, ast.expr.Literal):
+            return expr
+
+        left = expr.left.value
+        right = expr.right.value
+        numbers = type(left) == float and type(right) == float
+        match expr.operator.type:
+            case TokenType.BANG_EQUAL:
+                return ast.expr.Literal(not is_equal(left, right))
+            case TokenType.EQUAL_EQUAL:
+                return ast.expr.Literal(is_equal(left, right))
+            case TokenType.PLUS if numbers or (type(left) == str and type(right) == str):
+                return ast.expr.Literal(left + right)
+            case TokenType.MINUS if numbers:
+                return ast.expr.Literal(left - right)
+            case TokenType.STAR if numbers:
+                return ast.expr.Literal(left * right)
+            case TokenType.SLASH if numbers and right != 0.0:
+                return ast.expr.Literal(left / right)
+            case TokenType.GREATER if numbers:
+                return ast.expr.Literal(left > right)
+            case TokenType.GREATER_EQUAL if numbers:
+                return ast.expr.Literal(left >= right)
+            case TokenType.LESS if numbers:
+                return ast.expr.Literal(left < right)
+            case TokenType.LESS_EQUAL if numbers:
+                return ast.expr.Literal(left <= right)
+        return expr
+
+    def visit_call_expr(self, expr: ast.expr.Call):
+        expr.callee = self._expr(expr.callee)
+        expr.arguments = [self._expr(argument) for argument in expr.arguments]
+        return expr
+
+    def visit_get_expr(self, expr: ast.expr.Get):
+        expr.obj = self._expr(expr.obj)
+        return expr
+
+    def visit_grouping_expr(self, expr: ast.expr.Grouping):
+        return self._expr(expr.expression)
+
+    def visit_literal_expr(self, expr: ast.expr.Literal):
+        return expr
+
+    def visit_logical_expr(self, expr: ast.expr.Logical):
+        expr.left = self._expr(expr.left)
+        expr.right = self._expr(expr.right)
+        if not isinstance(expr.left, ast.expr.Literal):
+            return expr
+
+        if expr.operator.type == TokenType.OR:
+            short_circuits = is_truthy(expr.left.value)
+        else:
+            short_circuits = not is_truthy(expr.left.value)
+        if short_circuits:
+            return expr.left
+        return expr.right
+
+    def visit_set_expr(self, expr: ast.expr.Set):
+        expr.obj = self._expr(expr.obj)
+        expr.value = self._expr(expr.value)
+        return expr
+
+    def visit_super_expr(self, expr: ast.expr.Super):
+        return expr
+
+    def visit_this_expr(self, expr: ast.expr.This):
+        return expr
+
+    def visit_unary_expr(self, expr: ast.expr.Unary):
+        expr.right = self._expr(expr.right)
+        if not isinstance(expr.right, ast.expr.Literal):
+            return expr
+
+        right = expr.right.value
+        match expr.operator.type:
+            case TokenType.BANG:
+                return ast.expr.Literal(not is_truthy(right))
+            case TokenType.MINUS if type(right) == float:
+                return ast.expr.Literal(-right)
+        return expr
+
+    def visit_update_expr(self, expr: ast.expr.Update):
+        return expr
+
+    def visit_variable_expr(self, expr: ast.expr.Variable):
+        for scope in reversed(self._scopes):
+            if expr.name.lexeme in scope:
+                constant = scope[expr.name.lexeme]
+                if constant == None:
+                    return expr
+                return ast.expr.Literal(constant.value)
+        return expr
@@ -1,4 +1,5 @@
 from __future__ import annotations
+from typing import Iterable
 
 from .lox import Lox
 from . import ast
@@ -11,19 +12,34 @@ class Parser:
             self.token = token
             self.message = message
 
-    def __init__(self, tokens: list[Token]) -> None:
-        self._tokens = tokens
-        self._current: int = 0
+    def __init__(self, tokens: Iterable[Token]) -> None:
+        # only the current token and the one before it are ever looked at,
+        #   so the tokens can come straight from `Scanner.tokens`
+        self._tokens = iter(tokens)
+        self._next: Token = next(self._tokens)
+        self._last: Token|None = None
+        # reported once the scanner is done, so that all of its errors
+        #   come first, as when it used to finish before parsing started
+        self._errors: list[tuple[Token,str]] = []
 
 
     def parse(self) -> list[ast.stmt.Stmt]:
         statements: list[ast.stmt.Stmt] = []
 
-        while not self._is_at_end():
-            statements.append(self._declaration())
+        try:
+            while not self._is_at_end():
+                statements.append(self._declaration())
+        finally:
+            for _ in self._tokens:
+                pass
+            for token, message in self._errors:
+                Lox.error(token, message)
 
         return statements
 
+    def _report(self, token: Token, message: str):
+        self._errors.append((token, message))
+
     def _expression(self) -> ast.expr.Expr:
         return self._assignment()
 
@@ -40,7 +56,7 @@ class Parser:
             elif isinstance(expr, ast.expr.Get):
                 return ast.expr.Set(expr.obj, expr.name, value)
 
-            Lox.error(equals, "Invalid assignment target.")
+            self._report(equals, "Invalid assignment target.")
 
         return expr
 
@@ -74,7 +90,7 @@ class Parser:
                 return self._var_declaration()
             return self._statement()
         except Parser.ParseError as pe:
-            Lox.error(pe.token, pe.message)
+            self._report(pe.token, pe.message)
             self._synchronize()
             return None
 
@@ -202,7 +218,7 @@ class Parser:
         if not self._check(TokenType.RIGHT_PAREN):
             while True:
                 if len(parameters) >= 255:
-                    Lox.error(self._peek(), "Can't have more than 255 parameters.")
+                    self._report(self._peek(), "Can't have more than 255 parameters.")
                 parameters.append(self._consume(TokenType.IDENTIFIER, "Expect parameter name."))
                 if not self._match(TokenType.COMMA):
                     break
@@ -274,7 +290,7 @@ class Parser:
         if not self._check(TokenType.RIGHT_PAREN):
             while True:
                 if len(arguments) >= 255:
-                    Lox.error(self._peek(), "Can't have more than 255 arguments.")
+                    self._report(self._peek(), "Can't have more than 255 arguments.")
                 arguments.append(self._expression())
                 if not self._match(TokenType.COMMA):
                     break
@@ -348,17 +364,18 @@ class Parser:
 
     def _advance(self):
         if not self._is_at_end():
-            self._current += 1
+            self._last = self._next
+            self._next = next(self._tokens)
         return self._previous()
 
     def _is_at_end(self) -> bool:
         return self._peek().type == TokenType.EOF
 
     def _peek(self) -> Token:
-        return self._tokens[self._current]
+        return self._next
 
     def _previous(self) -> Token:
-        return self._tokens[self._current - 1]
+        return self._last
 
     def _error(self, token: Token, message: str) -> Parser.ParseError:
         return Parser.ParseError(token, message)
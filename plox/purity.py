@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+from . import ast
+
+# Finds the top-level functions whose result depends on nothing but their
+#   arguments, and which do nothing but produce it, and marks them `pure`
+#   for the engines to memoize (--memoize). A pure function:
+#   - doesn't print, and doesn't declare functions or classes of its own
+#   - touches no instance (`this`, `super`, property gets and sets)
+#   - assigns only its own locals, and reads no global except other
+#     top-level functions
+#   - calls only top-level functions by name, and those have to be pure
+#     too; natives like clock() aren't
+#   Any top-level function name that's declared more than once, shares its
+#   name with a global variable or class, or gets assigned anywhere can't
+#   be relied on to mean the same function at every call, so neither it
+#   nor anything that calls it is pure.
+#
+# It runs over the whole program at once after the Optimizer, so it can't
+#   work line by line at the prompt, where a later line may redeclare a
+#   global.
+
+class _Purity(ast.expr.ExprVisitor, ast.stmt.StmtVisitor):
+    # checks one function body, collecting the top-level functions it
+    #   refers to
+    def __init__(self, function: ast.stmt.Function, candidates: dict[str,ast.stmt.Function]) -> None:
+        self._candidates = candidates
+        self._scopes: list[set[str]] = [set(param.lexeme for param in function.params)]
+        self.pure = True
+        self.references: set[str] = set()
+        self._check(function.body)
+
+    def _check(self, target: list[ast.stmt.Stmt]|ast.stmt.Stmt|ast.expr.Expr):
+        if type(target) == list:
+            for node in target:
+                self._check(node)
+        elif self.pure:
+            target.accept(self)
+
+    def _is_local(self, name: str) -> bool:
+        for scope in self._scopes:
+            if name in scope:
+                return True
+        return False
+
+    def _reference(self, name: str):
+        if self._is_local(name):
+            return
+        if name in self._candidates:
+            self.references.add(name)
+        else:
+            self.pure = False
+
+    def visit_block_stmt(self, stmt: ast.stmt.Block):
+        self._scopes.append(set())
+        self._check(stmt.statements)
+        self._scopes.pop()
+
+    def visit_class_stmt(self, stmt: ast.stmt.Class):
+        self.pure = False
+
+    def visit_expression_stmt(self, stmt: ast.stmt.Expression):
+        self._check(stmt.expression)
+
+    def visit_function_stmt(self, stmt: ast.stmt.Function):
+        self.pure = False
+
+    def visit_if_stmt(self, stmt: ast.stmt.If):
+        self._check(stmt.condition)
+        self._check(stmt.then_branch)
+        if stmt.else_branch:
+            self._check(stmt.else_branch)
+
+    def visit_loop_stmt(self, stmt: ast.stmt.Loop):
+        self._check(stmt.original)
+
+    def visit_print_stmt(self, stmt: ast.stmt.Print):
+        self.pure = False
+
+    def visit_return_stmt(self, stmt: ast.stmt.Return):
+        if stmt.value:
+            self._check(stmt.value)
+
+    def visit_var_stmt(self, stmt: ast.stmt.Var):
+        if stmt.initializer:
+            self._check(stmt.initializer)
+        self._scopes[-1].add(stmt.name.lexeme)
+
+    def visit_while_stmt(self, stmt: ast.stmt.While):
+        self._check(stmt.condition)
+        self._check(stmt.body)
+
+    def visit_assign_expr(self, expr: ast.expr.Assign):
+        self._check(expr.value)
+        if not self._is_local(expr.name.lexeme):
+            self.pure = False
+
+    def visit_binary_expr(self, expr: ast.expr.Binary):
+        self._check(expr.left)
+        self._check(expr.right)
+
+    def visit_call_expr(self, expr: ast.expr.Call):
+        if not isinstance(expr.callee, ast.expr.Variable) or self._is_local(expr.callee.name.lexeme):
+            self.pure = False
+            return
+        self._check(expr.callee)
+        self._check(expr.arguments)
+
+    def visit_get_expr(self, expr: ast.expr.Get):
+        self.pure = False
+
+    def visit_grouping_expr(self, expr: ast.expr.Grouping):
+        self._check(expr.expression)
+
+    def visit_literal_expr(self, expr: ast.expr.Literal):
+        pass
+
+    def visit_logical_expr(self, expr: ast.expr.Logical):
+        self._check(expr.left)
+        self._check(expr.right)
+
+    def visit_set_expr(self, expr: ast.expr.Set):
+        self.pure = False
+
+    def visit_super_expr(self, expr: ast.expr.Super):
+        self.pure = False
+
+    def visit_this_expr(self, expr: ast.expr.This):
+        self.pure = False
+
+    def visit_unary_expr(self, expr: ast.expr.Unary):
+        self._check(expr.right)
+
+    def visit_update_expr(self, expr: ast.expr.Update):
+        self._check(expr.target)
+
+    def visit_variable_expr(self, expr: ast.expr.Variable):
+        self._reference(expr.name.lexeme)
+
+def mark_pure(statements: list[ast.stmt.Stmt], assigned_globals: set[str]):
+    declared: dict[str,int] = {}
+    functions: dict[str,ast.stmt.Function] = {}
+    for statement in statements:
+        if isinstance(statement, (ast.stmt.Var, ast.stmt.Class, ast.stmt.Function)):
+            name = statement.name.lexeme
+            declared[name] = declared.get(name, 0) + 1
+            if isinstance(statement, ast.stmt.Function):
+                functions[name] = statement
+
+    candidates = {
+        name: function for name, function in functions.items()
+        if declared[name] == 1 and name not in assigned_globals
+    }
+    references: dict[str,set[str]] = {}
+    for name, function in candidates.items():
+        purity = _Purity(function, candidates)
+        if purity.pure:
+            references[name] = purity.references
+
+    # drop whatever refers to a function that isn't pure until nothing does
+    changed = True
+    while changed:
+        changed = False
+        for name in list(references):
+            if not references[name] <= references.keys():
+                del references[name]
+                changed = True
+
+    for name in references:
+        candidates[name].pure = True
@@ -1,66 +1,157 @@
+from __future__ import annotations
 from enum import Enum
 
 from .lox import Lox
 from . import ast
 from .token import Token
 from .interpreter import Interpreter
+from .environment import VariableKind
 
 FunctionType = Enum("FunctionType", ["NONE", "FUNCTION", "METHOD", "INITIALIZER"])
 ClassType = Enum("ClassType", ["NONE", "CLASS", "SUBCLASS"])
 
+class _Local:
+    # `key` is the node that declares it (None for parameters and `this`,
+    #   which the engines place without being told)
+    def __init__(self, key: object, slot: int, function: _FunctionScope) -> None:
+        self.key = key
+        self.slot = slot
+        self.function = function
+        self.captured = False
+        self.uses: list[object] = []
+
+class _FunctionScope:
+    # Frame layout for one function (or the top-level script): every local
+    #   gets a slot in its function's frame, reused once its block ends, and
+    #   each variable it borrows from an enclosing function gets an upvalue.
+    def __init__(self, enclosing: _FunctionScope|None) -> None:
+        self.enclosing = enclosing
+        self.next_slot = 0
+        self.frame_size = 0
+        self.upvalues: list[tuple[bool,int]] = []
+        self.upvalue_indices: dict[_Local,int] = {}
+        # how deeply statements and expressions nest in its body, for the
+        #   engines that walk them on the Python stack
+        self.depth = 0
+        self.nesting = 0
+
 class Resolver(ast.expr.ExprVisitor, ast.stmt.StmtVisitor):
     def __init__(self, interpreter: Interpreter) -> None:
         self._interpreter = interpreter
         self._scopes: list[dict[str,bool]] = []
+        self._locals: list[dict[str,_Local]] = []
+        self._function_scope = _FunctionScope(None)
         self._current_function = FunctionType.NONE
         self._current_class = ClassType.NONE
+        # declaring nodes of locals that are the target of an assignment
+        self.assigned: set[object] = set()
+        # names of the globals that are the target of an assignment
+        self.assigned_globals: set[str] = set()
 
     def resolve(self, target: list[ast.stmt.Stmt]|ast.stmt.Stmt|ast.expr.Expr):
         if type(target) == list:
             for statement in target:
                 self.resolve(statement)
-        elif isinstance(target, ast.stmt.Stmt):
-            target.accept(self)
-        elif isinstance(target, ast.expr.Expr):
+        elif isinstance(target, (ast.stmt.Stmt, ast.expr.Expr)):
+            scope = self._function_scope
+            scope.depth += 1
+            if scope.depth > scope.nesting:
+                scope.nesting = scope.depth
             target.accept(self)
+            scope.depth -= 1
 
     def _resolve_function(self, function: ast.stmt.Function, ft: FunctionType):
         enclosing_function = self._current_function
         self._current_function = ft
+        self._function_scope = _FunctionScope(self._function_scope)
 
         self._begin_scope()
+        if ft in [FunctionType.METHOD, FunctionType.INITIALIZER]:
+            self._declare_implicit("this", None)
         for param in function.params:
-            self._declare(param)
+            self._declare(param, None)
             self._define(param)
+        parameters = list(self._locals[-1].values())
         self.resolve(function.body)
+        # captured parameters (and `this`) arrive unboxed and get wrapped on entry
+        boxed = [local.slot for local in parameters if local.captured]
         self._end_scope()
 
+        scope = self._function_scope
+        self._interpreter.resolve_function(function, scope.frame_size, scope.upvalues, boxed, scope.nesting)
+        self._function_scope = scope.enclosing
         self._current_function = enclosing_function
 
     def _begin_scope(self):
         self._scopes.append({})
+        self._locals.append({})
 
     def _end_scope(self):
         self._scopes.pop()
-
-    def _declare(self, name: Token):
+        # a local can only be captured while its scope is open, so only now
+        #   is it known whether its uses need to go through a Cell
+        locals = self._locals.pop()
+        for local in locals.values():
+            if local.key != None:
+                self._interpreter.declare(local.key, local.slot, local.captured)
+            kind = VariableKind.CELL if local.captured else VariableKind.LOCAL
+            for use in local.uses:
+                self._interpreter.resolve(use, kind, local.slot)
+        self._function_scope.next_slot -= len(locals)
+
+        if self._function_scope.enclosing == None:
+            self._interpreter.resolve_function(None, self._function_scope.frame_size, [], [], self._function_scope.nesting)
+
+    def _add_local(self, name: str, key: object):
+        function = self._function_scope
+        self._locals[-1][name] = _Local(key, function.next_slot, function)
+        function.next_slot += 1
+        function.frame_size = max(function.frame_size, function.next_slot)
+
+    def _declare(self, name: Token, key: object):
         if len(self._scopes) == 0:
             return
         scope = self._scopes[-1]
         if name.lexeme in scope:
             Lox.error(name, "Already a variable with this name in this scope.")
+        else:
+            self._add_local(name.lexeme, key)
         scope[name.lexeme] = False
 
+    def _declare_implicit(self, name: str, key: object):
+        self._scopes[-1][name] = True
+        self._add_local(name, key)
+
     def _define(self, name: Token):
         if len(self._scopes) == 0:
             return
         self._scopes[-1][name.lexeme] = True
 
-    def _resolve_local(self, expr: ast.expr.Expr, name: Token):
-        for i in range(len(self._scopes)-1, -1, -1):
-            if name.lexeme in self._scopes[i]:
-                self._interpreter.resolve(expr, len(self._scopes) - 1 - i)
+    def _upvalue(self, function: _FunctionScope, local: _Local) -> int:
+        if local in function.upvalue_indices:
+            return function.upvalue_indices[local]
+        if function.enclosing is local.function:
+            function.upvalues.append((True, local.slot))
+        else:
+            function.upvalues.append((False, self._upvalue(function.enclosing, local)))
+        function.upvalue_indices[local] = len(function.upvalues) - 1
+        return len(function.upvalues) - 1
+
+    def _resolve_local(self, expr: object, name: str):
+        for i in range(len(self._locals)-1, -1, -1):
+            if name in self._locals[i]:
+                local = self._locals[i][name]
+                if isinstance(expr, ast.expr.Assign):
+                    self.assigned.add(local.key)
+                if local.function is self._function_scope:
+                    local.uses.append(expr)
+                else:
+                    local.captured = True
+                    self._interpreter.resolve(expr, VariableKind.UPVALUE, self._upvalue(self._function_scope, local))
                 return
+        if isinstance(expr, ast.expr.Assign):
+            self.assigned_globals.add(name)
+        self._interpreter.resolve_global(expr, name)
 
     def visit_block_stmt(self, stmt: ast.stmt.Block):
         self._begin_scope()
@@ -71,7 +162,7 @@ class Resolver(ast.expr.ExprVisitor, ast.stmt.StmtVisitor):
         enclosing_class = self._current_class
         self._current_class = ClassType.CLASS
 
-        self._declare(stmt.name)
+        self._declare(stmt.name, stmt)
         self._define(stmt.name)
 
         if stmt.superclass != None and stmt.name.lexeme == stmt.superclass.name.lexeme:
@@ -83,10 +174,7 @@ class Resolver(ast.expr.ExprVisitor, ast.stmt.StmtVisitor):
 
         if stmt.superclass != None:
             self._begin_scope()
-            self._scopes[-1]["super"] = True
-
-        self._begin_scope()
-        self._scopes[-1]["this"] = True
+            self._declare_implicit("super", stmt.superclass)
 
         for method in stmt.methods:
             declaration = FunctionType.METHOD
@@ -94,8 +182,6 @@ class Resolver(ast.expr.ExprVisitor, ast.stmt.StmtVisitor):
                 declaration = FunctionType.INITIALIZER
             self._resolve_function(method, declaration)
 
-        self._end_scope()
-
         if stmt.superclass != None:
             self._end_scope()
 
@@ -105,7 +191,7 @@ class Resolver(ast.expr.ExprVisitor, ast.stmt.StmtVisitor):
         self.resolve(stmt.expression)
 
     def visit_function_stmt(self, stmt: ast.stmt.Function):
-        self._declare(stmt.name)
+        self._declare(stmt.name, stmt)
         self._define(stmt.name)
         self._resolve_function(stmt, FunctionType.FUNCTION)
 
@@ -127,7 +213,7 @@ class Resolver(ast.expr.ExprVisitor, ast.stmt.StmtVisitor):
             self.resolve(stmt.value)
 
     def visit_var_stmt(self, stmt: ast.stmt.Var):
-        self._declare(stmt.name)
+        self._declare(stmt.name, stmt)
         if stmt.initializer:
             self.resolve(stmt.initializer)
         self._define(stmt.name)
@@ -136,9 +222,12 @@ class Resolver(ast.expr.ExprVisitor, ast.stmt.StmtVisitor):
         self.resolve(stmt.condition)
         self.resolve(stmt.body)
 
+    def visit_loop_stmt(self, stmt: ast.stmt.Loop):
+        self.resolve(stmt.original)
+
     def visit_assign_expr(self, expr: ast.expr.Assign):
         self.resolve(expr.value)
-        self._resolve_local(expr, expr.name)
+        self._resolve_local(expr, expr.name.lexeme)
 
     def visit_binary_expr(self, expr: ast.expr.Binary):
         self.resolve(expr.left)
@@ -172,20 +261,26 @@ class Resolver(ast.expr.ExprVisitor, ast.stmt.StmtVisitor):
         elif self._current_class != ClassType.SUBCLASS:
             Lox.error(expr.keyword, "Can't use 'super' in a class with no superclass.")
 
-        self._resolve_local(expr, expr.keyword)
+        self._resolve_local(expr, "super")
+        # the `this` it binds the method to, resolved like any other
+        expr.this = ast.expr.This(expr.keyword)
+        self._resolve_local(expr.this, "this")
 
     def visit_this_expr(self, expr: ast.expr.This):
         if self._current_class == ClassType.NONE:
             Lox.error(expr.keyword, "Can't use 'this' outside of a class.")
             return
-        self._resolve_local(expr, expr.keyword)
+        self._resolve_local(expr, "this")
 
     def visit_unary_expr(self, expr: ast.expr.Unary):
         self.resolve(expr.right)
 
+    def visit_update_expr(self, expr: ast.expr.Update):
+        self.resolve(expr.target)
+
     def visit_variable_expr(self, expr: ast.expr.Variable):
         if len(self._scopes) != 0 and self._scopes[-1].get(expr.name.lexeme) == False:
             Lox.error(expr.name, "Can't read local variable in its own initializer.")
-        self._resolve_local(expr, expr.name)
+        self._resolve_local(expr, expr.name.lexeme)
 
 
@@ -1,4 +1,24 @@
 
-class LoxReturn(RuntimeError):
+class LoxReturn:
+    # Not raised: a statement that executes a `return` hands this back as
+    #   its result, and every enclosing statement passes it up unchanged
+    #   until the Function.call that's running the body unwraps it.
+    __slots__ = ("value",)
+
     def __init__(self, value: object) -> None:
         self.value = value
+
+class TailCall:
+    # What `return f(...)` hands back when `f` is a Lox function: rather
+    #   than calling it from inside the returning body, the Function running
+    #   that body makes the call itself once the body's frame is done with,
+    #   so a chain of tail calls runs in constant stack. A call to a
+    #   memoized function carries the (Memo, key) its result belongs under,
+    #   for the Function to store once the chain has one.
+    __slots__ = ("function", "this", "arguments", "memo")
+
+    def __init__(self, function, this: object, arguments: list[object], memo: tuple|None = None) -> None:
+        self.function = function
+        self.this = this
+        self.arguments = arguments
+        self.memo = memo
@@ -0,0 +1,433 @@
+from __future__ import annotations
+from collections import OrderedDict
+import functools
+import math
+import re
+import sys
+import threading
+import time
+
+from .lox import Lox, LoxRuntimeError, reserve_stack
+from .token import Token, TokenType
+from .callable import Callable
+from .klass import LoxClass, LoxInstance
+from .ret import LoxReturn, TailCall
+
+# Lox value semantics shared by every execution backend, plus the small
+#   support library that programs transpiled to Python (--emit-py) import.
+
+def stringify(obj: object) -> str:
+    if obj == None:
+        return "nil"
+    if type(obj) == float:
+        if obj.is_integer():
+            if obj == 0.0:
+                # special case to pass jlox test suite
+                #   (mimicking Java behavior with negative zero)
+                if math.copysign(1.0, obj) == -1.0:
+                    return "-0"
+                else:
+                    return "0"
+            return str(int(obj))
+    if type(obj) == bool:
+        return str(obj).lower()
+    return str(obj)
+
+def is_truthy(obj: object) -> bool:
+    if obj == None:
+        return False
+    if type(obj) == bool:
+        return obj
+    return True
+
+def is_equal(a, b) -> bool:
+    if a == None and b == None:
+        return True
+    if a == None:
+        return False
+    if type(a) == bool and type(b) != bool:
+        return False
+    if type(b) == bool and type(a) != bool:
+        return False
+    return a == b
+
+# Lines `print`ed before an Output writes them out
+BUFFER_LINES = 4096
+
+class Output:
+    # Where `print` goes. Lines are collected and written out together once
+    #   there are BUFFER_LINES of them, or after every one when
+    #   `line_buffered` (at the prompt); the engines flush whatever is left
+    #   when a program finishes, and before reporting a runtime error so
+    #   the two come out in order. `sink` is anything with a `write`
+    #   method, or a callable that takes the text; None means whatever
+    #   sys.stdout is at the time.
+    def __init__(self, sink: object = None, line_buffered: bool = False) -> None:
+        self.sink = sink
+        self.line_buffered = line_buffered
+        self._lines: list[str] = []
+
+    def print(self, text: str):
+        lines = self._lines
+        lines.append(text)
+        if self.line_buffered or len(lines) >= BUFFER_LINES:
+            self.flush()
+
+    def flush(self):
+        if len(self._lines) == 0:
+            return
+        self._lines.append("")
+        text = "\n".join(self._lines)
+        self._lines = []
+
+        sink = sys.stdout if self.sink == None else self.sink
+        if hasattr(sink, "write"):
+            sink.write(text)
+            if hasattr(sink, "flush"):
+                sink.flush()
+        else:
+            sink(text)
+
+class ClockFunction(Callable):
+    def arity(self) -> int:
+        return 0
+
+    def call(self, interpreter, arguments: list[object]) -> object:
+        return time.time()
+
+    def __str__(self):
+        return "<native fn>"
+
+# Memoization of the functions the purity pass (--memoize) proved can't
+#   observe or change anything but their arguments: results are kept per
+#   argument tuple, least recently used first out once there are MEMO_SIZE
+#   of them. Only numbers and strings make a key; anything else (and the
+#   floats that compare equal to something they don't behave like, -0 and
+#   NaN) just makes the call.
+MEMO_SIZE = 1 << 16
+MISSING = object()
+
+def memo_key(arguments) -> tuple|None:
+    for argument in arguments:
+        if type(argument) == float:
+            if argument != argument or (argument == 0.0 and math.copysign(1.0, argument) == -1.0):
+                return None
+        elif type(argument) != str:
+            return None
+    return tuple(arguments)
+
+class Memo:
+    __slots__ = ("_results",)
+
+    def __init__(self) -> None:
+        self._results: OrderedDict[tuple,object] = OrderedDict()
+
+    def get(self, key: tuple) -> object:
+        result = self._results.get(key, MISSING)
+        if result is not MISSING:
+            self._results.move_to_end(key)
+        return result
+
+    def put(self, key: tuple, result: object):
+        self._results[key] = result
+        if len(self._results) > MEMO_SIZE:
+            self._results.popitem(last=False)
+
+def store_results(memos: list[tuple[Memo,tuple]], result: object):
+    # the result of a chain of tail calls is the result of every call in it
+    for memo, key in memos:
+        memo.put(key, result)
+
+class Memoized(Callable):
+    def __init__(self, function: Callable) -> None:
+        self._function = function
+        self._memo = Memo()
+
+    def arity(self) -> int:
+        return self._function.arity()
+
+    def call(self, interpreter, arguments: list[object]) -> object:
+        key = memo_key(arguments)
+        if key == None:
+            return self._function.call(interpreter, arguments)
+        result = self._memo.get(key)
+        if result is MISSING:
+            result = self._function.call(interpreter, arguments)
+            self._memo.put(key, result)
+        return result
+
+    def tail_call(self, arguments: list[object]) -> LoxReturn|TailCall:
+        # `return f(...)`: a result already known is returned, and anything
+        #   else is left to the trampoline like any tail call, with the key
+        #   to store the result under when it's done
+        key = memo_key(arguments)
+        if key == None:
+            return TailCall(self._function, self._function._this, arguments)
+        result = self._memo.get(key)
+        if result is not MISSING:
+            return LoxReturn(result)
+        return TailCall(self._function, self._function._this, arguments, (self._memo, key))
+
+    def __str__(self) -> str:
+        return str(self._function)
+
+
+### support for transpiled programs
+
+class Cell:
+    __slots__ = ("value",)
+
+    def __init__(self, value: object) -> None:
+        self.value = value
+
+    def set(self, value: object) -> object:
+        self.value = value
+        return value
+
+class PyFunction(Callable):
+    def __init__(self, fn, name: str, arity: int) -> None:
+        self._fn = fn
+        self._arity = arity
+        self.name = name
+
+    def bind(self, instance: LoxInstance):
+        return PyFunction(functools.partial(self._fn, instance), self.name, self._arity)
+
+    def invoke(self, interpreter, this: LoxInstance, arguments: list[object]) -> object:
+        return finish(self._fn(this, *arguments))
+
+    def arity(self) -> int:
+        return self._arity
+
+    def call(self, interpreter, arguments: list[object]) -> object:
+        return finish(self._fn(*arguments))
+
+    def __str__(self) -> str:
+        return f"<fn {self.name}>"
+
+def memoize(fn):
+    # Memoized for a transpiled function, which stays a PyFunction
+    memo = Memo()
+    def memoized(*arguments: object) -> object:
+        key = memo_key(arguments)
+        if key == None:
+            return fn(*arguments)
+        result = memo.get(key)
+        if result is MISSING:
+            result = finish(fn(*arguments))
+            memo.put(key, result)
+        return result
+    # for tail_call, which looks the result up itself
+    memoized.memo = memo
+    memoized.function = fn
+    return memoized
+
+# A transpiled `return f(...)` goes through tail_call or tail_invoke, which
+#   hand a transpiled function back as a TailCall (of the Python function,
+#   with the receiver, if any, as the first argument) instead of calling
+#   it; every helper that calls one finishes the chain, so tail calls run
+#   in constant stack the way they do on the other engines.
+def finish(result: object) -> object:
+    if type(result) != TailCall:
+        return result
+    memos = []
+    while type(result) == TailCall:
+        if result.memo != None:
+            memos.append(result.memo)
+        result = result.function(*result.arguments)
+    store_results(memos, result)
+    return result
+
+def call(callee: object, paren: Token, *arguments: object) -> object:
+    if type(callee) == PyFunction:
+        if len(arguments) != callee._arity:
+            raise LoxRuntimeError(paren, f"Expected {callee._arity} arguments but got {len(arguments)}.")
+        result = callee._fn(*arguments)
+        if type(result) == TailCall:
+            return finish(result)
+        return result
+    if type(callee) == LoxClass:
+        # `init` is called from here too, rather than through LoxClass.call
+        #   and PyFunction.invoke, to keep a Lox call to CALL_FRAMES
+        if len(arguments) != callee._arity:
+            raise LoxRuntimeError(paren, f"Expected {callee._arity} arguments but got {len(arguments)}.")
+        instance = LoxInstance(callee)
+        if callee._initializer:
+            callee._initializer._fn(instance, *arguments)
+        return instance
+
+    if not isinstance(callee, Callable):
+        raise LoxRuntimeError(paren, "Can only call functions and classes.")
+    if len(arguments) != callee.arity():
+        raise LoxRuntimeError(paren, f"Expected {callee.arity()} arguments but got {len(arguments)}.")
+    return callee.call(None, list(arguments))
+
+def tail_call(callee: object, paren: Token, *arguments: object) -> object:
+    if type(callee) != PyFunction:
+        return call(callee, paren, *arguments)
+    if len(arguments) != callee._arity:
+        raise LoxRuntimeError(paren, f"Expected {callee._arity} arguments but got {len(arguments)}.")
+    fn = callee._fn
+    memo = getattr(fn, "memo", None)
+    if memo == None:
+        return TailCall(fn, None, arguments)
+    key = memo_key(arguments)
+    if key == None:
+        return TailCall(fn.function, None, arguments)
+    result = memo.get(key)
+    if result is not MISSING:
+        return result
+    return TailCall(fn.function, None, arguments, (memo, key))
+
+def get_method(obj: object, name: Token) -> tuple[LoxInstance|None,object]:
+    # first half of a fused `obj.name(...)`: a (receiver, method) pair for
+    #   a method, or (None, value) when a field shadows it
+    if not isinstance(obj, LoxInstance):
+        raise LoxRuntimeError(name, "Only instances have properties.")
+    index = obj._shape.slots.get(name.lexeme)
+    if index != None:
+        return (None, obj._values[index])
+    method = obj._klass.find_method(name.lexeme)
+    if not method:
+        raise LoxRuntimeError(name, f"Undefined property '{name.lexeme}'.")
+    return (obj, method)
+
+def invoke(target: tuple[LoxInstance|None,object], paren: Token, *arguments: object) -> object:
+    receiver, method = target
+    if receiver == None:
+        return call(method, paren, *arguments)
+    if len(arguments) != method._arity:
+        raise LoxRuntimeError(paren, f"Expected {method._arity} arguments but got {len(arguments)}.")
+    result = method._fn(receiver, *arguments)
+    if type(result) == TailCall:
+        return finish(result)
+    return result
+
+def tail_invoke(target: tuple[LoxInstance|None,object], paren: Token, *arguments: object) -> object:
+    receiver, method = target
+    if receiver == None:
+        return tail_call(method, paren, *arguments)
+    if len(arguments) != method._arity:
+        raise LoxRuntimeError(paren, f"Expected {method._arity} arguments but got {len(arguments)}.")
+    return TailCall(method._fn, None, (receiver, *arguments))
+
+def get_property(obj: object, name: Token) -> object:
+    if isinstance(obj, LoxInstance):
+        return obj.get(name)
+    raise LoxRuntimeError(name, "Only instances have properties.")
+
+def check_instance(obj: object, name: Token) -> LoxInstance:
+    if isinstance(obj, LoxInstance):
+        return obj
+    raise LoxRuntimeError(name, "Only instances have fields.")
+
+def set_property(obj: LoxInstance, name: Token, value: object) -> object:
+    obj.set(name, value)
+    return value
+
+def get_super(superclass: LoxClass, obj: LoxInstance, method: Token) -> object:
+    found = superclass.find_method(method.lexeme)
+    if not found:
+        raise LoxRuntimeError(method, f"Undefined property '{method.lexeme}'.")
+    return found.bind(obj)
+
+def check_superclass(superclass: object, name: Token) -> LoxClass:
+    if isinstance(superclass, LoxClass):
+        return superclass
+    raise LoxRuntimeError(name, "Superclass must be a class.")
+
+def operand_error(operator: Token):
+    raise LoxRuntimeError(operator, "Operand must be a number.")
+
+def operands_error(operator: Token):
+    raise LoxRuntimeError(operator, "Operands must be numbers.")
+
+def add_error(operator: Token):
+    raise LoxRuntimeError(operator, "Operands must be two numbers or two strings.")
+
+def divide_error(left: object, right: object, operator: Token):
+    if type(left) == float and type(right) == float:
+        raise LoxRuntimeError(operator, "Cannot divide by zero.")
+    raise LoxRuntimeError(operator, "Operands must be numbers.")
+
+def undefined_variable(name: Token):
+    raise LoxRuntimeError(name, f"Undefined variable '{name.lexeme}'.")
+
+# Transpiled functions are plain Python functions with no call counter of
+#   their own, so a Lox call is a couple of Python frames (the `call` or
+#   `invoke` helper, then the function) and the depth limit is enforced,
+#   approximately, by Python's recursion limit.
+CALL_FRAMES = 3
+# The helpers go through C to get back into Python, which also uses the
+#   C stack; deep limits need more of it than the main thread has.
+C_STACK_PER_CALL = 1024
+MAIN_THREAD_STACK = 4 * 1024 * 1024
+
+def _call_on_stack(main):
+    size = Lox.max_depth * C_STACK_PER_CALL
+    if size <= MAIN_THREAD_STACK:
+        main()
+        return
+
+    failure = []
+    def target():
+        try:
+            main()
+        except BaseException as e:
+            failure.append(e)
+    previous = threading.stack_size(size + MAIN_THREAD_STACK)
+    try:
+        thread = threading.Thread(target=target)
+        thread.start()
+    finally:
+        threading.stack_size(previous)
+    thread.join()
+    if failure:
+        raise failure[0]
+
+def _lox_line(lines: dict[str,dict[int,int]], tb) -> int:
+    # the Lox line of the innermost generated frame in a traceback
+    line = 0
+    while tb:
+        line_map = lines.get(tb.tb_frame.f_code.co_filename)
+        if line_map != None:
+            line = line_map.get(tb.tb_lineno, line)
+        tb = tb.tb_next
+    return line
+
+def _global_name(pyname: str) -> str:
+    # the Lox name of a transpiled global: g_name, or gu_ with anything
+    #   but letters and digits spelled out as _hex_ code points
+    if pyname.startswith("g_"):
+        return pyname[2:]
+    return re.sub("_([0-9a-f]+)_", lambda point: chr(int(point.group(1), 16)), pyname[3:])
+
+def run(main, lines: dict[str,dict[int,int]], max_depth: int|None = None) -> int:
+    # Reads of undefined globals surface as Python NameErrors; `lines` maps
+    #   each generated file's lines back onto Lox lines so they can be
+    #   reported the same way the tree-walker would. Running out of Python
+    #   stack is the transpiled program's "Stack overflow.". Without a
+    #   `max_depth`, Lox.max_depth is left as it is (--max-depth, say).
+    if max_depth != None:
+        Lox.max_depth = max_depth
+    reserve_stack(CALL_FRAMES)
+    output: Output = main.__globals__["_output"]
+    try:
+        _call_on_stack(main)
+    except LoxRuntimeError as lre:
+        output.flush()
+        Lox.runtime_error(lre)
+    except NameError as ne:
+        if not ne.name or not ne.name.startswith(("g_", "gu_")):
+            raise
+        output.flush()
+        line = _lox_line(lines, ne.__traceback__)
+        name = Token(TokenType.IDENTIFIER, _global_name(ne.name), None, line)
+        Lox.runtime_error(LoxRuntimeError(name, f"Undefined variable '{name.lexeme}'."))
+    except RecursionError as re:
+        output.flush()
+        line = _lox_line(lines, re.__traceback__)
+        Lox.runtime_error(LoxRuntimeError(Token(TokenType.IDENTIFIER, "", None, line), "Stack overflow."))
+    finally:
+        output.flush()
+    return 70 if Lox.had_runtime_error else 0
@@ -1,6 +1,53 @@
+import re
+import sys
+from typing import Iterable, Iterator
+
 from .lox import Lox
 from .token import Token, TokenType
 
+# The scanner matches whole tokens at a time with one master pattern, one
+#   group per kind of lexeme, rather than stepping through the source a
+#   character at a time. It only covers ASCII: anything else lands in the
+#   catch-all group and is scanned the character-at-a-time way
+#   (`_scan_token`), so identifiers and numbers keep their Unicode-aware
+#   `isalpha`/`isnumeric` rules. (`\w` is exactly `isalnum()` or `_`, so
+#   identifiers that merely continue past ASCII still match here.)
+_TOKEN = re.compile(r"""
+    [ \r\t]*
+    (?:
+        ([A-Za-z]\w*)
+      | (//[^\n]*)
+      | ([(){},.\-+;*/]|[!=<>]=?)
+      | (\n)
+      | ([0-9]+(?:\.[0-9]+)?)
+      | ("[^"]*"?)
+      | (.)
+      | $
+    )
+""", re.VERBOSE | re.DOTALL)
+_IDENTIFIER, _COMMENT, _PUNCTUATION, _NEWLINE, _NUMBER, _STRING, _OTHER = range(1, 8)
+
+# each operator's type and the one string all its tokens share
+_OPERATORS: dict[str, tuple[TokenType,str]] = {
+    text: (tok_type, text) for text, tok_type in {
+        "(": TokenType.LEFT_PAREN, ")": TokenType.RIGHT_PAREN,
+        "{": TokenType.LEFT_BRACE, "}": TokenType.RIGHT_BRACE,
+        ",": TokenType.COMMA, ".": TokenType.DOT,
+        "-": TokenType.MINUS, "+": TokenType.PLUS,
+        ";": TokenType.SEMICOLON, "*": TokenType.STAR, "/": TokenType.SLASH,
+        "!": TokenType.BANG, "!=": TokenType.BANG_EQUAL,
+        "=": TokenType.EQUAL, "==": TokenType.EQUAL_EQUAL,
+        ">": TokenType.GREATER, ">=": TokenType.GREATER_EQUAL,
+        "<": TokenType.LESS, "<=": TokenType.LESS_EQUAL,
+    }.items()
+}
+
+def _continues_past_ascii(src: str, position: int) -> bool:
+    # whether a number matched up to `position` might take in more digits
+    #   that only `isnumeric` knows about
+    following = src[position:position + 2]
+    return following[:1] >= "\x80" or (following[:1] == "." and following[1:] >= "\x80")
+
 class Scanner:
     _keywords: dict[str, TokenType] = {
         "true": TokenType.TRUE,
@@ -21,7 +68,10 @@ class Scanner:
         "print": TokenType.PRINT,
     }
 
-    def __init__(self, src: str) -> None:
+    def __init__(self, src: str|Iterable[str]) -> None:
+        # `src` is the whole source, or the source in pieces that each end
+        #   with a newline (all but the last, at least), like `read_source`
+        #   hands out for big files
         self._src = src
         self._tokens: list[Token] = []
         self._start: int = 0
@@ -29,12 +79,73 @@ class Scanner:
         self._line: int = 1
 
     def _scan_tokens(self) -> list[Token]:
-        while not self._is_at_end():
-            self._start = self._current
-            self._scan_token()
+        return list(self.tokens())
+
+    def tokens(self) -> Iterator[Token]:
+        # The tokens one at a time as they're scanned, ending with EOF, for
+        #   the Parser to pull from without the whole list ever existing.
+        #   Nothing but a string can run past a newline, so the only thing
+        #   carried from one piece of the source to the next is a string
+        #   that hasn't been closed yet.
+        pieces = iter([self._src] if type(self._src) == str else self._src)
+        keyword = Scanner._keywords.get
+        identifier = TokenType.IDENTIFIER
+        intern = sys.intern
+        scanned = self._tokens
+        line = self._line
+        carried = ""
 
-        self._tokens.append(Token(TokenType.EOF, "", None, self._line))
-        return self._tokens
+        piece = next(pieces, None)
+        while piece != None:
+            following = next(pieces, None)
+            src = carried + piece
+            carried = ""
+            self._src = src
+            end = len(src)
+            position = 0
+
+            # runs through the matches in one go, starting over from
+            #   wherever `_scan_token` leaves off the few times it's needed
+            while position < end:
+                for found in _TOKEN.finditer(src, position):
+                    kind = found.lastindex
+                    if kind == _IDENTIFIER:
+                        text = intern(found.group(kind))
+                        yield Token(keyword(text, identifier), text, None, line)
+                    elif kind == _PUNCTUATION:
+                        tok_type, text = _OPERATORS[found.group(kind)]
+                        yield Token(tok_type, text, None, line)
+                    elif kind == _NEWLINE:
+                        line += 1
+                    elif kind == _NUMBER and not _continues_past_ascii(src, found.end()):
+                        text = found.group(kind)
+                        yield Token(TokenType.NUMBER, text, float(text), line)
+                    elif kind == _STRING:
+                        text = found.group(kind)
+                        if len(text) > 1 and text[-1] == "\"":
+                            line += text.count("\n")
+                            yield Token(TokenType.STRING, text, text[1:-1], line)
+                        elif following != None:
+                            carried = text
+                        else:
+                            line += text.count("\n")
+                            Lox.error(line, "Unterminated string.")
+                    elif kind == _OTHER or kind == _NUMBER:
+                        # not ASCII, or a number that might go on past it
+                        self._start = self._current = found.start(kind)
+                        self._line = line
+                        self._scan_token()
+                        yield from scanned
+                        scanned.clear()
+                        position = self._current
+                        line = self._line
+                        break
+                else:
+                    position = end
+            piece = following
+
+        self._line = line
+        yield Token(TokenType.EOF, "", None, line)
 
     def _scan_token(self):
         c = self._advance()
@@ -126,12 +237,12 @@ class Scanner:
         while self._peek()[0].isalnum() or self._peek()[0] == "_":
             self._advance()
 
-        text = self._src[self._start:self._current]
+        text = sys.intern(self._src[self._start:self._current])
         tok_type = Scanner._keywords.get(text)
         if not tok_type:
             tok_type = TokenType.IDENTIFIER
 
-        self._add_token(tok_type)
+        self._tokens.append(Token(tok_type, text, None, self._line))
 
     def _peek(self) -> str:
         if self._is_at_end():
@@ -0,0 +1,38 @@
+from __future__ import annotations
+import os
+import mmap
+import locale
+from typing import Iterator
+
+# Reading scripts in. Anything up to STREAM_THRESHOLD bytes is read whole,
+#   as always; bigger files are memory-mapped and handed to the Scanner a
+#   piece at a time instead, so the source never has to be in memory as
+#   one string on top of what's made from it. The pieces are decoded and
+#   have their newlines translated the way `open` in text mode would, and
+#   each one is cut after a newline, which is all the Scanner needs to
+#   pick up where the last one ended.
+
+STREAM_THRESHOLD = 1 << 24
+
+# the size pieces are cut at (give or take a line)
+PIECE_SIZE = 1 << 20
+
+def read_source(path: str) -> str|Iterator[str]:
+    if os.path.getsize(path) <= STREAM_THRESHOLD:
+        with open(path, "r") as source_file:
+            return source_file.read()
+    return _read_pieces(path)
+
+def _read_pieces(path: str) -> Iterator[str]:
+    encoding = locale.getpreferredencoding(False)
+    with open(path, "rb") as source_file, mmap.mmap(source_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        start = 0
+        end = len(mapped)
+        while start < end:
+            cut = mapped.find(b"\n", min(start + PIECE_SIZE, end) - 1)
+            stop = end if cut == -1 else cut + 1
+            piece = mapped[start:stop].decode(encoding)
+            if "\r" in piece:
+                piece = piece.replace("\r\n", "\n").replace("\r", "\n")
+            yield piece
+            start = stop
@@ -34,6 +34,12 @@ TokenType = Enum("TokenType", [
 ])
 
 class Token:
+    # There's one of these for every lexeme in the source and the AST holds
+    #   on to a good share of them, so they're slotted; the Scanner interns
+    #   identifier lexemes (and shares the operators'), so every use of a
+    #   name is the same string and dict lookups by it compare by identity.
+    __slots__ = ("type", "lexeme", "literal", "line")
+
     def __init__(self, tok_type: TokenType, lexeme: str, literal, line: int) -> None:
         self.type = tok_type
         self.lexeme = lexeme
@@ -0,0 +1,75 @@
+import sys
+import os
+import gc
+import io
+import time
+import tracemalloc
+
+# How much memory a large program's AST takes, and how long it takes to
+#   build and to walk. The program is generated: `count` copies of a
+#   function, a class, and a loop calling both, so that every kind of node
+#   shows up in the numbers.
+#
+#   python plox/tool/ast_benchmark.py [count]
+
+ROOT_PATH = os.path.realpath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, ROOT_PATH)
+
+from plox.lox import Lox
+from plox.frontend import compile_source
+from plox.interpreter import Interpreter
+from plox.runtime import Output
+
+def generate(count: int) -> str:
+    parts = []
+    for i in range(count):
+        parts.append(f"""
+fun f{i}(a, b) {{
+  var c = a * {i} + b;
+  if (c > 100 and !(a == b)) return c - 1;
+  return -c / 2;
+}}
+class C{i} {{
+  init(n) {{ this.n = n; }}
+  get() {{ return this.n + f{i}(this.n, 2); }}
+}}
+var t{i} = 0;
+for (var k = 0; k < 3; k = k + 1) {{
+  t{i} = t{i} + C{i}(k).get();
+}}
+""")
+    return "".join(parts)
+
+def main(args: list[str]):
+    count = int(args[0]) if len(args) > 0 else 5000
+    source = generate(count)
+
+    # timed and measured separately: tracing every allocation slows the
+    #   front end down several times over
+    Lox.interpreter = Interpreter(Output(io.StringIO()))
+    gc.collect()
+    tracemalloc.start()
+    statements = compile_source(source)
+    ast_memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    if statements == None:
+        sys.exit(65)
+    del statements
+
+    Lox.interpreter = Interpreter(Output(io.StringIO()))
+    gc.collect()
+    start = time.perf_counter()
+    statements = compile_source(source)
+    compile_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    Lox.interpreter.interpret(statements)
+    run_time = time.perf_counter() - start
+
+    print(f"{len(source) / 1e6:.1f} MB of source, {count} units")
+    print(f"  AST:     {ast_memory / 1e6:.1f} MB")
+    print(f"  compile: {compile_time:.2f}s (scan, parse, resolve, optimize)")
+    print(f"  run:     {run_time:.2f}s (tree-walker)")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -2,12 +2,33 @@ import sys
 import os
 import io
 
-def define_type(out_file: io.TextIOWrapper, base_name: str, class_name: str, field_list: str):
+# node classes something keeps a weak map keyed by (the tree-walker's
+#   compiled loops), which need a slot for weak references
+WEAKLY_REFERENCED = {"Loop", "While"}
+
+def define_type(out_file: io.TextIOWrapper, base_name: str, class_name: str, kind: int, field_list: str):
+    # anything after a "|" isn't part of the syntax: those are slots filled
+    #   in after parsing (where the Resolver put things, caches the
+    #   backends keep at runtime, and the like), starting as None
+    field_list, _, annotation_list = [fl.strip() for fl in field_list.partition("|")]
+    fields = [f.strip() for f in field_list.split(",")]
+    annotations = [a.strip() for a in annotation_list.split(",")] if annotation_list else []
+    slots = [f.split(":")[0].strip() for f in fields + annotations]
+    if class_name in WEAKLY_REFERENCED:
+        slots.append("__weakref__")
+
+    # nodes are slotted: a big program has a lot of them, and they live as
+    #   long as it runs
     out_file.write(f"class {class_name}({base_name}):\n")
+    out_file.write(f"    __slots__ = ({', '.join(repr(slot) for slot in slots)}{',' if len(slots) == 1 else ''})\n")
+    out_file.write(f"    kind = {kind}\n")
+    out_file.write("\n")
     out_file.write(f"    def __init__(self, {field_list}):\n")
-    for field in [f.strip() for f in field_list.split(",")]:
+    for field in fields:
         name, *_ = [sf.strip() for sf in field.split(":")]
         out_file.write(f"        self.{field} = {name}\n")
+    for annotation in annotations:
+        out_file.write(f"        self.{annotation} = None\n")
     out_file.write("\n")
     out_file.write(f"    def accept(self, visitor: {base_name}.Visitor):\n")
     out_file.write(f"        return visitor.visit_{class_name.lower()}_{base_name.lower()}(self)\n")
@@ -27,15 +48,19 @@ def define_ast(output_dir: str, base_name: str, types: list[tuple[str,list[str]]
         out_file.write(f"from .{imp_file} import {', '.join(vals)}\n")
     out_file.write("\n")
 
+    # every node class has a `kind`, its index in this list, for anything
+    #   that would rather look a node up in a table than visit it
     out_file.write(f"class {base_name}:\n")
+    out_file.write(f"    __slots__ = ()\n")
+    out_file.write(f"    kind: int\n\n")
     out_file.write(f"    @abc.abstractmethod\n    def accept(self, visitor: {base_name}):\n        pass\n\n")
     out_file.write(f"class {base_name}Visitor(abc.ABC):\n")
     for class_name, _ in type_datums:
         out_file.write(f"    @abc.abstractmethod\n    def visit_{class_name.lower()}_{base_name.lower()}(self, {base_name.lower()}: {class_name}):\n        pass\n\n")
     out_file.write("\n")
 
-    for class_name, fields in type_datums:
-        define_type(out_file, base_name, class_name, fields)
+    for kind, (class_name, fields) in enumerate(type_datums):
+        define_type(out_file, base_name, class_name, kind, fields)
 
     out_file.write("\n")
     out_file.close()
@@ -50,31 +75,33 @@ def main(args: list[str]):
         os.makedirs(args[0])
 
     define_ast(args[0], "Expr", [
-        "Assign   : name: Token, value: Expr",
-        "Binary   : left: Expr, operator: Token, right: Expr",
+        "Assign   : name: Token, value: Expr | location: object",
+        "Binary   : left: Expr, operator: Token, right: Expr | feedback: object",
         "Call     : callee: Expr, paren: Token, arguments: list[Expr]",
-        "Get      : obj: Expr, name: Token",
+        "Get      : obj: Expr, name: Token | cache: object",
         "Grouping : expression: Expr",
         "Literal  : value",
         "Logical  : left: Expr, operator: Token, right: Expr",
-        "Set      : obj: Expr, name: Token, value: Expr",
-        "Super    : keyword: Token, method: Token",
-        "This     : keyword: Token",
+        "Set      : obj: Expr, name: Token, value: Expr | cache: object",
+        "Super    : keyword: Token, method: Token | location: object, this: This",
+        "This     : keyword: Token | location: object",
         "Unary    : operator: Token, right: Expr",
-        "Variable : name: Token"
+        "Update   : target: Assign, variable: Variable, operator: Token, value: Expr",
+        "Variable : name: Token | location: object, declaration: object"
     ])
 
     define_ast(args[0], "Stmt", [
         "Block      : statements: list[Expr]",
-        "Class      : name: Token, superclass: Variable, methods: list[Function]",
+        "Class      : name: Token, superclass: Variable, methods: list[Function] | declaration: object",
         "Expression : expression: Expr",
-        "Function   : name: Token, params: list[Token], body: list[Stmt]",
+        "Function   : name: Token, params: list[Token], body: list[Stmt] | pure: bool, declaration: object, layout: object",
         "If         : condition: Expr, then_branch: Stmt, else_branch: Stmt",
+        "Loop       : variable: Variable, operator: Token, limit: Literal, body: Stmt, original: While",
         "Return     : keyword: Token, value: Expr",
         "Print      : expression: Expr",
-        "Var        : name: Token, initializer: Expr",
+        "Var        : name: Token, initializer: Expr | declaration: object",
         "While      : condition: Expr, body: Stmt",
-    ], [("expr", ["Expr", "Variable"])])
+    ], [("expr", ["Expr", "Variable", "Literal"])])
 
     init_path = os.path.join(args[0], "__init__.py")
     init_file = open(init_path, "w")
@@ -0,0 +1,795 @@
+from __future__ import annotations
+import math
+import re
+
+from . import ast
+from .token import Token, TokenType
+from .environment import VariableKind
+from .lox import Lox
+from .runtime import Output, run
+from .interpreter import Interpreter
+
+# Ahead-of-time backend: turns the resolved AST into Python source. Lox
+#   globals become module globals (g_*, or gu_* for names that aren't
+#   plain ASCII), locals become Python locals (l_*), and locals captured
+#   by a nested function are boxed in a runtime Cell (c_*) which is
+#   handed to each closure as a default argument, so every closure
+#   creation binds the cells that exist at that moment -- the same
+#   per-iteration semantics jlox gets from a fresh Environment per block.
+#
+# Python's compiler has limits Lox doesn't: 200 nested parentheses, 20
+#   nested loops, 100 levels of indentation. A statement whose expressions
+#   nest more than HOIST_DEPTH deep is emitted with every intermediate
+#   value hoisted into a temporary of its own, one assignment per line, in
+#   evaluation order. A loop nested more than MAX_LOOPS deep, or anything
+#   indented past MAX_INDENT, is flattened: it and everything inside it
+#   become the states of a single `while True:` dispatching on a state
+#   variable, with `if`s and loops as jumps between them. Whatever still
+#   doesn't compile (functions nested ~100 deep, say) is run by the
+#   tree-walker instead, which has been handed the same resolution.
+
+class _Binding:
+    def __init__(self, name: str, index: int, function: _FunctionInfo) -> None:
+        self.name = name
+        self.index = index
+        self.function = function
+        self.captured = False
+
+    @property
+    def pyname(self) -> str:
+        prefix = "c" if self.captured else "l"
+        return f"{prefix}_{self.name}_{self.index}"
+
+    @property
+    def param_name(self) -> str:
+        # captured parameters arrive as plain values and get boxed on entry
+        return f"p_{self.name}_{self.index}"
+
+class _FunctionInfo:
+    def __init__(self, parent: _FunctionInfo|None) -> None:
+        self.parent = parent
+        self.free: dict[_Binding,None] = {}
+        self.global_writes: dict[str,None] = {}
+
+class _Analyzer(ast.expr.ExprVisitor, ast.stmt.StmtVisitor):
+    """Mirrors the Resolver's scopes to map each resolved use onto the
+    declaration it refers to, and marks declarations that escape into a
+    nested function."""
+
+    def __init__(self) -> None:
+        self._scopes: list[dict[str,_Binding]] = []
+        self._count = 0
+        self.main = _FunctionInfo(None)
+        self._function = self.main
+        self.declarations: dict[object,_Binding] = {}
+        self.uses: dict[ast.expr.Expr,_Binding] = {}
+        self.functions: dict[ast.stmt.Function,_FunctionInfo] = {}
+
+    def analyze(self, target: list[ast.stmt.Stmt]|ast.stmt.Stmt|ast.expr.Expr):
+        if type(target) == list:
+            for statement in target:
+                self.analyze(statement)
+        else:
+            target.accept(self)
+
+    def _declare(self, key: object, name: Token|str):
+        if isinstance(name, Token):
+            name = name.lexeme
+        if len(self._scopes) == 0:
+            self.main.global_writes[name] = None
+            return
+        self._count += 1
+        binding = _Binding(name, self._count, self._function)
+        self._scopes[-1][name] = binding
+        self.declarations[key] = binding
+
+    def _use(self, expr: object, name: str, assigns: bool = False):
+        for scope in reversed(self._scopes):
+            if name in scope:
+                binding = scope[name]
+                break
+        else:
+            if assigns:
+                self._function.global_writes[name] = None
+            return
+        self.uses[expr] = binding
+        function = self._function
+        while function is not binding.function:
+            binding.captured = True
+            function.free[binding] = None
+            function = function.parent
+
+    def _analyze_function(self, function: ast.stmt.Function, this_key: object = None):
+        info = _FunctionInfo(self._function)
+        self.functions[function] = info
+        enclosing_function = self._function
+        self._function = info
+
+        if this_key != None:
+            self._scopes.append({})
+            self._declare(this_key, "this")
+        self._scopes.append({})
+        for param in function.params:
+            self._declare(param, param)
+        self.analyze(function.body)
+        self._scopes.pop()
+        if this_key != None:
+            self._scopes.pop()
+
+        self._function = enclosing_function
+
+    def visit_block_stmt(self, stmt: ast.stmt.Block):
+        self._scopes.append({})
+        self.analyze(stmt.statements)
+        self._scopes.pop()
+
+    def visit_class_stmt(self, stmt: ast.stmt.Class):
+        self._declare(stmt, stmt.name)
+        if stmt.superclass != None:
+            self.analyze(stmt.superclass)
+            self._scopes.append({})
+            self._declare(stmt.superclass, "super")
+        for method in stmt.methods:
+            self._analyze_function(method, this_key=method.name)
+        if stmt.superclass != None:
+            self._scopes.pop()
+
+    def visit_expression_stmt(self, stmt: ast.stmt.Expression):
+        self.analyze(stmt.expression)
+
+    def visit_function_stmt(self, stmt: ast.stmt.Function):
+        self._declare(stmt, stmt.name)
+        self._analyze_function(stmt)
+
+    def visit_if_stmt(self, stmt: ast.stmt.If):
+        self.analyze(stmt.condition)
+        self.analyze(stmt.then_branch)
+        if stmt.else_branch:
+            self.analyze(stmt.else_branch)
+
+    def visit_print_stmt(self, stmt: ast.stmt.Print):
+        self.analyze(stmt.expression)
+
+    def visit_return_stmt(self, stmt: ast.stmt.Return):
+        if stmt.value:
+            self.analyze(stmt.value)
+
+    def visit_var_stmt(self, stmt: ast.stmt.Var):
+        if stmt.initializer:
+            self.analyze(stmt.initializer)
+        self._declare(stmt, stmt.name)
+
+    def visit_while_stmt(self, stmt: ast.stmt.While):
+        self.analyze(stmt.condition)
+        self.analyze(stmt.body)
+
+    def visit_loop_stmt(self, stmt: ast.stmt.Loop):
+        self.analyze(stmt.original)
+
+    def visit_assign_expr(self, expr: ast.expr.Assign):
+        self.analyze(expr.value)
+        self._use(expr, expr.name.lexeme, assigns=True)
+
+    def visit_binary_expr(self, expr: ast.expr.Binary):
+        self.analyze(expr.left)
+        self.analyze(expr.right)
+
+    def visit_call_expr(self, expr: ast.expr.Call):
+        self.analyze(expr.callee)
+        self.analyze(expr.arguments)
+
+    def visit_get_expr(self, expr: ast.expr.Get):
+        self.analyze(expr.obj)
+
+    def visit_grouping_expr(self, expr: ast.expr.Grouping):
+        self.analyze(expr.expression)
+
+    def visit_literal_expr(self, expr: ast.expr.Literal):
+        pass
+
+    def visit_logical_expr(self, expr: ast.expr.Logical):
+        self.analyze(expr.left)
+        self.analyze(expr.right)
+
+    def visit_set_expr(self, expr: ast.expr.Set):
+        self.analyze(expr.obj)
+        self.analyze(expr.value)
+
+    def visit_super_expr(self, expr: ast.expr.Super):
+        self._use(expr, "super")
+        self._use(expr.keyword, "this")
+
+    def visit_this_expr(self, expr: ast.expr.This):
+        self._use(expr, "this")
+
+    def visit_unary_expr(self, expr: ast.expr.Unary):
+        self.analyze(expr.right)
+
+    def visit_update_expr(self, expr: ast.expr.Update):
+        self.analyze(expr.target)
+
+    def visit_variable_expr(self, expr: ast.expr.Variable):
+        self._use(expr, expr.name.lexeme)
+
+
+# Global reads are tagged with the Lox line they came from; when the line
+#   changes mid-expression the emitted code breaks onto a new physical line
+#   (always inside parentheses) so a NameError can be traced back exactly.
+_LINE_MARK = re.compile("\x00([0-9]+)\x01")
+
+# Python NFKC-normalizes identifiers, which would make one global of the
+#   distinct Lox names `ﬁ` and `fi`; a name that isn't plain ASCII is
+#   spelled gu_ instead, with every character but a letter or digit as its
+#   code point in hex between underscores (runtime.run reads it back)
+_PLAIN_NAME = re.compile("[A-Za-z0-9_]+")
+
+def _global_name(name: str) -> str:
+    if _PLAIN_NAME.fullmatch(name):
+        return f"g_{name}"
+    return "gu_" + "".join(c if c.isascii() and c.isalnum() else f"_{ord(c):x}_" for c in name)
+
+_COMPARISONS = {
+    TokenType.GREATER: ">",
+    TokenType.GREATER_EQUAL: ">=",
+    TokenType.LESS: "<",
+    TokenType.LESS_EQUAL: "<=",
+}
+_ARITHMETIC = {
+    TokenType.MINUS: "-",
+    TokenType.STAR: "*",
+}
+
+HOIST_DEPTH = 20
+MAX_LOOPS = 16
+MAX_INDENT = 64
+
+def _nesting(expr: ast.expr.Expr) -> int:
+    match expr:
+        case ast.expr.Binary() | ast.expr.Logical():
+            return 1 + max(_nesting(expr.left), _nesting(expr.right))
+        case ast.expr.Grouping():
+            return 1 + _nesting(expr.expression)
+        case ast.expr.Unary():
+            return 1 + _nesting(expr.right)
+        case ast.expr.Assign():
+            return 1 + _nesting(expr.value)
+        case ast.expr.Set():
+            return 1 + max(_nesting(expr.obj), _nesting(expr.value))
+        case ast.expr.Get():
+            return 1 + _nesting(expr.obj)
+        case ast.expr.Call():
+            return 1 + max(_nesting(argument) for argument in [expr.callee] + expr.arguments)
+        case ast.expr.Update():
+            return _nesting(expr.target)
+    return 1
+
+class Transpiler(ast.expr.ExprVisitor, ast.stmt.StmtVisitor):
+    def __init__(self, output: Output|None = None) -> None:
+        self.output = Output() if output == None else output
+        self._namespace: dict[str,object] = {"__name__": "__lox__", "_output": self.output}
+        # every program at the prompt runs in the same namespace, so the
+        #   module-level names each one defines (its tokens and line map)
+        #   carry its number, and functions from earlier ones keep theirs
+        self._programs = 0
+        self._line_maps: dict[str,dict[int,int]] = {}
+        # runs whatever Python won't compile, so it's told where the
+        #   Resolver put everything too
+        self._fallback = Interpreter(self.output)
+
+    # scoping is redone by the _Analyzer, which needs Python-level names
+    #   rather than the Resolver's frame slots
+    def resolve(self, expr: object, kind: VariableKind, index: int):
+        self._fallback.resolve(expr, kind, index)
+
+    def resolve_global(self, expr: object, name: str):
+        self._fallback.resolve_global(expr, name)
+
+    def declare(self, key: object, slot: int, captured: bool):
+        self._fallback.declare(key, slot, captured)
+
+    def resolve_function(self, declaration: ast.stmt.Function|None, frame_size: int, upvalues: list[tuple[bool,int]], boxed: list[int], nesting: int):
+        self._fallback.resolve_function(declaration, frame_size, upvalues, boxed, nesting)
+
+    def interpret(self, statements: list[ast.stmt.Stmt]):
+        self._programs += 1
+        try:
+            source = self.emit(statements)
+            code = compile(source, f"<lox-{self._programs}>", "exec")
+        except (SyntaxError, RecursionError, MemoryError):
+            # nested past what Python's compiler takes even hoisted and
+            #   flattened; its globals are its own, which only a REPL
+            #   session could tell
+            self._fallback.interpret(statements)
+            return
+        exec(code, self._namespace)
+        self._line_maps[code.co_filename] = self._namespace[f"_LINES{self._suffix}"]
+        run(self._namespace["_main"], self._line_maps)
+
+    def emit(self, statements: list[ast.stmt.Stmt]) -> str:
+        analyzer = _Analyzer()
+        analyzer.analyze(statements)
+        self._analysis = analyzer
+        self._lines: list[tuple[int,str]] = []
+        self._indent = 0
+        self._tokens: dict[tuple,str] = {}
+        self._suffix = f"_{self._programs}" if self._programs > 0 else ""
+        self._temps = 0
+        self._function: _FunctionInfo = analyzer.main
+        self._this: _Binding|None = None
+        self._is_initializer = False
+        self._hoist = False
+        self._tail = False
+        self._loops = 0
+        # the state variable and dispatch indent of a flattened region
+        self._flat: tuple[str,int]|None = None
+        self._states = 0
+
+        self._line("def _main():")
+        self._indent += 1
+        self._begin_function(analyzer.main)
+        self._emit_statements(statements)
+        if len(self._lines) == 1:
+            self._line("pass")
+        self._indent -= 1
+
+        header = [
+            "# This file was generated by plox --emit-py",
+            "from plox.runtime import (",
+            "    Cell, PyFunction, LoxClass, Token, TokenType, ClockFunction, Output,",
+            "    stringify, is_equal, call, get_property, check_instance, set_property,",
+            "    get_super, check_superclass, operand_error, operands_error, add_error,",
+            "    divide_error, undefined_variable, get_method, invoke, memoize, run,",
+            "    tail_call, tail_invoke,",
+            ")",
+            "",
+            "_G = globals()",
+            "_G.setdefault('g_clock', ClockFunction())",
+            "_print = _G.setdefault('_output', Output()).print",
+        ]
+        for text, name in self._tokens.items():
+            header.append(f"{name} = Token(TokenType.{text[0].name}, {text[1]!r}, None, {text[2]})")
+        header.append("")
+
+        output = list(header)
+        line_map: dict[int,int] = {}
+        for indent, text in self._lines:
+            self._place(output, line_map, "    " * indent, text)
+
+        output += [
+            "",
+            f"_LINES{self._suffix} = {line_map!r}",
+            "",
+            "if __name__ == \"__main__\":",
+            "    import sys",
+            f"    sys.exit(run(_main, {{_main.__code__.co_filename: _LINES{self._suffix}}}))",
+            "",
+        ]
+        return "\n".join(output)
+
+    def _place(self, output: list[str], line_map: dict[int,int], prefix: str, text: str):
+        pieces = _LINE_MARK.split(text)
+        current = prefix + pieces[0]
+        current_line = None
+        for i in range(1, len(pieces), 2):
+            lox_line = int(pieces[i])
+            if current_line != None and current_line != lox_line:
+                output.append(current)
+                current = prefix + "    "
+            if current_line != lox_line:
+                line_map[len(output) + 1] = lox_line
+                current_line = lox_line
+            current += pieces[i + 1]
+        output.append(current)
+
+    def _line(self, text: str):
+        self._lines.append((self._indent, text))
+
+    def _token(self, token: Token) -> str:
+        key = (token.type, token.lexeme, token.line)
+        if key not in self._tokens:
+            self._tokens[key] = f"_k{len(self._tokens)}{self._suffix}"
+        return self._tokens[key]
+
+    def _temp(self) -> str:
+        self._temps += 1
+        return f"_t{self._temps}"
+
+    def _begin_function(self, info: _FunctionInfo):
+        if len(info.global_writes) > 0:
+            names = ", ".join(_global_name(name) for name in info.global_writes)
+            self._line(f"global {names}")
+
+    def _emit_statements(self, statements: list[ast.stmt.Stmt]):
+        for statement in statements:
+            statement.accept(self)
+
+    def _emit_body(self, statement: ast.stmt.Stmt):
+        self._indent += 1
+        start = len(self._lines)
+        statement.accept(self)
+        if len(self._lines) == start:
+            self._line("pass")
+        self._indent -= 1
+
+    def _expr(self, expr: ast.expr.Expr) -> str:
+        if not self._hoist or isinstance(expr, (ast.expr.Literal, ast.expr.Grouping, ast.expr.Logical)):
+            return expr.accept(self)
+        return self._hoisted(expr.accept(self))
+
+    def _hoisted(self, value: str) -> str:
+        t = self._temp()
+        self._line(f"{t} = {value}")
+        return t
+
+    def _expression(self, expr: ast.expr.Expr, truthy: bool = False) -> str:
+        # a statement's expression, hoisted if it nests too deeply to be
+        #   one Python expression
+        self._hoist = _nesting(expr) > HOIST_DEPTH
+        value = self._truthy(expr) if truthy else self._expr(expr)
+        self._hoist = False
+        return value
+
+    def _truthy(self, expr: ast.expr.Expr) -> str:
+        if self._is_boolean(expr):
+            return self._expr(expr)
+        t = self._temp()
+        return f"(({t} := {self._expr(expr)}) is not None and {t} is not False)"
+
+    def _is_boolean(self, expr: ast.expr.Expr) -> bool:
+        if isinstance(expr, ast.expr.Grouping):
+            return self._is_boolean(expr.expression)
+        if isinstance(expr, ast.expr.Literal):
+            return type(expr.value) == bool
+        if isinstance(expr, ast.expr.Unary):
+            return expr.operator.type == TokenType.BANG
+        if isinstance(expr, ast.expr.Binary):
+            return expr.operator.type in _COMPARISONS or expr.operator.type in [TokenType.EQUAL_EQUAL, TokenType.BANG_EQUAL]
+        return False
+
+    def _define(self, key: object, name: Token, value: str):
+        binding = self._analysis.declarations.get(key)
+        if binding == None:
+            self._line(f"{_global_name(name.lexeme)} = ({value})")
+        elif binding.captured:
+            self._line(f"{binding.pyname} = Cell({value})")
+        else:
+            self._line(f"{binding.pyname} = ({value})")
+
+    def _read(self, binding: _Binding) -> str:
+        if binding.captured:
+            return f"{binding.pyname}.value"
+        return binding.pyname
+
+    def _emit_function(self, declaration: ast.stmt.Function, this_key: object = None, is_initializer: bool = False) -> str:
+        info = self._analysis.functions[declaration]
+        self._temps += 1
+        pyname = f"f_{declaration.name.lexeme}_{self._temps}"
+
+        params: list[_Binding] = []
+        if this_key != None:
+            params.append(self._analysis.declarations[this_key])
+        params += [self._analysis.declarations[p] for p in declaration.params]
+        signature = [p.param_name if p.captured else p.pyname for p in params]
+        signature += [f"{b.pyname}={b.pyname}" for b in info.free]
+
+        enclosing = (self._function, self._this, self._is_initializer, self._loops, self._flat, self._states)
+        self._function = info
+        self._this = params[0] if this_key != None else None
+        self._is_initializer = is_initializer
+        self._loops = 0
+        self._flat = None
+
+        self._line(f"def {pyname}({', '.join(signature)}):")
+        start = len(self._lines)
+        self._indent += 1
+        self._begin_function(info)
+        for p in params:
+            if p.captured:
+                self._line(f"{p.pyname} = Cell({p.param_name})")
+        self._emit_statements(declaration.body)
+        if is_initializer:
+            self._line(f"return {self._read(self._this)}")
+        elif len(self._lines) == start:
+            self._line("pass")
+        self._indent -= 1
+
+        self._function, self._this, self._is_initializer, self._loops, self._flat, self._states = enclosing
+        return pyname
+
+    def _flatten(self, stmt: ast.stmt.Stmt):
+        state = self._temp()
+        indent = self._indent
+        self._line(f"{state} = 1")
+        self._line("while True:")
+        self._flat = (state, indent + 1)
+        self._states = 1
+        self._enter_state(1)
+        stmt.accept(self)
+        self._line("break")
+        self._indent = indent
+        self._flat = None
+
+    def _new_state(self) -> int:
+        self._states += 1
+        return self._states
+
+    def _enter_state(self, number: int):
+        state, indent = self._flat
+        self._indent = indent
+        self._line(f"if {state} == {number}:")
+        self._indent = indent + 1
+
+    def _jump(self, number: int):
+        self._line(f"{self._flat[0]} = {number}")
+        self._line("continue")
+
+    def _branch(self, condition: str, if_true: int, if_false: int):
+        self._line(f"{self._flat[0]} = {if_true} if ({condition}) else {if_false}")
+        self._line("continue")
+
+    ### statements
+
+    def visit_block_stmt(self, stmt: ast.stmt.Block):
+        self._emit_statements(stmt.statements)
+
+    def visit_class_stmt(self, stmt: ast.stmt.Class):
+        binding = self._analysis.declarations.get(stmt)
+        if binding != None and binding.captured:
+            self._line(f"{binding.pyname} = Cell(None)")
+
+        superclass = "None"
+        if stmt.superclass != None:
+            name = self._token(stmt.superclass.name)
+            value = f"check_superclass({self._expression(stmt.superclass)}, {name})"
+            super_binding = self._analysis.declarations[stmt.superclass]
+            self._define(stmt.superclass, stmt.superclass.name, value)
+            superclass = self._read(super_binding)
+
+        methods = []
+        for method in stmt.methods:
+            is_initializer = method.name.lexeme == "init"
+            pyname = self._emit_function(method, method.name, is_initializer)
+            methods.append(f"{method.name.lexeme!r}: PyFunction({pyname}, {method.name.lexeme!r}, {len(method.params)})")
+
+        klass = f"LoxClass({stmt.name.lexeme!r}, {superclass}, {{{', '.join(methods)}}})"
+        if binding != None and binding.captured:
+            self._line(f"{binding.pyname}.value = {klass}")
+        else:
+            self._define(stmt, stmt.name, klass)
+
+    def visit_expression_stmt(self, stmt: ast.stmt.Expression):
+        expr = stmt.expression
+        if isinstance(expr, ast.expr.Update):
+            # Python's own `x = x + v` is already as tight as it gets
+            expr = expr.target
+        if isinstance(expr, ast.expr.Assign) and expr in self._analysis.uses:
+            binding = self._analysis.uses[expr]
+            if binding.captured:
+                self._line(f"{binding.pyname}.value = ({self._expression(expr.value)})")
+            else:
+                self._line(f"{binding.pyname} = ({self._expression(expr.value)})")
+            return
+        self._line(f"({self._expression(expr)})")
+
+    def visit_function_stmt(self, stmt: ast.stmt.Function):
+        binding = self._analysis.declarations.get(stmt)
+        if binding != None and binding.captured:
+            self._line(f"{binding.pyname} = Cell(None)")
+        pyname = self._emit_function(stmt)
+        if stmt.pure:
+            pyname = f"memoize({pyname})"
+        function = f"PyFunction({pyname}, {stmt.name.lexeme!r}, {len(stmt.params)})"
+        if binding != None and binding.captured:
+            self._line(f"{binding.pyname}.value = {function}")
+        else:
+            self._define(stmt, stmt.name, function)
+
+    def visit_if_stmt(self, stmt: ast.stmt.If):
+        if self._flat != None:
+            then_state = self._new_state()
+            else_state = self._new_state() if stmt.else_branch else None
+            after = self._new_state()
+            self._branch(self._expression(stmt.condition, truthy=True), then_state, else_state or after)
+            self._enter_state(then_state)
+            stmt.then_branch.accept(self)
+            self._jump(after)
+            if stmt.else_branch:
+                self._enter_state(else_state)
+                stmt.else_branch.accept(self)
+                self._jump(after)
+            self._enter_state(after)
+            return
+        if self._indent >= MAX_INDENT:
+            self._flatten(stmt)
+            return
+
+        self._line(f"if ({self._expression(stmt.condition, truthy=True)}):")
+        self._emit_body(stmt.then_branch)
+        if stmt.else_branch:
+            self._line("else:")
+            self._emit_body(stmt.else_branch)
+
+    def visit_print_stmt(self, stmt: ast.stmt.Print):
+        self._line(f"_print(stringify({self._expression(stmt.expression)}))")
+
+    def visit_return_stmt(self, stmt: ast.stmt.Return):
+        if self._is_initializer:
+            self._line(f"return {self._read(self._this)}")
+        elif stmt.value:
+            # `return f(...)` leaves the call to whichever helper called
+            #   this function, so tail calls run in constant stack
+            self._tail = isinstance(stmt.value, ast.expr.Call)
+            self._line(f"return ({self._expression(stmt.value)})")
+        else:
+            self._line("return None")
+
+    def visit_var_stmt(self, stmt: ast.stmt.Var):
+        value = "None"
+        if stmt.initializer:
+            value = self._expression(stmt.initializer)
+        self._define(stmt, stmt.name, value)
+
+    def visit_while_stmt(self, stmt: ast.stmt.While):
+        if self._flat != None:
+            head = self._new_state()
+            body = self._new_state()
+            after = self._new_state()
+            self._jump(head)
+            self._enter_state(head)
+            self._branch(self._expression(stmt.condition, truthy=True), body, after)
+            self._enter_state(body)
+            stmt.body.accept(self)
+            self._jump(head)
+            self._enter_state(after)
+            return
+        if self._loops >= MAX_LOOPS or self._indent >= MAX_INDENT:
+            self._flatten(stmt)
+            return
+
+        self._loops += 1
+        if _nesting(stmt.condition) > HOIST_DEPTH:
+            # the hoisted condition has to be worked out on every pass
+            self._line("while True:")
+            self._indent += 1
+            self._line(f"if not ({self._expression(stmt.condition, truthy=True)}): break")
+            self._indent -= 1
+        else:
+            self._line(f"while ({self._expression(stmt.condition, truthy=True)}):")
+        self._emit_body(stmt.body)
+        self._loops -= 1
+
+    def visit_loop_stmt(self, stmt: ast.stmt.Loop):
+        self.visit_while_stmt(stmt.original)
+
+    ### expressions
+
+    def visit_assign_expr(self, expr: ast.expr.Assign):
+        value = self._expr(expr.value)
+        binding = self._analysis.uses.get(expr)
+        if binding == None:
+            t = self._temp()
+            name = _global_name(expr.name.lexeme)
+            return f"(({name} := {t}) if (({t} := {value}) is {t} and {name!r} in _G) else undefined_variable({self._token(expr.name)}))"
+        if binding.captured:
+            return f"{binding.pyname}.set({value})"
+        return f"({binding.pyname} := {value})"
+
+    def visit_binary_expr(self, expr: ast.expr.Binary):
+        left = self._expr(expr.left)
+        right = self._expr(expr.right)
+        op = expr.operator.type
+        operator = self._token(expr.operator)
+
+        if op == TokenType.EQUAL_EQUAL:
+            return f"is_equal({left}, {right})"
+        if op == TokenType.BANG_EQUAL:
+            return f"(not is_equal({left}, {right}))"
+
+        # number literals need neither a temporary nor a type check
+        a, b = left, right
+        checks = []
+        if not self._is_number(expr.left):
+            if not self._hoist:
+                a = self._temp()
+                left = f"{a} := {left}"
+            checks.append(f"(type({left}) is float)")
+        if not self._is_number(expr.right):
+            if not self._hoist:
+                b = self._temp()
+                right = f"{b} := {right}"
+            checks.append(f"(type({right}) is float)")
+        both_numbers = " & ".join(checks) if len(checks) > 0 else "True"
+
+        if op in _COMPARISONS:
+            return f"({a} {_COMPARISONS[op]} {b} if {both_numbers} else operands_error({operator}))"
+        if op in _ARITHMETIC:
+            return f"({a} {_ARITHMETIC[op]} {b} if {both_numbers} else operands_error({operator}))"
+        if op == TokenType.PLUS:
+            if len(checks) < 2:
+                return f"({a} + {b} if {both_numbers} else add_error({operator}))"
+            return f"({a} + {b} if {both_numbers} or (type({a}) is str and type({b}) is str) else add_error({operator}))"
+        if op == TokenType.SLASH:
+            return f"({a} / {b} if {both_numbers} and {b} != 0.0 else divide_error({a}, {b}, {operator}))"
+        raise AssertionError(op)
+
+    def _is_number(self, expr: ast.expr.Expr) -> bool:
+        if isinstance(expr, ast.expr.Grouping):
+            return self._is_number(expr.expression)
+        return isinstance(expr, ast.expr.Literal) and type(expr.value) == float
+
+    def visit_call_expr(self, expr: ast.expr.Call):
+        helper = "tail_" if self._tail else ""
+        self._tail = False
+        if isinstance(expr.callee, ast.expr.Get):
+            target = f"get_method({self._expr(expr.callee.obj)}, {self._token(expr.callee.name)})"
+            if self._hoist:
+                # looked up before the arguments are evaluated
+                target = self._hoisted(target)
+            arguments = [self._expr(argument) for argument in expr.arguments]
+            return f"{helper}invoke({', '.join([target, self._token(expr.paren)] + arguments)})"
+        callee = self._expr(expr.callee)
+        arguments = [self._expr(argument) for argument in expr.arguments]
+        return f"{helper}call({', '.join([callee, self._token(expr.paren)] + arguments)})"
+
+    def visit_get_expr(self, expr: ast.expr.Get):
+        return f"get_property({self._expr(expr.obj)}, {self._token(expr.name)})"
+
+    def visit_grouping_expr(self, expr: ast.expr.Grouping):
+        return f"({self._expr(expr.expression)})"
+
+    def visit_literal_expr(self, expr: ast.expr.Literal):
+        if type(expr.value) == float and not math.isfinite(expr.value):
+            return f"float({str(expr.value)!r})"
+        return repr(expr.value)
+
+    def visit_logical_expr(self, expr: ast.expr.Logical):
+        if self._hoist:
+            # the right operand's own hoisted lines only run if it's needed
+            t = self._hoisted(self._expr(expr.left))
+            if expr.operator.type == TokenType.OR:
+                self._line(f"if {t} is None or {t} is False:")
+            else:
+                self._line(f"if {t} is not None and {t} is not False:")
+            self._indent += 1
+            self._line(f"{t} = {self._expr(expr.right)}")
+            self._indent -= 1
+            return t
+        left = self._expr(expr.left)
+        right = self._expr(expr.right)
+        t = self._temp()
+        truthy = f"(({t} := {left}) is not None and {t} is not False)"
+        if expr.operator.type == TokenType.OR:
+            return f"({t} if {truthy} else {right})"
+        return f"({right} if {truthy} else {t})"
+
+    def visit_set_expr(self, expr: ast.expr.Set):
+        name = self._token(expr.name)
+        instance = f"check_instance({self._expr(expr.obj)}, {name})"
+        if self._hoist:
+            # checked before the value is evaluated
+            instance = self._hoisted(instance)
+        return f"set_property({instance}, {name}, {self._expr(expr.value)})"
+
+    def visit_super_expr(self, expr: ast.expr.Super):
+        superclass = self._read(self._analysis.uses[expr])
+        this = self._read(self._analysis.uses[expr.keyword])
+        return f"get_super({superclass}, {this}, {self._token(expr.method)})"
+
+    def visit_this_expr(self, expr: ast.expr.This):
+        return self._read(self._analysis.uses[expr])
+
+    def visit_unary_expr(self, expr: ast.expr.Unary):
+        right = self._expr(expr.right)
+        t = self._temp()
+        if expr.operator.type == TokenType.MINUS:
+            return f"(-{t} if type({t} := {right}) is float else operand_error({self._token(expr.operator)}))"
+        return f"(({t} := {right}) is None or {t} is False)"
+
+    def visit_update_expr(self, expr: ast.expr.Update):
+        return self._expr(expr.target)
+
+    def visit_variable_expr(self, expr: ast.expr.Variable):
+        binding = self._analysis.uses.get(expr)
+        if binding == None:
+            return f"\x00{expr.name.line}\x01{_global_name(expr.name.lexeme)}"
+        return self._read(binding)
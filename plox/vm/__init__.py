@@ -0,0 +1,3 @@
+from .chunk import Chunk, OpCode
+from .compiler import Compiler
+from .vm import VM
@@ -0,0 +1,75 @@
+from array import array
+from enum import IntEnum
+
+OpCode = IntEnum("OpCode", [
+    "CONSTANT",
+    "NIL",
+    "TRUE",
+    "FALSE",
+    "POP",
+    "GET_LOCAL",
+    "SET_LOCAL",
+    "GET_GLOBAL",
+    "DEFINE_GLOBAL",
+    "SET_GLOBAL",
+    "GET_UPVALUE",
+    "SET_UPVALUE",
+    "GET_PROPERTY",
+    "SET_PROPERTY",
+    "GET_SUPER",
+    "EQUAL",
+    "GREATER",
+    "GREATER_EQUAL",
+    "LESS",
+    "LESS_EQUAL",
+    "ADD",
+    "SUBTRACT",
+    "MULTIPLY",
+    "DIVIDE",
+    "NOT",
+    "NEGATE",
+    "PRINT",
+    "JUMP",
+    "JUMP_IF_FALSE",
+    "LOOP",
+    "CALL",
+    "TAIL_CALL",
+    "INVOKE",
+    "SUPER_INVOKE",
+    "CLOSURE",
+    "CLOSE_UPVALUE",
+    "RETURN",
+    "CLASS",
+    "INHERIT",
+    "METHOD",
+], start=0)
+
+class Chunk:
+    # Code is a stream of 16-bit units rather than bytes: an opcode or an
+    #   operand takes one, so a chunk can have 65,536 constants, locals
+    #   and upvalues where clox stops at 256, without any instruction
+    #   having to decode a multi-byte operand. Jump offsets take two.
+    def __init__(self) -> None:
+        self.code = array("H")
+        self.lines = array("L")
+        self.constants: list[object] = []
+        self._constant_indices: dict[tuple[type,object],int] = {}
+
+    def write(self, unit: int, line: int):
+        self.code.append(unit)
+        self.lines.append(line)
+
+    def add_constant(self, value: object) -> int:
+        # functions are compared by identity; everything else by type+value
+        #   so the same name or number only takes up one slot (numbers by
+        #   repr, since -0.0 == 0.0 but they don't print the same)
+        if type(value) == float:
+            key = (float, repr(value))
+        elif type(value) == str:
+            key = (str, value)
+        else:
+            key = (type(value), id(value))
+        if key not in self._constant_indices:
+            self._constant_indices[key] = len(self.constants)
+            self.constants.append(value)
+        return self._constant_indices[key]
@@ -0,0 +1,466 @@
+from __future__ import annotations
+from enum import Enum
+
+from ..lox import Lox
+from .. import ast
+from ..token import Token, TokenType
+from ..runtime import Memo
+from .chunk import Chunk, OpCode
+from .object import VMFunction
+
+# Single-pass code generator from the (already resolved) plox AST into
+#   bytecode, following the structure of dlox's compiler.d: one
+#   FunctionState per function being compiled, tracking its locals and
+#   upvalues so variable resolution happens here at compile time.
+
+FunctionType = Enum("FunctionType", ["FUNCTION", "INITIALIZER", "METHOD", "SCRIPT"])
+
+UINT16_COUNT = 65536
+
+class Local:
+    def __init__(self, name: str, depth: int) -> None:
+        self.name = name
+        self.depth = depth
+        self.is_captured = False
+
+class FunctionState:
+    def __init__(self, enclosing: FunctionState|None, function_type: FunctionType, name: str|None) -> None:
+        self.enclosing = enclosing
+        self.function = VMFunction(name)
+        self.function_type = function_type
+        self.upvalues: list[tuple[int,bool]] = []
+        self.scope_depth = 0
+
+        # slot zero holds the receiver for methods, the callee otherwise
+        slot_zero = "this" if function_type not in [FunctionType.FUNCTION, FunctionType.SCRIPT] else ""
+        self.locals: list[Local] = [Local(slot_zero, 0)]
+
+class ClassState:
+    def __init__(self, enclosing: ClassState|None) -> None:
+        self.enclosing = enclosing
+        self.has_superclass = False
+
+class Compiler(ast.expr.ExprVisitor, ast.stmt.StmtVisitor):
+    def __init__(self) -> None:
+        self._current: FunctionState = None
+        self._class: ClassState = None
+        self._line = 0
+
+    def compile(self, statements: list[ast.stmt.Stmt]) -> VMFunction|None:
+        self._current = FunctionState(None, FunctionType.SCRIPT, None)
+        for statement in statements:
+            statement.accept(self)
+        function = self._end_function()
+        if Lox.had_error:
+            return None
+        return function
+
+    ### emission helpers
+
+    def _chunk(self) -> Chunk:
+        return self._current.function.chunk
+
+    def _emit(self, *data: int):
+        chunk = self._chunk()
+        for unit in data:
+            chunk.write(unit, self._line)
+
+    def _emit_return(self):
+        if self._current.function_type == FunctionType.INITIALIZER:
+            self._emit(OpCode.GET_LOCAL, 0)
+        else:
+            self._emit(OpCode.NIL)
+        self._emit(OpCode.RETURN)
+
+    def _make_constant(self, value: object) -> int:
+        constant = self._chunk().add_constant(value)
+        if constant >= UINT16_COUNT:
+            Lox.error(self._line, "Too many constants in one chunk.")
+            return 0
+        return constant
+
+    def _emit_constant(self, value: object):
+        self._emit(OpCode.CONSTANT, self._make_constant(value))
+
+    def _emit_jump(self, instruction: OpCode) -> int:
+        self._emit(instruction, 0xffff, 0xffff)
+        return len(self._chunk().code) - 2
+
+    def _patch_jump(self, offset: int):
+        code = self._chunk().code
+        jump = len(code) - offset - 2
+        if jump > 0xffffffff:
+            Lox.error(self._line, "Too much code to jump over.")
+        code[offset] = (jump >> 16) & 0xffff
+        code[offset + 1] = jump & 0xffff
+
+    def _emit_loop(self, loop_start: int):
+        self._emit(OpCode.LOOP)
+        offset = len(self._chunk().code) - loop_start + 2
+        if offset > 0xffffffff:
+            Lox.error(self._line, "Loop body too large.")
+        self._emit((offset >> 16) & 0xffff, offset & 0xffff)
+
+    def _end_function(self) -> VMFunction:
+        self._emit_return()
+        function = self._current.function
+        function.upvalue_count = len(self._current.upvalues)
+        self._current = self._current.enclosing
+        return function
+
+    ### scopes and variables
+
+    def _begin_scope(self):
+        self._current.scope_depth += 1
+
+    def _end_scope(self):
+        current = self._current
+        current.scope_depth -= 1
+        while len(current.locals) > 0 and current.locals[-1].depth > current.scope_depth:
+            if current.locals[-1].is_captured:
+                self._emit(OpCode.CLOSE_UPVALUE)
+            else:
+                self._emit(OpCode.POP)
+            current.locals.pop()
+
+    def _add_local(self, name: Token):
+        if len(self._current.locals) == UINT16_COUNT:
+            Lox.error(name, "Too many local variables in function.")
+            return
+        self._current.locals.append(Local(name.lexeme, -1))
+
+    def _declare_variable(self, name: Token) -> int|None:
+        if self._current.scope_depth == 0:
+            return self._make_constant(name.lexeme)
+        self._add_local(name)
+        return None
+
+    def _mark_initialized(self):
+        if self._current.scope_depth == 0:
+            return
+        self._current.locals[-1].depth = self._current.scope_depth
+
+    def _define_variable(self, global_constant: int|None):
+        if global_constant == None:
+            self._mark_initialized()
+            return
+        self._emit(OpCode.DEFINE_GLOBAL, global_constant)
+
+    def _resolve_local(self, state: FunctionState, name: str) -> int:
+        for i in range(len(state.locals) - 1, -1, -1):
+            if state.locals[i].name == name:
+                return i
+        return -1
+
+    def _add_upvalue(self, state: FunctionState, index: int, is_local: bool) -> int:
+        upvalue = (index, is_local)
+        if upvalue in state.upvalues:
+            return state.upvalues.index(upvalue)
+        if len(state.upvalues) == UINT16_COUNT:
+            Lox.error(self._line, "Too many closure variables in function.")
+            return 0
+        state.upvalues.append(upvalue)
+        return len(state.upvalues) - 1
+
+    def _resolve_upvalue(self, state: FunctionState, name: str) -> int:
+        if state.enclosing == None:
+            return -1
+
+        local = self._resolve_local(state.enclosing, name)
+        if local != -1:
+            state.enclosing.locals[local].is_captured = True
+            return self._add_upvalue(state, local, True)
+
+        upvalue = self._resolve_upvalue(state.enclosing, name)
+        if upvalue != -1:
+            return self._add_upvalue(state, upvalue, False)
+
+        return -1
+
+    def _named_variable(self, name: str, assign: bool = False):
+        arg = self._resolve_local(self._current, name)
+        if arg != -1:
+            self._emit(OpCode.SET_LOCAL if assign else OpCode.GET_LOCAL, arg)
+            return
+
+        arg = self._resolve_upvalue(self._current, name)
+        if arg != -1:
+            self._emit(OpCode.SET_UPVALUE if assign else OpCode.GET_UPVALUE, arg)
+            return
+
+        arg = self._make_constant(name)
+        self._emit(OpCode.SET_GLOBAL if assign else OpCode.GET_GLOBAL, arg)
+
+    def _function(self, declaration: ast.stmt.Function, function_type: FunctionType):
+        self._current = FunctionState(self._current, function_type, declaration.name.lexeme)
+        self._begin_scope()
+        for param in declaration.params:
+            self._current.function.arity += 1
+            self._add_local(param)
+            self._mark_initialized()
+        for statement in declaration.body:
+            statement.accept(self)
+
+        upvalues = self._current.upvalues
+        function = self._end_function()
+        if declaration.pure:
+            function.memo = Memo()
+        self._emit(OpCode.CLOSURE, self._make_constant(function))
+        for index, is_local in upvalues:
+            self._emit(1 if is_local else 0, index)
+
+    ### statements
+
+    def visit_block_stmt(self, stmt: ast.stmt.Block):
+        self._begin_scope()
+        for statement in stmt.statements:
+            statement.accept(self)
+        self._end_scope()
+
+    def visit_class_stmt(self, stmt: ast.stmt.Class):
+        self._line = stmt.name.line
+        name_constant = self._make_constant(stmt.name.lexeme)
+        global_constant = self._declare_variable(stmt.name)
+
+        self._emit(OpCode.CLASS, name_constant)
+        self._define_variable(global_constant)
+
+        self._class = ClassState(self._class)
+
+        if stmt.superclass != None:
+            stmt.superclass.accept(self)
+            self._begin_scope()
+            self._add_local(Token(TokenType.SUPER, "super", None, stmt.name.line))
+            self._define_variable(None)
+
+            self._named_variable(stmt.name.lexeme)
+            self._line = stmt.superclass.name.line
+            self._emit(OpCode.INHERIT)
+            self._class.has_superclass = True
+
+        self._named_variable(stmt.name.lexeme)
+        for method in stmt.methods:
+            self._line = method.name.line
+            constant = self._make_constant(method.name.lexeme)
+            function_type = FunctionType.METHOD
+            if method.name.lexeme == "init":
+                function_type = FunctionType.INITIALIZER
+            self._function(method, function_type)
+            self._emit(OpCode.METHOD, constant)
+        self._emit(OpCode.POP)
+
+        if self._class.has_superclass:
+            self._end_scope()
+
+        self._class = self._class.enclosing
+
+    def visit_expression_stmt(self, stmt: ast.stmt.Expression):
+        stmt.expression.accept(self)
+        self._emit(OpCode.POP)
+
+    def visit_function_stmt(self, stmt: ast.stmt.Function):
+        self._line = stmt.name.line
+        global_constant = self._declare_variable(stmt.name)
+        self._mark_initialized()
+        self._function(stmt, FunctionType.FUNCTION)
+        self._define_variable(global_constant)
+
+    def visit_if_stmt(self, stmt: ast.stmt.If):
+        stmt.condition.accept(self)
+        then_jump = self._emit_jump(OpCode.JUMP_IF_FALSE)
+        self._emit(OpCode.POP)
+        stmt.then_branch.accept(self)
+
+        else_jump = self._emit_jump(OpCode.JUMP)
+        self._patch_jump(then_jump)
+        self._emit(OpCode.POP)
+        if stmt.else_branch:
+            stmt.else_branch.accept(self)
+        self._patch_jump(else_jump)
+
+    def visit_print_stmt(self, stmt: ast.stmt.Print):
+        stmt.expression.accept(self)
+        self._emit(OpCode.PRINT)
+
+    def visit_return_stmt(self, stmt: ast.stmt.Return):
+        self._line = stmt.keyword.line
+        if stmt.value == None:
+            self._emit_return()
+        elif isinstance(stmt.value, ast.expr.Call):
+            self._call(stmt.value, True)
+            self._emit(OpCode.RETURN)
+        else:
+            stmt.value.accept(self)
+            self._emit(OpCode.RETURN)
+
+    def visit_var_stmt(self, stmt: ast.stmt.Var):
+        self._line = stmt.name.line
+        global_constant = self._declare_variable(stmt.name)
+        if stmt.initializer:
+            stmt.initializer.accept(self)
+        else:
+            self._emit(OpCode.NIL)
+        self._define_variable(global_constant)
+
+    def visit_while_stmt(self, stmt: ast.stmt.While):
+        loop_start = len(self._chunk().code)
+        stmt.condition.accept(self)
+
+        exit_jump = self._emit_jump(OpCode.JUMP_IF_FALSE)
+        self._emit(OpCode.POP)
+        stmt.body.accept(self)
+        self._emit_loop(loop_start)
+
+        self._patch_jump(exit_jump)
+        self._emit(OpCode.POP)
+
+    def visit_loop_stmt(self, stmt: ast.stmt.Loop):
+        stmt.original.accept(self)
+
+    ### expressions
+
+    def visit_assign_expr(self, expr: ast.expr.Assign):
+        expr.value.accept(self)
+        self._line = expr.name.line
+        self._named_variable(expr.name.lexeme, assign=True)
+
+    def visit_binary_expr(self, expr: ast.expr.Binary):
+        expr.left.accept(self)
+        expr.right.accept(self)
+        self._line = expr.operator.line
+
+        match expr.operator.type:
+            case TokenType.BANG_EQUAL:
+                self._emit(OpCode.EQUAL, OpCode.NOT)
+            case TokenType.EQUAL_EQUAL:
+                self._emit(OpCode.EQUAL)
+            case TokenType.GREATER:
+                self._emit(OpCode.GREATER)
+            case TokenType.GREATER_EQUAL:
+                # not LESS, NOT as in clox: NaN compares false both ways
+                self._emit(OpCode.GREATER_EQUAL)
+            case TokenType.LESS:
+                self._emit(OpCode.LESS)
+            case TokenType.LESS_EQUAL:
+                self._emit(OpCode.LESS_EQUAL)
+            case TokenType.PLUS:
+                self._emit(OpCode.ADD)
+            case TokenType.MINUS:
+                self._emit(OpCode.SUBTRACT)
+            case TokenType.STAR:
+                self._emit(OpCode.MULTIPLY)
+            case TokenType.SLASH:
+                self._emit(OpCode.DIVIDE)
+
+    def visit_call_expr(self, expr: ast.expr.Call):
+        self._call(expr, False)
+
+    def _call(self, expr: ast.expr.Call, tail: bool):
+        callee = expr.callee
+        # INVOKE and SUPER_INVOKE look the method up after the arguments
+        #   are on the stack; that's only the order the other engines
+        #   have when the arguments can't do or fail anything, so otherwise
+        #   the method is got first and then called. In a `return`, it's
+        #   always got first, for TAIL_CALL to reuse the frame with.
+        quiet = not tail and all(self._is_quiet(argument) for argument in expr.arguments)
+        if isinstance(callee, ast.expr.Get) and quiet:
+            callee.obj.accept(self)
+            for argument in expr.arguments:
+                argument.accept(self)
+            # the property lookup can fail on the name's line, the call
+            #   itself on the paren's; the VM reads each from its own unit
+            self._line = callee.name.line
+            self._emit(OpCode.INVOKE, self._make_constant(callee.name.lexeme))
+            self._line = expr.paren.line
+            self._emit(len(expr.arguments))
+            return
+
+        if isinstance(callee, ast.expr.Super) and quiet:
+            self._named_variable("this")
+            for argument in expr.arguments:
+                argument.accept(self)
+            self._named_variable("super")
+            self._line = callee.method.line
+            self._emit(OpCode.SUPER_INVOKE, self._make_constant(callee.method.lexeme))
+            self._line = expr.paren.line
+            self._emit(len(expr.arguments))
+            return
+
+        callee.accept(self)
+        for argument in expr.arguments:
+            argument.accept(self)
+        self._line = expr.paren.line
+        self._emit(OpCode.TAIL_CALL if tail else OpCode.CALL, len(expr.arguments))
+
+    def _is_quiet(self, expr: ast.expr.Expr) -> bool:
+        # whether evaluating it has no effects and can't fail
+        if isinstance(expr, ast.expr.Grouping):
+            return self._is_quiet(expr.expression)
+        if isinstance(expr, (ast.expr.Literal, ast.expr.This)):
+            return True
+        if isinstance(expr, ast.expr.Variable):
+            return self._resolve_local(self._current, expr.name.lexeme) != -1
+        return False
+
+    def visit_get_expr(self, expr: ast.expr.Get):
+        expr.obj.accept(self)
+        self._line = expr.name.line
+        self._emit(OpCode.GET_PROPERTY, self._make_constant(expr.name.lexeme))
+
+    def visit_grouping_expr(self, expr: ast.expr.Grouping):
+        expr.expression.accept(self)
+
+    def visit_literal_expr(self, expr: ast.expr.Literal):
+        if expr.value == None:
+            self._emit(OpCode.NIL)
+        elif expr.value is True:
+            self._emit(OpCode.TRUE)
+        elif expr.value is False:
+            self._emit(OpCode.FALSE)
+        else:
+            self._emit_constant(expr.value)
+
+    def visit_logical_expr(self, expr: ast.expr.Logical):
+        expr.left.accept(self)
+        if expr.operator.type == TokenType.AND:
+            end_jump = self._emit_jump(OpCode.JUMP_IF_FALSE)
+            self._emit(OpCode.POP)
+            expr.right.accept(self)
+            self._patch_jump(end_jump)
+        else:
+            else_jump = self._emit_jump(OpCode.JUMP_IF_FALSE)
+            end_jump = self._emit_jump(OpCode.JUMP)
+            self._patch_jump(else_jump)
+            self._emit(OpCode.POP)
+            expr.right.accept(self)
+            self._patch_jump(end_jump)
+
+    def visit_set_expr(self, expr: ast.expr.Set):
+        expr.obj.accept(self)
+        expr.value.accept(self)
+        self._line = expr.name.line
+        self._emit(OpCode.SET_PROPERTY, self._make_constant(expr.name.lexeme))
+
+    def visit_super_expr(self, expr: ast.expr.Super):
+        self._named_variable("this")
+        self._named_variable("super")
+        self._line = expr.method.line
+        self._emit(OpCode.GET_SUPER, self._make_constant(expr.method.lexeme))
+
+    def visit_this_expr(self, expr: ast.expr.This):
+        self._named_variable("this")
+
+    def visit_unary_expr(self, expr: ast.expr.Unary):
+        expr.right.accept(self)
+        self._line = expr.operator.line
+        if expr.operator.type == TokenType.MINUS:
+            self._emit(OpCode.NEGATE)
+        else:
+            self._emit(OpCode.NOT)
+
+    def visit_update_expr(self, expr: ast.expr.Update):
+        expr.target.accept(self)
+
+    def visit_variable_expr(self, expr: ast.expr.Variable):
+        self._line = expr.name.line
+        self._named_variable(expr.name.lexeme)
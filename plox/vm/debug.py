@@ -0,0 +1,95 @@
+from ..runtime import stringify
+from .chunk import Chunk, OpCode
+from .object import VMFunction
+
+# Human-readable listings of compiled chunks, in the same format as
+#   clox/dlox's debug module.
+
+SIMPLE = {
+    OpCode.NIL, OpCode.TRUE, OpCode.FALSE, OpCode.POP,
+    OpCode.EQUAL, OpCode.GREATER, OpCode.GREATER_EQUAL, OpCode.LESS, OpCode.LESS_EQUAL,
+    OpCode.ADD, OpCode.SUBTRACT, OpCode.MULTIPLY, OpCode.DIVIDE,
+    OpCode.NOT, OpCode.NEGATE, OpCode.PRINT,
+    OpCode.CLOSE_UPVALUE, OpCode.RETURN, OpCode.INHERIT,
+}
+BYTE = {
+    OpCode.GET_LOCAL, OpCode.SET_LOCAL,
+    OpCode.GET_UPVALUE, OpCode.SET_UPVALUE,
+    OpCode.CALL, OpCode.TAIL_CALL,
+}
+CONSTANT = {
+    OpCode.CONSTANT,
+    OpCode.GET_GLOBAL, OpCode.DEFINE_GLOBAL, OpCode.SET_GLOBAL,
+    OpCode.GET_PROPERTY, OpCode.SET_PROPERTY, OpCode.GET_SUPER,
+    OpCode.CLASS, OpCode.METHOD,
+}
+JUMP = {OpCode.JUMP: 1, OpCode.JUMP_IF_FALSE: 1, OpCode.LOOP: -1}
+INVOKE = {OpCode.INVOKE, OpCode.SUPER_INVOKE}
+
+def disassemble_function(function: VMFunction):
+    disassemble_chunk(function.chunk, str(function))
+    for constant in function.chunk.constants:
+        if type(constant) == VMFunction:
+            disassemble_function(constant)
+
+def disassemble_chunk(chunk: Chunk, name: str):
+    print(f"== {name} ==")
+    offset = 0
+    while offset < len(chunk.code):
+        offset = disassemble_instruction(chunk, offset)
+
+def _value(value: object) -> str:
+    if type(value) == str:
+        return value
+    return stringify(value)
+
+def disassemble_instruction(chunk: Chunk, offset: int) -> int:
+    line = f"{offset:04d} "
+    if offset > 0 and chunk.lines[offset] == chunk.lines[offset - 1]:
+        line += "   | "
+    else:
+        line += f"{chunk.lines[offset]:4d} "
+
+    instruction = OpCode(chunk.code[offset])
+    name = f"OP_{instruction.name}"
+
+    if instruction in SIMPLE:
+        print(f"{line}{name}")
+        return offset + 1
+
+    if instruction in BYTE:
+        print(f"{line}{name:<16} {chunk.code[offset + 1]:4d}")
+        return offset + 2
+
+    if instruction in CONSTANT:
+        constant = chunk.code[offset + 1]
+        print(f"{line}{name:<16} {constant:4d} '{_value(chunk.constants[constant])}'")
+        return offset + 2
+
+    if instruction in JUMP:
+        jump = (chunk.code[offset + 1] << 16) | chunk.code[offset + 2]
+        target = offset + 3 + JUMP[instruction] * jump
+        print(f"{line}{name:<16} {offset:4d} -> {target}")
+        return offset + 3
+
+    if instruction in INVOKE:
+        constant = chunk.code[offset + 1]
+        arg_count = chunk.code[offset + 2]
+        print(f"{line}{name:<16} ({arg_count} args) {constant:4d} '{_value(chunk.constants[constant])}'")
+        return offset + 3
+
+    if instruction == OpCode.CLOSURE:
+        constant = chunk.code[offset + 1]
+        function: VMFunction = chunk.constants[constant]
+        print(f"{line}{name:<16} {constant:4d} {function}")
+        offset += 2
+        for _ in range(function.upvalue_count):
+            is_local = chunk.code[offset]
+            index = chunk.code[offset + 1]
+            kind = "local" if is_local else "upvalue"
+            print(f"{offset:04d}    |                     {kind} {index}")
+            offset += 2
+        return offset
+
+    print(f"Unknown opcode {instruction}")
+    return offset + 1
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+from ..runtime import Memo
+from .chunk import Chunk
+
+class VMFunction:
+    def __init__(self, name: str|None) -> None:
+        self.arity = 0
+        self.upvalue_count = 0
+        self.chunk = Chunk()
+        self.name = name
+        # results cache for a function the purity pass marked (--memoize)
+        self.memo: Memo|None = None
+
+    def __str__(self) -> str:
+        if self.name == None:
+            return "<script>"
+        return f"<fn {self.name}>"
+
+class Upvalue:
+    # While open, `cells` is the VM stack itself and `index` the captured
+    #   slot; closing swaps in a private one-element list, so reads and
+    #   writes never need to know which state they're in.
+    __slots__ = ("cells", "index")
+
+    def __init__(self, cells: list[object], index: int) -> None:
+        self.cells = cells
+        self.index = index
+
+    def close(self):
+        self.cells = [self.cells[self.index]]
+        self.index = 0
+
+class Closure:
+    __slots__ = ("function", "upvalues")
+
+    def __init__(self, function: VMFunction) -> None:
+        self.function = function
+        self.upvalues: list[Upvalue] = []
+
+    def __str__(self) -> str:
+        return str(self.function)
+
+class VMClass:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.methods: dict[str,Closure] = {}
+
+    def __str__(self) -> str:
+        return self.name
+
+class Instance:
+    __slots__ = ("klass", "fields")
+
+    def __init__(self, klass: VMClass) -> None:
+        self.klass = klass
+        self.fields: dict[str,object] = {}
+
+    def __str__(self) -> str:
+        return f"{self.klass.name} instance"
+
+class BoundMethod:
+    __slots__ = ("receiver", "method")
+
+    def __init__(self, receiver: object, method: Closure) -> None:
+        self.receiver = receiver
+        self.method = method
+
+    def __str__(self) -> str:
+        return str(self.method.function)
@@ -0,0 +1,551 @@
+from __future__ import annotations
+
+from ..lox import Lox, LoxRuntimeError
+from .. import ast
+from ..token import Token, TokenType
+from ..callable import Callable
+from ..environment import VariableKind
+from ..runtime import ClockFunction, MISSING, Memo, Output, memo_key, store_results, stringify, is_equal
+from .chunk import OpCode
+from .object import VMFunction, Upvalue, Closure, VMClass, Instance, BoundMethod
+from .compiler import Compiler
+from .debug import disassemble_function
+
+# Stack-based bytecode backend, modeled on clox/dlox. Programs are still
+#   scanned, parsed, and resolved by the shared front end (so static errors
+#   are reported identically), then compiled to a Chunk per function and run
+#   by the dispatch loop in `_run`.
+
+class CallFrame:
+    __slots__ = ("closure", "ip", "base", "memos")
+
+    def __init__(self, closure: Closure, base: int) -> None:
+        self.closure = closure
+        self.ip = 0
+        self.base = base
+        # the (Memo, key) pairs the result goes into on return: the
+        #   function's own, and those of memoized functions tail-called in
+        #   this frame since
+        self.memos: list[tuple[Memo,tuple]]|None = None
+
+class VM:
+    def __init__(self, output: Output|None = None) -> None:
+        self.disassemble = False
+        self.output = Output() if output == None else output
+        self._globals: dict[str,object] = {"clock": ClockFunction()}
+        self._stack: list[object] = []
+        self._frames: list[CallFrame] = []
+        self._open_upvalues: dict[int,Upvalue] = {}
+        self._frames_max = Lox.max_depth
+
+    # variables are resolved by the bytecode compiler itself
+    def resolve(self, expr: object, kind: VariableKind, index: int):
+        pass
+
+    def resolve_global(self, expr: object, name: str):
+        pass
+
+    def declare(self, key: object, slot: int, captured: bool):
+        pass
+
+    def resolve_function(self, declaration: ast.stmt.Function|None, frame_size: int, upvalues: list[tuple[bool,int]], boxed: list[int], nesting: int):
+        pass
+
+    def interpret(self, statements: list[ast.stmt.Stmt]):
+        function = Compiler().compile(statements)
+        if function == None:
+            return
+        if self.disassemble:
+            disassemble_function(function)
+
+        closure = Closure(function)
+        self._stack = [closure]
+        self._frames = [CallFrame(closure, 0)]
+        self._open_upvalues = {}
+        self._frames_max = Lox.max_depth
+        try:
+            self._run()
+        except LoxRuntimeError as lre:
+            self.output.flush()
+            Lox.runtime_error(lre)
+        finally:
+            self.output.flush()
+
+    def _error(self, line: int, message: str) -> LoxRuntimeError:
+        return LoxRuntimeError(Token(TokenType.IDENTIFIER, "", None, line), message)
+
+    def _call(self, closure: Closure, arg_count: int, line: int) -> CallFrame:
+        if arg_count != closure.function.arity:
+            raise self._error(line, f"Expected {closure.function.arity} arguments but got {arg_count}.")
+        if len(self._frames) >= self._frames_max:
+            raise self._error(line, "Stack overflow.")
+        frame = CallFrame(closure, len(self._stack) - arg_count - 1)
+        self._frames.append(frame)
+        return frame
+
+    def _call_memoized(self, closure: Closure, arg_count: int, line: int) -> CallFrame|None:
+        stack = self._stack
+        key = None
+        if arg_count == closure.function.arity:
+            key = memo_key(stack[len(stack) - arg_count:])
+        if key != None:
+            result = closure.function.memo.get(key)
+            if result is not MISSING:
+                del stack[len(stack) - arg_count - 1:]
+                stack.append(result)
+                return None
+        frame = self._call(closure, arg_count, line)
+        if key != None:
+            frame.memos = [(closure.function.memo, key)]
+        return frame
+
+    def _tail_call(self, frame: CallFrame, arg_count: int, line: int) -> bool:
+        # `return f(...)` to a Lox function or method replaces the returning
+        #   function in its own frame, so a chain of tail calls runs in
+        #   constant stack; anything else (a class, a native, a result
+        #   already memoized) is left to an ordinary call, whose result the
+        #   RETURN after it hands back
+        stack = self._stack
+        callee = stack[-arg_count - 1]
+        if type(callee) == Closure:
+            closure = callee
+        elif type(callee) == BoundMethod:
+            closure = callee.method
+            callee = callee.receiver
+        else:
+            return False
+        function = closure.function
+        if arg_count != function.arity:
+            raise self._error(line, f"Expected {function.arity} arguments but got {arg_count}.")
+        arguments = stack[len(stack) - arg_count:]
+        if function.memo != None:
+            key = memo_key(arguments)
+            if key != None:
+                if function.memo.get(key) is not MISSING:
+                    return False
+                if frame.memos == None:
+                    frame.memos = []
+                frame.memos.append((function.memo, key))
+
+        base = frame.base
+        if self._open_upvalues:
+            self._close_upvalues(base)
+        del stack[base:]
+        stack.append(callee)
+        stack.extend(arguments)
+        frame.closure = closure
+        return True
+
+    def _call_value(self, callee: object, arg_count: int, line: int) -> CallFrame|None:
+        # returns the new frame for Lox calls, None if the call already
+        #   completed (natives) and its result is on the stack
+        stack = self._stack
+        callee_type = type(callee)
+        if callee_type == Closure:
+            if callee.function.memo != None:
+                return self._call_memoized(callee, arg_count, line)
+            return self._call(callee, arg_count, line)
+        if callee_type == BoundMethod:
+            stack[-arg_count - 1] = callee.receiver
+            return self._call(callee.method, arg_count, line)
+        if callee_type == VMClass:
+            stack[-arg_count - 1] = Instance(callee)
+            initializer = callee.methods.get("init")
+            if initializer != None:
+                return self._call(initializer, arg_count, line)
+            if arg_count != 0:
+                raise self._error(line, f"Expected 0 arguments but got {arg_count}.")
+            return None
+        if isinstance(callee, Callable):
+            if arg_count != callee.arity():
+                raise self._error(line, f"Expected {callee.arity()} arguments but got {arg_count}.")
+            arguments = stack[len(stack) - arg_count:]
+            result = callee.call(None, arguments)
+            del stack[len(stack) - arg_count - 1:]
+            stack.append(result)
+            return None
+        raise self._error(line, "Can only call functions and classes.")
+
+    def _bind_method(self, klass: VMClass, receiver: Instance, name: str, line: int) -> BoundMethod:
+        method = klass.methods.get(name)
+        if method == None:
+            raise self._error(line, f"Undefined property '{name}'.")
+        return BoundMethod(receiver, method)
+
+    def _capture_upvalue(self, index: int) -> Upvalue:
+        upvalue = self._open_upvalues.get(index)
+        if upvalue == None:
+            upvalue = Upvalue(self._stack, index)
+            self._open_upvalues[index] = upvalue
+        return upvalue
+
+    def _close_upvalues(self, last: int):
+        open_upvalues = self._open_upvalues
+        for index in [i for i in open_upvalues if i >= last]:
+            open_upvalues.pop(index).close()
+
+    def _run(self):
+        # opcodes as plain ints so each comparison in the dispatch chain
+        #   is a fast int compare instead of an enum lookup
+        OP_CONSTANT = OpCode.CONSTANT.value
+        OP_NIL = OpCode.NIL.value
+        OP_TRUE = OpCode.TRUE.value
+        OP_FALSE = OpCode.FALSE.value
+        OP_POP = OpCode.POP.value
+        OP_GET_LOCAL = OpCode.GET_LOCAL.value
+        OP_SET_LOCAL = OpCode.SET_LOCAL.value
+        OP_GET_GLOBAL = OpCode.GET_GLOBAL.value
+        OP_DEFINE_GLOBAL = OpCode.DEFINE_GLOBAL.value
+        OP_SET_GLOBAL = OpCode.SET_GLOBAL.value
+        OP_GET_UPVALUE = OpCode.GET_UPVALUE.value
+        OP_SET_UPVALUE = OpCode.SET_UPVALUE.value
+        OP_GET_PROPERTY = OpCode.GET_PROPERTY.value
+        OP_SET_PROPERTY = OpCode.SET_PROPERTY.value
+        OP_GET_SUPER = OpCode.GET_SUPER.value
+        OP_EQUAL = OpCode.EQUAL.value
+        OP_GREATER = OpCode.GREATER.value
+        OP_GREATER_EQUAL = OpCode.GREATER_EQUAL.value
+        OP_LESS = OpCode.LESS.value
+        OP_LESS_EQUAL = OpCode.LESS_EQUAL.value
+        OP_ADD = OpCode.ADD.value
+        OP_SUBTRACT = OpCode.SUBTRACT.value
+        OP_MULTIPLY = OpCode.MULTIPLY.value
+        OP_DIVIDE = OpCode.DIVIDE.value
+        OP_NOT = OpCode.NOT.value
+        OP_NEGATE = OpCode.NEGATE.value
+        OP_PRINT = OpCode.PRINT.value
+        OP_JUMP = OpCode.JUMP.value
+        OP_JUMP_IF_FALSE = OpCode.JUMP_IF_FALSE.value
+        OP_LOOP = OpCode.LOOP.value
+        OP_CALL = OpCode.CALL.value
+        OP_TAIL_CALL = OpCode.TAIL_CALL.value
+        OP_INVOKE = OpCode.INVOKE.value
+        OP_SUPER_INVOKE = OpCode.SUPER_INVOKE.value
+        OP_CLOSURE = OpCode.CLOSURE.value
+        OP_CLOSE_UPVALUE = OpCode.CLOSE_UPVALUE.value
+        OP_RETURN = OpCode.RETURN.value
+        OP_CLASS = OpCode.CLASS.value
+        OP_INHERIT = OpCode.INHERIT.value
+        OP_METHOD = OpCode.METHOD.value
+
+        stack = self._stack
+        push = stack.append
+        pop = stack.pop
+        frames = self._frames
+        globals_ = self._globals
+        write = self.output.print
+
+        frame = frames[-1]
+        code = frame.closure.function.chunk.code
+        constants = frame.closure.function.chunk.constants
+        lines = frame.closure.function.chunk.lines
+        ip = frame.ip
+        base = frame.base
+
+        while True:
+            instruction = code[ip]
+            ip += 1
+
+            if instruction == OP_GET_LOCAL:
+                push(stack[base + code[ip]])
+                ip += 1
+
+            elif instruction == OP_CONSTANT:
+                push(constants[code[ip]])
+                ip += 1
+
+            elif instruction == OP_POP:
+                pop()
+
+            elif instruction == OP_JUMP_IF_FALSE:
+                condition = stack[-1]
+                if condition == None or condition is False:
+                    ip += (code[ip] << 16) | code[ip + 1]
+                ip += 2
+
+            elif instruction == OP_LESS:
+                b = pop()
+                a = stack[-1]
+                if type(a) != float or type(b) != float:
+                    raise self._error(lines[ip - 1], "Operands must be numbers.")
+                stack[-1] = a < b
+
+            elif instruction == OP_ADD:
+                b = pop()
+                a = stack[-1]
+                if type(a) == float and type(b) == float:
+                    stack[-1] = a + b
+                elif type(a) == str and type(b) == str:
+                    stack[-1] = a + b
+                else:
+                    raise self._error(lines[ip - 1], "Operands must be two numbers or two strings.")
+
+            elif instruction == OP_SUBTRACT:
+                b = pop()
+                a = stack[-1]
+                if type(a) != float or type(b) != float:
+                    raise self._error(lines[ip - 1], "Operands must be numbers.")
+                stack[-1] = a - b
+
+            elif instruction == OP_GET_GLOBAL:
+                name = constants[code[ip]]
+                ip += 1
+                try:
+                    push(globals_[name])
+                except KeyError:
+                    raise self._error(lines[ip - 1], f"Undefined variable '{name}'.")
+
+            elif instruction == OP_SET_LOCAL:
+                stack[base + code[ip]] = stack[-1]
+                ip += 1
+
+            elif instruction == OP_LOOP:
+                ip -= (code[ip] << 16) | code[ip + 1]
+                ip += 2
+
+            elif instruction == OP_JUMP:
+                ip += ((code[ip] << 16) | code[ip + 1]) + 2
+
+            elif instruction == OP_GET_UPVALUE:
+                upvalue = frame.closure.upvalues[code[ip]]
+                push(upvalue.cells[upvalue.index])
+                ip += 1
+
+            elif instruction == OP_SET_UPVALUE:
+                upvalue = frame.closure.upvalues[code[ip]]
+                upvalue.cells[upvalue.index] = stack[-1]
+                ip += 1
+
+            elif instruction == OP_CALL:
+                arg_count = code[ip]
+                ip += 1
+                frame.ip = ip
+                new_frame = self._call_value(stack[-arg_count - 1], arg_count, lines[ip - 1])
+                if new_frame != None:
+                    frame = new_frame
+                    chunk = frame.closure.function.chunk
+                    code = chunk.code
+                    constants = chunk.constants
+                    lines = chunk.lines
+                    ip = 0
+                    base = frame.base
+
+            elif instruction == OP_TAIL_CALL:
+                arg_count = code[ip]
+                ip += 1
+                frame.ip = ip
+                if self._tail_call(frame, arg_count, lines[ip - 1]):
+                    new_frame = frame
+                else:
+                    new_frame = self._call_value(stack[-arg_count - 1], arg_count, lines[ip - 1])
+                if new_frame != None:
+                    frame = new_frame
+                    chunk = frame.closure.function.chunk
+                    code = chunk.code
+                    constants = chunk.constants
+                    lines = chunk.lines
+                    ip = 0
+                    base = frame.base
+
+            elif instruction == OP_RETURN:
+                result = pop()
+                if frame.memos != None:
+                    store_results(frame.memos, result)
+                if self._open_upvalues:
+                    self._close_upvalues(base)
+                frames.pop()
+                if len(frames) == 0:
+                    pop()
+                    return
+                del stack[base:]
+                push(result)
+                frame = frames[-1]
+                chunk = frame.closure.function.chunk
+                code = chunk.code
+                constants = chunk.constants
+                lines = chunk.lines
+                ip = frame.ip
+                base = frame.base
+
+            elif instruction == OP_GREATER:
+                b = pop()
+                a = stack[-1]
+                if type(a) != float or type(b) != float:
+                    raise self._error(lines[ip - 1], "Operands must be numbers.")
+                stack[-1] = a > b
+
+            elif instruction == OP_LESS_EQUAL:
+                b = pop()
+                a = stack[-1]
+                if type(a) != float or type(b) != float:
+                    raise self._error(lines[ip - 1], "Operands must be numbers.")
+                stack[-1] = a <= b
+
+            elif instruction == OP_GREATER_EQUAL:
+                b = pop()
+                a = stack[-1]
+                if type(a) != float or type(b) != float:
+                    raise self._error(lines[ip - 1], "Operands must be numbers.")
+                stack[-1] = a >= b
+
+            elif instruction == OP_EQUAL:
+                b = pop()
+                stack[-1] = is_equal(stack[-1], b)
+
+            elif instruction == OP_NOT:
+                value = stack[-1]
+                stack[-1] = value == None or value is False
+
+            elif instruction == OP_MULTIPLY:
+                b = pop()
+                a = stack[-1]
+                if type(a) != float or type(b) != float:
+                    raise self._error(lines[ip - 1], "Operands must be numbers.")
+                stack[-1] = a * b
+
+            elif instruction == OP_DIVIDE:
+                b = pop()
+                a = stack[-1]
+                if type(a) != float or type(b) != float:
+                    raise self._error(lines[ip - 1], "Operands must be numbers.")
+                if b == 0.0:
+                    raise self._error(lines[ip - 1], "Cannot divide by zero.")
+                stack[-1] = a / b
+
+            elif instruction == OP_NEGATE:
+                value = stack[-1]
+                if type(value) != float:
+                    raise self._error(lines[ip - 1], "Operand must be a number.")
+                stack[-1] = -value
+
+            elif instruction == OP_INVOKE:
+                name = constants[code[ip]]
+                arg_count = code[ip + 1]
+                ip += 2
+                frame.ip = ip
+                receiver = stack[-arg_count - 1]
+                if type(receiver) != Instance:
+                    raise self._error(lines[ip - 2], "Only instances have properties.")
+                fields = receiver.fields
+                if name in fields:
+                    value = fields[name]
+                    stack[-arg_count - 1] = value
+                    new_frame = self._call_value(value, arg_count, lines[ip - 1])
+                else:
+                    method = receiver.klass.methods.get(name)
+                    if method == None:
+                        raise self._error(lines[ip - 2], f"Undefined property '{name}'.")
+                    new_frame = self._call(method, arg_count, lines[ip - 1])
+                if new_frame != None:
+                    frame = new_frame
+                    chunk = frame.closure.function.chunk
+                    code = chunk.code
+                    constants = chunk.constants
+                    lines = chunk.lines
+                    ip = 0
+                    base = frame.base
+
+            elif instruction == OP_GET_PROPERTY:
+                name = constants[code[ip]]
+                ip += 1
+                instance = stack[-1]
+                if type(instance) != Instance:
+                    raise self._error(lines[ip - 1], "Only instances have properties.")
+                fields = instance.fields
+                if name in fields:
+                    stack[-1] = fields[name]
+                else:
+                    stack[-1] = self._bind_method(instance.klass, instance, name, lines[ip - 1])
+
+            elif instruction == OP_SET_PROPERTY:
+                name = constants[code[ip]]
+                ip += 1
+                instance = stack[-2]
+                if type(instance) != Instance:
+                    raise self._error(lines[ip - 1], "Only instances have fields.")
+                value = pop()
+                instance.fields[name] = value
+                stack[-1] = value
+
+            elif instruction == OP_NIL:
+                push(None)
+
+            elif instruction == OP_TRUE:
+                push(True)
+
+            elif instruction == OP_FALSE:
+                push(False)
+
+            elif instruction == OP_PRINT:
+                write(stringify(pop()))
+
+            elif instruction == OP_DEFINE_GLOBAL:
+                globals_[constants[code[ip]]] = pop()
+                ip += 1
+
+            elif instruction == OP_SET_GLOBAL:
+                name = constants[code[ip]]
+                ip += 1
+                if name not in globals_:
+                    raise self._error(lines[ip - 1], f"Undefined variable '{name}'.")
+                globals_[name] = stack[-1]
+
+            elif instruction == OP_CLOSURE:
+                function: VMFunction = constants[code[ip]]
+                ip += 1
+                closure = Closure(function)
+                for _ in range(function.upvalue_count):
+                    is_local = code[ip]
+                    index = code[ip + 1]
+                    ip += 2
+                    if is_local:
+                        closure.upvalues.append(self._capture_upvalue(base + index))
+                    else:
+                        closure.upvalues.append(frame.closure.upvalues[index])
+                push(closure)
+
+            elif instruction == OP_CLOSE_UPVALUE:
+                self._close_upvalues(len(stack) - 1)
+                pop()
+
+            elif instruction == OP_SUPER_INVOKE:
+                name = constants[code[ip]]
+                arg_count = code[ip + 1]
+                ip += 2
+                frame.ip = ip
+                superclass: VMClass = pop()
+                method = superclass.methods.get(name)
+                if method == None:
+                    raise self._error(lines[ip - 2], f"Undefined property '{name}'.")
+                frame = self._call(method, arg_count, lines[ip - 1])
+                chunk = frame.closure.function.chunk
+                code = chunk.code
+                constants = chunk.constants
+                lines = chunk.lines
+                ip = 0
+                base = frame.base
+
+            elif instruction == OP_GET_SUPER:
+                name = constants[code[ip]]
+                ip += 1
+                superclass = pop()
+                stack[-1] = self._bind_method(superclass, stack[-1], name, lines[ip - 1])
+
+            elif instruction == OP_CLASS:
+                push(VMClass(constants[code[ip]]))
+                ip += 1
+
+            elif instruction == OP_INHERIT:
+                superclass = stack[-2]
+                if type(superclass) != VMClass:
+                    raise self._error(lines[ip - 1], "Superclass must be a class.")
+                subclass: VMClass = pop()
+                subclass.methods.update(superclass.methods)
+
+            elif instruction == OP_METHOD:
+                method = pop()
+                stack[-1].methods[constants[code[ip]]] = method
+                ip += 1
+
+            else:
+                raise RuntimeError(f"Unknown opcode {instruction}.")
@@ -0,0 +1,195 @@
+import sys
+import os
+import re
+import glob
+import json
+import tempfile
+import subprocess
+
+# plox's own tests, for what the book's suite doesn't reach: the limits
+#   and flags of the extra engines. Each test/plox/*.lox script is run on
+#   every engine and checked against its comments, in the book's format:
+#   `// expect: output` for each printed line, `// expect runtime error:
+#   message` for a runtime error (exit 70), `// args: --flag ...` for
+#   command-line flags to run it with, and `// engines: name ...` for a
+#   test of something only some engines do.
+
+ROOT_PATH = os.path.realpath(os.path.join(os.path.dirname(__file__), ".."))
+TEST_PATH = os.path.join(ROOT_PATH, "test", "plox")
+ENGINES = ["tree", "closure", "py", "vm"]
+
+EXPECT = re.compile(r"// expect: ?(.*)")
+EXPECT_RUNTIME_ERROR = re.compile(r"// expect runtime error: (.+)")
+ARGS = re.compile(r"// args: (.+)")
+ENGINES_ONLY = re.compile(r"// engines: (.+)")
+
+env = os.environ.copy()
+env["PYTHONPATH"] = ROOT_PATH
+
+def expectations(path: str) -> tuple[list[str],str|None,list[str],list[str]]:
+    output = []
+    runtime_error = None
+    args = []
+    engines = ENGINES
+    with open(path, "r") as test_file:
+        for line in test_file:
+            if match := EXPECT.search(line):
+                output.append(match.group(1))
+            elif match := EXPECT_RUNTIME_ERROR.search(line):
+                runtime_error = match.group(1)
+            elif match := ARGS.search(line):
+                args += match.group(1).split()
+            elif match := ENGINES_ONLY.search(line):
+                engines = match.group(1).split()
+    return output, runtime_error, args, engines
+
+def run_script(path: str, engine: str) -> list[str]:
+    # the failures, if any
+    output, runtime_error, args, _ = expectations(path)
+    result = subprocess.run(
+        [sys.executable, "-m", "plox", f"--engine={engine}", *args, path],
+        env=env, capture_output=True, text=True,
+    )
+    failures = []
+    if result.stdout.splitlines() != output:
+        failures.append(f"expected output {output}, got {result.stdout.splitlines()}")
+    expected_exit = 0 if runtime_error == None else 70
+    if result.returncode != expected_exit:
+        failures.append(f"expected exit code {expected_exit}, got {result.returncode}")
+    if runtime_error != None and result.stderr.splitlines()[:1] != [runtime_error]:
+        failures.append(f"expected runtime error '{runtime_error}', got '{result.stderr.strip()}'")
+    return failures
+
+def run_batch(engine: str) -> list[str]:
+    # --batch on one worker, with a script that crashes the parser (nesting
+    #   too deep for Python's stack) and one with a compile error among
+    #   good ones: each gets its own result, and none affects the next
+    scripts = [
+        ("ok", 'print "ok";', 0),
+        ("crash", "print " + "(" * 100000 + "1" + ")" * 100000 + ";", 70),
+        ("after_crash", 'print "ok";', 0),
+        ("compile_error", "print;", 65),
+        ("after_error", 'print "ok";', 0),
+    ]
+    with tempfile.TemporaryDirectory() as directory:
+        paths = []
+        for name, source, _ in scripts:
+            paths.append(os.path.join(directory, f"{name}.lox"))
+            with open(paths[-1], "w") as script_file:
+                script_file.write(source)
+        result = subprocess.run(
+            [sys.executable, "-m", "plox", f"--engine={engine}", "--batch", "--jobs=1", *paths],
+            env=env, capture_output=True, text=True,
+        )
+    if result.returncode != 70:
+        return [f"expected exit code 70, got {result.returncode}: {result.stderr.strip()}"]
+    results = [json.loads(line) for line in result.stdout.splitlines()]
+    if len(results) != len(scripts):
+        return [f"expected {len(scripts)} results, got {len(results)}"]
+    failures = []
+    for (name, _, exit_code), script_result in zip(scripts, results):
+        if script_result["exit_code"] != exit_code:
+            failures.append(f"{name}: expected exit code {exit_code}, got {script_result['exit_code']}")
+        if exit_code == 0 and script_result["stdout"] != "ok\n":
+            failures.append(f"{name}: expected output 'ok', got '{script_result['stdout']}'")
+    return failures
+
+def run_cache(engine: str) -> list[str]:
+    # --cache=dir: a private directory gets a `.loxc` that the second run
+    #   loads, and one anyone can write to isn't used at all
+    failures = []
+    with tempfile.TemporaryDirectory() as directory:
+        script = os.path.join(directory, "script.lox")
+        with open(script, "w") as script_file:
+            script_file.write('var a = "ok"; print a;')
+        private = os.path.join(directory, "private")
+        shared = os.path.join(directory, "shared")
+        os.mkdir(shared)
+        os.chmod(shared, 0o777)
+        for cache in [private, private, shared]:
+            result = subprocess.run(
+                [sys.executable, "-m", "plox", f"--engine={engine}", f"--cache={cache}", script],
+                env=env, capture_output=True, text=True,
+            )
+            if result.stdout != "ok\n" or result.returncode != 0:
+                failures.append(f"expected output 'ok', got '{result.stdout}' and '{result.stderr.strip()}'")
+        if len(glob.glob(os.path.join(private, "*.loxc"))) != 1:
+            failures.append("expected a .loxc in the private cache directory")
+        if len(os.listdir(shared)) != 0:
+            failures.append("expected nothing in the shared cache directory")
+    return failures
+
+def run_prompt(engine: str) -> list[str]:
+    # at the prompt each line is a program of its own, run on the same
+    #   engine; what one line defines has to keep working in the next
+    lines = [
+        "class C { init() { this.v = 3; } }",
+        "print C().v;",
+        "fun f() { return C().v + 1; }",
+        "print f();",
+    ]
+    result = subprocess.run(
+        [sys.executable, "-m", "plox", f"--engine={engine}"],
+        input="\n".join(lines) + "\n", env=env, capture_output=True, text=True,
+    )
+    output = [line for line in result.stdout.replace("> ", "").splitlines() if line != ""]
+    if output != ["3", "4"]:
+        return [f"expected output ['3', '4'], got {output} {result.stderr.strip()}"]
+    return []
+
+# one compiled program run by two tree-walkers in turn, the way the
+#   cache replays one into whatever engine loads it: the loop gets hot and
+#   compiled in each, and each compiled version has to be its own, and go
+#   once the program does
+SHARED_PROGRAM = """
+import io
+import gc
+from plox.lox import Lox
+from plox.frontend import _compile
+from plox.interpreter import Interpreter
+from plox.runtime import Output
+from plox import cache
+
+recorder = cache.Recorder()
+statements, _ = _compile("var t = 0; for (var i = 0; i < 1000; i = i + 1) t = t + i; print t;", recorder)
+for _ in range(2):
+    output = io.StringIO()
+    Lox.interpreter = Interpreter(Output(output))
+    cache.replay(recorder.calls, Lox.interpreter)
+    Lox.interpreter.interpret(statements)
+    print(output.getvalue().strip())
+del statements, recorder
+gc.collect()
+print(len(Lox.interpreter._traces))
+"""
+
+def run_shared_program() -> list[str]:
+    result = subprocess.run([sys.executable, "-c", SHARED_PROGRAM], env=env, capture_output=True, text=True)
+    if result.stdout.splitlines() != ["499500", "499500", "0"]:
+        return [f"expected output ['499500', '499500', '0'], got {result.stdout.splitlines()} {result.stderr.strip()}"]
+    return []
+
+failed = 0
+passed = 0
+def report(name: str, engine: str, failures: list[str]):
+    global failed, passed
+    if len(failures) > 0:
+        failed += 1
+        print(f"FAIL {name} (--engine={engine})")
+        for failure in failures:
+            print(f"     {failure}")
+    else:
+        passed += 1
+
+for path in sorted(glob.glob(os.path.join(TEST_PATH, "*.lox"))):
+    name = os.path.relpath(path, ROOT_PATH)
+    for engine in expectations(path)[3]:
+        report(name, engine, run_script(path, engine))
+for engine in ENGINES:
+    report("--batch", engine, run_batch(engine))
+    report("--cache", engine, run_cache(engine))
+    report("prompt", engine, run_prompt(engine))
+report("shared program", "tree", run_shared_program())
+
+print(f"{passed} passed, {failed} failed")
+sys.exit(1 if failed > 0 else 0)
@@ -36,6 +36,11 @@ print("Installing testing dependencies...")
 result = subprocess.run(["make", "get"], stdout=open(os.devnull, 'wb'))
 
 
+print("Running plox's own tests...")
+res = subprocess.run([sys.executable, os.path.join(ROOT_PATH, "test", "run_plox_tests.py")])
+if (res.returncode != 0):
+    sys.exit(res.returncode)
+
 env = os.environ.copy()
 tester = RELATIVE_JLOX_PATH
 env["PYTHONPATH"] = ROOT_PATH
@@ -48,6 +53,18 @@ jlox_end = time.time()
 if (res.returncode != 0):
     sys.exit(res.returncode)
 
+for engine, description in [
+    ("closure", "Python closure-compiling interpreter"),
+    ("py", "Lox-to-Python transpiler"),
+    ("vm", "bytecode VM"),
+]:
+    env = os.environ.copy()
+    env["PYTHONPATH"] = ROOT_PATH
+    print(f"Running jlox test suite with {description}...")
+    res = subprocess.run(["dart", "./tool/bin/test.dart", "jlox", "--interpreter", RELATIVE_JLOX_PATH, "--arguments", f"--engine={engine}"], env=env)
+    if (res.returncode != 0):
+        sys.exit(res.returncode)
+
 env = os.environ.copy()
 tester = RELATIVE_CLOX_PATH
 tester_name = "clox"